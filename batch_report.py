@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from engine.data import PROFILE_SUFFIXES
+from engine.interventions import INTERVENTIONS
+from engine.lookup import load_lookup_table
+from engine.report import build_report, render_index, write_json
+from engine.scoring import parse_mask
+
+# Writes a fairness report for every profile file of a directory, without starting the app:
+#   python batch_report.py cantons/ --out reports/ --masks encounters+convictions all --workers 4
+
+
+def _progress(done, total, report, started):
+    stages = " · ".join(f"{stage} {seconds:.2f}s" for stage, seconds in report["timings"].items())
+    print(f"[{done}/{total}] {report['dataset']} ({report['profiles']} profiles): {stages} "
+          f"- {time.perf_counter() - started:.1f}s elapsed", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write HTML/JSON fairness reports for a directory of profile files.")
+    parser.add_argument("profiles", help=f"directory of profile files ({', '.join(PROFILE_SUFFIXES)})")
+    parser.add_argument("--out", default="reports", help="directory the reports are written to")
+    parser.add_argument("--masks", nargs="+", default=["all"],
+                        help="toggle masks: numbers, feature names joined with '+' (e.g. encounters+convictions) or 'all'")
+    parser.add_argument("--model", help="scoring table exported with 'python -m engine.lookup' (default: the rules of the app)")
+    parser.add_argument("--intervention", choices=INTERVENTIONS, default="none",
+                        help="mitigation applied on top of the scoring rules")
+    parser.add_argument("--formats", nargs="+", choices=("html", "json"), default=["html", "json"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    files = sorted(path for path in Path(args.profiles).iterdir() if path.suffix.lower() in PROFILE_SUFFIXES)
+    if not files:
+        parser.error(f"no profile files in {args.profiles}")
+    # Reports are named after the file without its suffix, so zh.csv and zh.parquet would overwrite each other's
+    stems = Counter(path.stem for path in files)
+    clashes = [path.name for path in files if stems[path.stem] > 1]
+    if clashes:
+        parser.error(f"files with the same name would write the same report, rename them: {', '.join(clashes)}")
+    try:
+        masks = [parse_mask(text) for text in args.masks]
+    except ValueError as error:
+        parser.error(str(error))
+    table = load_lookup_table(args.model) if args.model else None
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    reports = []
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(files))) as pool:
+            futures = [pool.submit(build_report, path, out_dir, masks, args.intervention, args.formats, table) for path in files]
+            for done, future in enumerate(as_completed(futures), 1):
+                reports.append(future.result())
+                _progress(done, len(files), reports[-1], started)
+    else:
+        for done, path in enumerate(files, 1):
+            reports.append(build_report(path, out_dir, masks, args.intervention, args.formats, table))
+            _progress(done, len(files), reports[-1], started)
+
+    reports.sort(key=lambda report: report["dataset"])
+    if "json" in args.formats:
+        write_json([{key: report[key] for key in ("dataset", "profiles", "intervention", "scoring_table", "masks", "timings")} for report in reports],
+                   out_dir / "summary.json")
+    if "html" in args.formats:
+        (out_dir / "index.html").write_text(render_index(reports, args.formats), encoding="utf-8")
+
+    totals = {}
+    for report in reports:
+        for stage, seconds in report["timings"].items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+    print(f"{len(reports)} reports written to {out_dir} in {time.perf_counter() - started:.1f}s "
+          f"({', '.join(f'{stage} {seconds:.1f}s' for stage, seconds in totals.items())} across workers)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
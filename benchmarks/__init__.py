@@ -0,0 +1 @@
+# Performance suites run by hand, e.g. python -m benchmarks.rerun_latency
@@ -0,0 +1 @@
+# Shared scoring and analysis code used by the pages, independent of the display language
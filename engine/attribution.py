@@ -0,0 +1,51 @@
+from functools import lru_cache
+from math import factorial
+
+import numpy as np
+
+from engine.cache import cached_cell_counts, cached_cells
+from engine.lookup import compiled_table
+from engine.scoring import FEATURES, NBR_MASKS
+
+
+# Matrix turning the coalition scores into exact Shapley values: for each feature i of the mask and each
+# coalition S of the other enabled features, weight |S|! (n - |S| - 1)! / n! on v(S + i) - v(S)
+@lru_cache(maxsize=NBR_MASKS)
+def shapley_weights(mask):
+    players = [i for i in range(len(FEATURES)) if mask & (1 << i)]
+    n = len(players)
+    weights = np.zeros((NBR_MASKS, len(FEATURES)), dtype=np.float32)
+    for i in players:
+        others = mask & ~(1 << i)
+        subset = others
+        while True:
+            size = bin(subset).count("1")
+            weight = factorial(size) * factorial(n - size - 1) / factorial(n)
+            weights[subset | (1 << i), i] += weight
+            weights[subset, i] -= weight
+            if subset == 0:
+                break
+            subset = (subset - 1) & others
+    weights.flags.writeable = False
+    return weights
+
+
+# Contribution of each feature to the score of every lookup table cell (cells x FEATURES). All profiles of a cell
+# get the same score with every toggle mask, so the coalition scores are the 64 x 144 scores of the table.
+@lru_cache(maxsize=NBR_MASKS)
+def cell_shapley_values(mask):
+    values = compiled_table()["score"].T.astype(np.float32) @ shapley_weights(mask)
+    values.flags.writeable = False
+    return values
+
+
+# Contribution of each feature to the score of the first `nbr_profiles` profiles (profiles x FEATURES), summing
+# to the score
+def shapley_values(df, mask, nbr_profiles=None):
+    return cell_shapley_values(mask)[cached_cells(df)[:nbr_profiles]]
+
+
+# Average contribution of each feature over the whole population, from the cells weighted by their profiles
+def mean_shapley_values(df, mask):
+    counts, _ = cached_cell_counts(df)
+    return counts @ cell_shapley_values(mask) / max(counts.sum(), 1)
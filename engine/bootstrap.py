@@ -0,0 +1,71 @@
+import numpy as np
+
+from engine.cache import cached_cells, shared_cache
+from engine.fairness import disparity
+from engine.interventions import cached_intervention
+from engine.lookup import IS_OTHER_CELL
+from engine.scoring import HIGH, LOW, MEDIUM, label_flags
+
+# Bootstrap intervals of the counters and of the disparity: with 8 profiles, or a small uploaded cohort, a few
+# profiles more or less in a bucket change the numbers a lot
+RESAMPLES = 2000
+LEVEL = 0.95
+
+
+# Number of profiles with every code in `resamples` resamples (with replacement) of profiles counted per code:
+# (resamples, codes). The counts of a resample follow a multinomial distribution with the shares of the codes, so
+# they are drawn directly instead of resampling the profiles, in the same time for 8 profiles as for millions.
+def bootstrap_counts(counts, resamples=RESAMPLES, seed=0):
+    total = counts.sum()
+    rng = np.random.default_rng(seed)
+    return rng.multinomial(total, counts / max(total, 1), size=resamples)
+
+
+# Percentile interval of the finite values (resamples without any profile of a group have no rate for it)
+def percentile_interval(values, level=LEVEL):
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return np.nan, np.nan
+    low, high = np.percentile(values, [50 * (1 - level), 50 * (1 + level)])
+    return float(low), float(high)
+
+
+# Intervals of the number of profiles per bucket and of the gap and ratio of high-risk rates between non-Swiss and
+# Swiss profiles, from the number of profiles per group (Swiss first) and bucket: a (2, 3) array
+def bootstrap_intervals(counts, resamples=RESAMPLES, level=LEVEL, seed=0):
+    counts = bootstrap_counts(np.ravel(counts), resamples, seed).reshape(resamples, 2, 3)
+    per_bucket = counts.sum(axis=1)
+    per_group = counts.sum(axis=2)
+    rates = np.divide(counts[:, :, HIGH], per_group, out=np.full(per_group.shape, np.nan), where=per_group > 0)
+    gap, ratio = disparity(rates[:, 1], rates[:, 0])
+    return {
+        "low": percentile_interval(per_bucket[:, LOW], level),
+        "medium": percentile_interval(per_bucket[:, MEDIUM], level),
+        "high": percentile_interval(per_bucket[:, HIGH], level),
+        "high_risk_gap": percentile_interval(gap, level),
+        "high_risk_ratio": percentile_interval(ratio, level),
+    }
+
+
+def bootstrap_disparity(buckets, is_other, resamples=RESAMPLES, level=LEVEL, seed=0):
+    counts = np.bincount(is_other.astype(np.int64) * 3 + buckets, minlength=6).reshape(2, 3)
+    return bootstrap_intervals(counts, resamples, level, seed)
+
+
+# The intervals only depend on the counts, so they are cached by counts: populations, masks and mitigations with the
+# same counts share an entry of a few bytes
+def cached_intervals(counts):
+    return shared_cache().get(("bootstrap", tuple(np.ravel(counts).tolist())), lambda: bootstrap_intervals(counts))
+
+
+# Intervals of the first `nbr_profiles` profiles (the ones shown) and of the whole population, after the mitigation.
+# Group thresholds and reweighing can give profiles of the same lookup table cell different buckets, so the
+# population is counted per profile, with the groups of the cached cells.
+def cached_bootstrap(df, mask, intervention="none", nbr_profiles=8):
+    buckets = cached_intervention(df, mask, intervention).scored.bucket
+    population = np.bincount(IS_OTHER_CELL[cached_cells(df)].astype(np.int64) * 3 + buckets, minlength=6)
+    shown = np.bincount(label_flags(df["ethnicity"][:nbr_profiles], "Other") * 3 + buckets[:nbr_profiles], minlength=6)
+    return {
+        "shown": cached_intervals(shown.reshape(2, 3)),
+        "population": cached_intervals(population.reshape(2, 3)),
+    }
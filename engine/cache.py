@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from engine.lookup import NBR_CELLS, cell_index, compiled_table, lookup_scores, table_key
+from engine.scoring import profile_arrays
+
+# Memory budget of the shared cache, can be changed with the ALGODISC_CACHE_MB environment variable
+DEFAULT_CACHE_MB = 256
+
+logger = logging.getLogger(__name__)
+
+
+# Mark every array of a cached value as read-only, so sessions can share it without copying
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for item in value.values():
+            _freeze(item)
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            _freeze(item)
+    return value
+
+
+def _nbytes(value):
+    if isinstance(value, (np.ndarray, pd.Series, pd.DataFrame)):
+        # memory_usage is a number for a Series and a Series (one value per column) for a DataFrame
+        return int(value.nbytes) if isinstance(value, np.ndarray) else int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+# Process-wide LRU cache shared by all Streamlit sessions, bounded by the total size of the cached arrays
+class ScoreCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.too_large = 0
+        self._entries = OrderedDict()
+        # Keys of the values that did not fit, so each one is only reported once
+        self._too_large_keys = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Computed outside the lock so a slow population does not block the other sessions
+        value = _freeze(compute())
+        size = _nbytes(value)
+
+        with self._lock:
+            if key in self._entries:
+                # Another session filled it in the meantime, keep a single copy
+                return self._entries[key][0]
+            if size > self.max_bytes:
+                # Such values are recomputed on every call, which usually means per-row arrays that should be
+                # reduced before caching
+                self.too_large += 1
+                if key not in self._too_large_keys:
+                    self._too_large_keys.add(key)
+                    logger.warning("Not caching %r: %.1f MB is more than the %.1f MB of the cache, it is recomputed on every call",
+                                   key, size / 2**20, self.max_bytes / 2**20)
+                return value
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._too_large_keys.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "nbytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "too_large": self.too_large,
+            }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def shared_cache():
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            max_mb = float(os.environ.get("ALGODISC_CACHE_MB", DEFAULT_CACHE_MB))
+            _shared_cache = ScoreCache(int(max_mb * 1024 * 1024))
+        return _shared_cache
+
+
+# Identifies a population by its content, so identical data loaded by different sessions gets the same key
+def population_key(df):
+    if "source_key" not in df.attrs:
+        hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        df.attrs["source_key"] = hashlib.blake2b(hashes.tobytes(), digest_size=16).hexdigest()
+    return df.attrs["source_key"]
+
+
+# Lookup table cell of every profile, shared by all toggle masks
+def cached_cells(df):
+    return shared_cache().get(("cells", population_key(df)), lambda: cell_index(profile_arrays(df)))
+
+
+# Number of profiles in every lookup table cell, and the first profile of each cell (-1 for empty cells)
+def cached_cell_counts(df):
+    def compute():
+        cells = cached_cells(df)
+        occupied, first = np.unique(cells, return_index=True)
+        first_profile = np.full(NBR_CELLS, -1, dtype=np.int64)
+        first_profile[occupied] = first
+        return np.bincount(cells, minlength=NBR_CELLS), first_profile
+
+    return shared_cache().get(("cell_counts", population_key(df)), compute)
+
+
+# Scores from the compiled lookup table of the rules, or from another exported table
+def cached_scores(df, mask, table=None):
+    if table is None:
+        return shared_cache().get(("scores", population_key(df), mask), lambda: lookup_scores(compiled_table(), cached_cells(df), mask))
+    return shared_cache().get(("scores", population_key(df), mask, table_key(table)), lambda: lookup_scores(table, cached_cells(df), mask))
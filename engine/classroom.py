@@ -0,0 +1,168 @@
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from engine.fairness import disparity
+from engine.scoring import FEATURES, NBR_MASKS
+
+# Classroom mode: participants who enter the same room code publish their toggle mask, mitigation and the
+# resulting high-risk rates to a room shared by all sessions of the process, and the facilitator page shows
+# the room's totals. Rooms are kept in memory, so all participants must use the same server process.
+ROOM_KEY = "room_code"
+# Participants whose session did not publish anything for this long (closed tabs, ended sessions) leave the room
+IDLE_TIMEOUT_SECONDS = 30 * 60
+
+# Toggles of every mask, as a 0/1 matrix of NBR_MASKS x features
+MASK_FEATURES = (np.arange(NBR_MASKS)[:, None] >> np.arange(len(FEATURES))) & 1
+
+
+def normalize_code(code):
+    return code.strip().upper() if code else ""
+
+
+# Totals of the room are updated when a participant's choice arrives: the previous choice of the participant
+# is subtracted and the new one added, so a snapshot costs the same with 10 or 1000 participants
+class Room:
+    def __init__(self, code, idle_timeout=IDLE_TIMEOUT_SECONDS, clock=time.monotonic):
+        self.code = code
+        self.events = 0
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        # Choices by participant, the participant seen least recently first
+        self._choices = OrderedDict()
+        self._last_seen = {}
+        self._mask_counts = np.zeros(NBR_MASKS, dtype=np.int64)
+        self._intervention_counts = Counter()
+        # Rates are NaN when a participant's profiles have no Swiss or no non-Swiss person, they are left out of
+        # the averages (a NaN in the sums could never be subtracted again)
+        self._high_risk_sums = np.zeros(2)
+        self._high_risk_count = 0
+        # Last publication or snapshot, rooms unused for longer than the idle timeout are dropped
+        self.last_used = clock()
+        self._lock = threading.Lock()
+
+    def _count(self, choice, sign):
+        mask, intervention, high_risk = choice
+        self._mask_counts[mask] += sign
+        self._intervention_counts[intervention] += sign
+        high_risk = np.asarray(high_risk, dtype=np.float64)
+        if np.isfinite(high_risk).all():
+            self._high_risk_sums += sign * high_risk
+            self._high_risk_count += sign
+
+    def _remove(self, participant):
+        self._count(self._choices.pop(participant), -1)
+        del self._last_seen[participant]
+        self.events += 1
+
+    def _expire(self, now):
+        while self._choices:
+            participant = next(iter(self._choices))
+            if now - self._last_seen[participant] < self.idle_timeout:
+                break
+            self._remove(participant)
+
+    # `high_risk` holds the high-risk rates of non-Swiss and Swiss profiles with the participant's system
+    def publish(self, participant, mask, intervention, high_risk):
+        choice = (mask, intervention, tuple(high_risk))
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            self.last_used = now
+            previous = self._choices.get(participant)
+            self._last_seen[participant] = now
+            if previous == choice:
+                self._choices.move_to_end(participant)
+                return False
+            if previous is not None:
+                self._count(previous, -1)
+            self._count(choice, 1)
+            self._choices[participant] = choice
+            self._choices.move_to_end(participant)
+            self.events += 1
+            return True
+
+    # Every participant has left, and no facilitator looked at the room, for the idle timeout
+    def is_idle(self):
+        with self._lock:
+            return self._clock() - self.last_used >= self.idle_timeout
+
+    def leave(self, participant):
+        with self._lock:
+            if participant in self._choices:
+                self._remove(participant)
+
+    def snapshot(self):
+        with self._lock:
+            self.last_used = self._clock()
+            self._expire(self.last_used)
+            participants = len(self._choices)
+            mask_counts = self._mask_counts.copy()
+            interventions = {name: count for name, count in self._intervention_counts.items() if count}
+            high_risk_sums = self._high_risk_sums.copy()
+            high_risk_count = self._high_risk_count
+            events = self.events
+        high_risk_other, high_risk_swiss = high_risk_sums / high_risk_count if high_risk_count else (np.nan, np.nan)
+        gap, ratio = disparity(high_risk_other, high_risk_swiss)
+        return {
+            "participants": participants,
+            "events": events,
+            "mask_counts": mask_counts,
+            # Number of participants using each toggle
+            "feature_counts": dict(zip(FEATURES, (mask_counts @ MASK_FEATURES).tolist())),
+            "interventions": interventions,
+            # Average over the participants' systems, the gap of the averages is the average of the gaps
+            "high_risk_other": high_risk_other,
+            "high_risk_swiss": high_risk_swiss,
+            "high_risk_gap": float(gap),
+            "high_risk_ratio": float(ratio),
+        }
+
+
+_rooms = {}
+_rooms_lock = threading.Lock()
+
+
+# Idle rooms are dropped whenever a room is looked up, so rooms of past workshops do not stay in memory
+def get_room(code, clock=time.monotonic):
+    code = normalize_code(code)
+    with _rooms_lock:
+        for idle in [other for other, room in _rooms.items() if other != code and room.is_idle()]:
+            del _rooms[idle]
+        if code not in _rooms:
+            _rooms[code] = Room(code, clock=clock)
+        return _rooms[code]
+
+
+def reset_room(code):
+    with _rooms_lock:
+        _rooms.pop(normalize_code(code), None)
+
+
+# Rates and gaps as shown on the facilitator page, "–" when no participant's profiles had both groups
+def format_rate(rate):
+    return "–" if np.isnan(rate) else f"{rate * 100:.1f}%"
+
+
+def format_gap(gap):
+    return "–" if np.isnan(gap) else f"{gap:+.1f}"
+
+
+# Called by the app page on every rerun, only sessions that joined a room publish anything
+def publish_choice(session_state, mask, intervention, metrics):
+    code = normalize_code(session_state.get(ROOM_KEY))
+    joined = session_state.get("_classroom_joined", "")
+    if not code and not joined:
+        return
+    if "_classroom_participant" not in session_state:
+        session_state["_classroom_participant"] = uuid.uuid4().hex
+    participant = session_state["_classroom_participant"]
+    if joined and joined != code:
+        get_room(joined).leave(participant)
+    session_state["_classroom_joined"] = code
+    if code:
+        high_risk = (metrics["high_risk_other"], metrics["high_risk_swiss"])
+        get_room(code).publish(participant, mask, intervention, high_risk)
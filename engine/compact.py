@@ -0,0 +1,53 @@
+import html
+
+from engine.cache import population_key, shared_cache
+
+# Compact view of the profiles: a single HTML table instead of about ten Streamlit elements per profile card, so
+# a rerun sends one element whatever the number of profiles. The colors are the ones of st.info, st.warning and
+# st.error, indexed by risk bucket.
+TABLE_STYLE = """<style>
+.profiles { border-collapse: collapse; width: 100%; font-size: 0.9rem; }
+.profiles th, .profiles td { padding: 0.35rem 0.6rem; border-bottom: 1px solid rgba(49, 51, 63, 0.1); text-align: left; }
+.profiles .bucket0 { background: rgba(28, 131, 225, 0.1); color: rgb(0, 66, 128); }
+.profiles .bucket1 { background: rgba(255, 227, 18, 0.1); color: rgb(146, 108, 5); }
+.profiles .bucket2 { background: rgba(255, 43, 43, 0.09); color: rgb(125, 53, 59); }
+.profiles .note { color: rgba(49, 51, 63, 0.6); font-size: 0.8rem; }
+</style>"""
+
+
+# Names of the first profiles, or their numbers when the population has none (COMPAS data, some uploads)
+def profile_names(df, nbr_profiles):
+    if "name" not in df.columns:
+        return [f"#{i + 1}" for i in range(nbr_profiles)]
+    return df["name"].iloc[:nbr_profiles].tolist()
+
+
+# Header and information cells of the first profiles, they do not depend on the toggles. `value_labels` maps a
+# column to the translations of its values.
+def profile_cells(df, fields, nbr_profiles, value_labels):
+    header = "".join(f"<th>{html.escape(label)}</th>" for label, _ in fields)
+    values = {column: profile_names(df, nbr_profiles) if column == "name" else df[column].iloc[:nbr_profiles] for _, column in fields}
+    columns = [[value_labels.get(column, {}).get(value, value) for value in values[column]] for _, column in fields]
+    rows = ["".join(f"<td>{html.escape(str(values[i]))}</td>" for values in columns) for i in range(nbr_profiles)]
+    return header, rows
+
+
+# Built once per population and language, only the score cells change from one rerun to the next
+def cached_profile_cells(df, fields, nbr_profiles, value_labels=None):
+    fields, value_labels = tuple(fields), value_labels or {}
+    labels_key = tuple((column, tuple(labels.items())) for column, labels in sorted(value_labels.items()))
+    return shared_cache().get(("profile_cells", population_key(df), fields, labels_key, nbr_profiles),
+                              lambda: profile_cells(df, fields, nbr_profiles, value_labels))
+
+
+# `fields` are (label, column) pairs, `notes` optional lines of text shown under each profile
+def render_profiles(df, scored, fields, score_label, nbr_profiles, notes=None, value_labels=None):
+    header, rows = cached_profile_cells(df, fields, nbr_profiles, value_labels)
+    parts = [TABLE_STYLE, f'<table class="profiles"><thead><tr>{header}<th>{html.escape(score_label)}</th></tr></thead><tbody>']
+    for i, cells in enumerate(rows):
+        parts.append(f'<tr>{cells}<td class="bucket{scored.bucket[i]}">{scored.percent[i]}%</td></tr>')
+        if notes and notes[i]:
+            lines = "<br>".join(html.escape(line) for line in notes[i])
+            parts.append(f'<tr><td class="note" colspan="{len(fields) + 1}">{lines}</td></tr>')
+    parts.append("</tbody></table>")
+    return "".join(parts)
@@ -0,0 +1,60 @@
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from engine.data import to_profile_schema
+
+# ProPublica's two-year recidivism file, vendored because the app has no network access at runtime
+COMPAS_CSV = Path(__file__).resolve().parent.parent / "data" / "compas" / "compas-scores-two-years.csv"
+
+# Columns read from the CSV and how they map to the profile schema
+COMPAS_COLUMNS = {
+    "priors_count": "convictions",
+    "age": "age",
+    "race": "race",
+    "sex": "gender",
+    "two_year_recid": "reoffended",
+}
+COMPAS_DTYPES = {"priors_count": "int16", "age": "int16", "race": "category", "sex": "category", "two_year_recid": "int8"}
+
+# The app compares two groups: the reference group is stored as "Swiss" and everybody else as "Other",
+# the original category is kept in the "race" column
+COMPAS_REFERENCE_RACE = "Caucasian"
+
+
+def compas_available(csv_path=COMPAS_CSV):
+    return Path(csv_path).exists()
+
+
+def convert_compas(csv_path=COMPAS_CSV):
+    raw = pd.read_csv(csv_path, usecols=list(COMPAS_COLUMNS), dtype=COMPAS_DTYPES).rename(columns=COMPAS_COLUMNS)
+    is_reference = (raw["race"] == COMPAS_REFERENCE_RACE).to_numpy()
+    df = pd.DataFrame({
+        "age": raw["age"],
+        "ethnicity": pd.Categorical.from_codes(np.where(is_reference, 0, 1), ["Swiss", "Other"]),
+        "race": raw["race"],
+        "convictions": raw["convictions"],
+        # COMPAS does not record police encounters
+        "encounters": np.zeros(len(raw), dtype=np.int16),
+        "gender": raw["gender"].cat.rename_categories({"Male": "M", "Female": "F"}),
+        "reoffended": raw["reoffended"].astype(bool),
+    })
+    return to_profile_schema(df)
+
+
+# Typed Parquet copy of the CSV, rebuilt only when the CSV changes, then kept in memory by the process
+@lru_cache(maxsize=None)
+def load_compas(csv_path=COMPAS_CSV):
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        raise FileNotFoundError(f"{csv_path} is missing, see data/compas/README.md to add it.")
+    parquet_path = csv_path.with_suffix(".parquet")
+    if not parquet_path.exists() or parquet_path.stat().st_mtime < csv_path.stat().st_mtime:
+        convert_compas(csv_path).to_parquet(parquet_path, index=False)
+    df = pd.read_parquet(parquet_path)
+    stat = os.stat(parquet_path)
+    df.attrs["source_key"] = f"{parquet_path}:{stat.st_mtime_ns}:{stat.st_size}"
+    return df
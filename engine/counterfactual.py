@@ -0,0 +1,40 @@
+import numpy as np
+
+from engine.cache import population_key, shared_cache
+from engine.scoring import label_flags, max_score_arrays, profile_arrays, score_arrays, score_percent
+
+# Sensitive attributes that are flipped: M <-> F (N/S is left as is), Swiss <-> Other, age moved across 25
+COUNTERFACTUALS = ("gender", "ethnicity", "age")
+
+
+def flipped_arrays(arrays, attribute, is_female):
+    flipped = dict(arrays)
+    if attribute == "gender":
+        flipped["is_male"] = is_female
+    elif attribute == "ethnicity":
+        flipped["is_other"] = ~arrays["is_other"]
+    elif attribute == "age":
+        flipped["age"] = np.where(arrays["age"] < 25, 25, 24).astype(arrays["age"].dtype)
+    return flipped
+
+
+# Difference between the score of every profile with one sensitive attribute flipped and its actual score,
+# for all profiles at once: {attribute: (score delta, percent delta)}
+def counterfactual_deltas(df, mask):
+    arrays = profile_arrays(df)
+    is_female = label_flags(df["gender"], "F")
+    score = score_arrays(arrays, mask)
+    percent = score_percent(score.copy(), max_score_arrays(arrays, mask))
+
+    deltas = {}
+    for attribute in COUNTERFACTUALS:
+        flipped = flipped_arrays(arrays, attribute, is_female)
+        flipped_score = score_arrays(flipped, mask)
+        flipped_percent = score_percent(flipped_score.copy(), max_score_arrays(flipped, mask))
+        deltas[attribute] = (flipped_score - score, np.round(flipped_percent - percent, 1))
+    return deltas
+
+
+# Only the first `nbr_profiles` profiles are shown, so only they are flipped
+def cached_counterfactuals(df, mask, nbr_profiles=8):
+    return shared_cache().get(("counterfactuals", population_key(df), mask, nbr_profiles), lambda: counterfactual_deltas(df.head(nbr_profiles), mask))
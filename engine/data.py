@@ -0,0 +1,124 @@
+import argparse
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from engine.regions import postcodes_by_share
+
+# Profiles shown on the app page when no dataset is configured
+DEMO_PROFILES = {
+    "name": ["John", "Janine", "Joe", "Jack", "Janet", "Jocelyn", "Leo", "Lara"],
+    "age": [21, 18, 36, 98, 45, 63, 28, 24],
+    "ethnicity": ["Swiss", "Other", "Swiss", "Other", "Other", "Other", "Other", "Swiss"],
+    "convictions": [0, 1, 2, 3, 4, 5, 0, 9],
+    "encounters": [12, 2, 0, 0, 45, 5, 2, 9],
+    "gender": ["M", "F", "N/S", "N/S", "M", "F", "M", "N/S"],
+    "zip_code": [3000, 1203, 8400, 4057, 1004, 6900, 8004, 7000],
+}
+
+# Compact column types of the profile schema, text columns are stored as categories (Arrow dictionaries).
+# "zip_code" (Swiss postcode) and "reoffended" (whether the person actually reoffended) are optional.
+PROFILE_SCHEMA = {
+    "name": "category",
+    "age": "int16",
+    "ethnicity": "category",
+    "convictions": "int16",
+    "encounters": "int16",
+    "gender": "category",
+    "zip_code": "Int16",
+    "reoffended": "boolean",
+}
+
+
+# Columns every profile file needs, the others of PROFILE_SCHEMA are optional
+REQUIRED_COLUMNS = ("age", "ethnicity", "convictions", "encounters", "gender")
+
+
+def to_profile_schema(df):
+    return df.astype({column: dtype for column, dtype in PROFILE_SCHEMA.items() if column in df.columns})
+
+
+def demo_population():
+    df = to_profile_schema(pd.DataFrame(DEMO_PROFILES))
+    df.attrs["source_key"] = "demo"
+    return df
+
+
+# Opens an Arrow IPC (Feather v2) file through a memory map: the columns point into the page cache
+# instead of being copied, so several worker processes reading the same file share its memory
+def open_population(path):
+    source = pa.memory_map(str(path), "r")
+    table = pa.ipc.open_file(source).read_all()
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    stat = os.stat(path)
+    df.attrs["source_key"] = f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return df
+
+
+# Profile files that can be read by read_population, Arrow IPC files first since they are memory-mapped
+PROFILE_SUFFIXES = (".arrow", ".feather", ".parquet", ".csv")
+
+
+# Reads a profile file by its extension, Parquet and CSV files are loaded and converted to the profile schema
+def read_population(path):
+    suffix = Path(path).suffix.lower()
+    if suffix in (".arrow", ".feather"):
+        return open_population(path)
+    if suffix == ".parquet":
+        df = pd.read_parquet(path)
+    elif suffix == ".csv":
+        df = pd.read_csv(path)
+    else:
+        raise ValueError(f"Unsupported profile file: {path}")
+    df = to_profile_schema(df)
+    stat = os.stat(path)
+    df.attrs["source_key"] = f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return df
+
+
+# Files must stay uncompressed to be memory-mapped without decoding
+def write_population(df, path):
+    table = pa.Table.from_pandas(to_profile_schema(df), preserve_index=False)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table.combine_chunks())
+
+
+# Population used by the app: the file given by the ALGODISC_DATASET environment variable, or the demo profiles.
+# Loaded once per process and shared (read-only) by all sessions.
+@lru_cache(maxsize=None)
+def load_population(path=None):
+    path = path or os.environ.get("ALGODISC_DATASET")
+    if path:
+        return open_population(path)
+    return demo_population()
+
+
+# Random profiles following the demo schema, used to try the app with large populations
+def synthetic_population(nbr_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    names = pd.Categorical.from_codes(rng.integers(0, len(DEMO_PROFILES["name"]), nbr_rows), DEMO_PROFILES["name"])
+    convictions = rng.poisson(2.0, nbr_rows).astype(np.int16)
+    return pd.DataFrame({
+        "name": names,
+        "age": rng.integers(18, 90, nbr_rows, dtype=np.int16),
+        "ethnicity": pd.Categorical.from_codes(rng.integers(0, 2, nbr_rows), ["Swiss", "Other"]),
+        "convictions": convictions,
+        "encounters": rng.poisson(5.0, nbr_rows).astype(np.int16),
+        "gender": pd.Categorical.from_codes(rng.integers(0, 3, nbr_rows), ["M", "F", "N/S"]),
+        "zip_code": rng.choice(np.r_[postcodes_by_share(True), postcodes_by_share(False)], nbr_rows),
+        "reoffended": rng.random(nbr_rows) < 0.15 + 0.05 * np.minimum(convictions, 8),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic population as an Arrow IPC file.")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_population(synthetic_population(args.rows, args.seed), args.path)
@@ -0,0 +1,25 @@
+import numpy as np
+
+from engine.scoring import HIGH
+
+
+def _ratio(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.full(numerator.shape, np.nan), where=np.asarray(denominator) > 0)
+
+
+# Rate of `flags` inside and outside a group, along the last axis (profiles), optionally among the rows in `where`.
+# Leading axes (e.g. simulated populations) are kept, so many populations are handled at once.
+def group_rates(flags, in_group, where=True):
+    group = in_group & where
+    rest = ~in_group & where
+    return _ratio((flags & group).sum(axis=-1), group.sum(axis=-1)), _ratio((flags & rest).sum(axis=-1), rest.sum(axis=-1))
+
+
+def high_risk_rates(buckets, in_group, where=True):
+    return group_rates(buckets == HIGH, in_group, where)
+
+
+# Gap between a group and the others: difference in percentage points and ratio of the rates
+def disparity(group_rate, rest_rate):
+    return (group_rate - rest_rate) * 100.0, _ratio(group_rate, rest_rate)
@@ -0,0 +1,125 @@
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from engine.cache import shared_cache
+from engine.fairness import disparity, group_rates, high_risk_rates
+from engine.scoring import HIGH, max_score_arrays, parse_mask, risk_buckets, score_arrays, score_percent
+from engine.simulation import DEFAULT_MASK, biased_populations
+
+# Feedback loop of predictive policing: the population is scored every round, and during the next round the police
+# check profiles rated high-risk `attention` times more often (medium-risk ones sqrt(attention) times). The extra
+# encounters, and the convictions some of them lead to, raise the next scores, although everybody keeps
+# reoffending at the same rate.
+# Police records only count the encounters and convictions of the last `memory` rounds, like records that expire
+MEMORY = 10
+# Encounters per round of a Swiss person who does not reoffend (twice as many for reoffenders), and the share of
+# the encounters that end with a conviction: over MEMORY rounds, Swiss people get the encounters and convictions of
+# biased_populations
+ROUND_ENCOUNTERS = 0.3
+CONVICTIONS_PER_ENCOUNTER = {"reoffended": 2.5 / 6.0, "not_reoffended": 1.0 / 3.0}
+METRICS = ("high_risk_other", "high_risk_swiss", "high_risk_gap", "high_risk_ratio", "false_positive_gap", "encounters_other", "encounters_swiss")
+
+
+# One round of police checks, whose records replace the ones of round `row` of the `history` ring buffers
+def _patrol(rng, arrays, history, row, rate, conviction_rate):
+    encounters = rng.poisson(rate).astype(np.int16)
+    # Most profiles have no encounter in a round, convictions are only drawn for the others
+    met = np.flatnonzero(encounters)
+    convictions = np.zeros_like(encounters)
+    convictions[met] = rng.binomial(encounters[met], conviction_rate[met])
+    for name, new in (("encounters", encounters), ("convictions", convictions)):
+        arrays[name] += new - history[name][row]
+        history[name][row] = new
+
+
+# Per-round metrics of one population followed over `rounds` rounds (round 0 is the population before any
+# feedback). Every profile is updated with array operations, the only Python loop is over the rounds. Without
+# feedback (attention=1) the records of every round follow the same distribution, so the metrics stay flat.
+def feedback_loop(oversampling=2.0, attention=2.0, rounds=20, nbr_profiles=100_000, other_share=0.4, reoffense_rate=0.3,
+                  memory=MEMORY, mask=DEFAULT_MASK, seed=0):
+    rng = np.random.default_rng(seed)
+    arrays = {name: values[0] for name, values in biased_populations(rng, 1, nbr_profiles, oversampling, other_share, reoffense_rate).items()}
+    is_other, reoffended = arrays["is_other"], arrays["reoffended"]
+    base_rate = ROUND_ENCOUNTERS * np.where(reoffended, 2.0, 1.0) * np.where(is_other, oversampling, 1.0)
+    conviction_rate = np.where(reoffended, CONVICTIONS_PER_ENCOUNTER["reoffended"], CONVICTIONS_PER_ENCOUNTER["not_reoffended"])
+    attention_by_bucket = attention ** (np.arange(3) / 2)
+    # The age and ethnicity multipliers do not change between rounds
+    max_score = max_score_arrays(arrays, mask)
+
+    # Records of the last `memory` rounds, one row per round. The records before the first round come from
+    # `memory` rounds of the same police bias, without feedback.
+    history = {name: np.zeros((memory, nbr_profiles), dtype=np.int16) for name in ("encounters", "convictions")}
+    arrays["encounters"], arrays["convictions"] = np.zeros(nbr_profiles, np.int16), np.zeros(nbr_profiles, np.int16)
+    for row in range(memory):
+        _patrol(rng, arrays, history, row, base_rate, conviction_rate)
+
+    metrics = {name: np.empty(rounds + 1) for name in METRICS}
+    counts = np.bincount(is_other, minlength=2)
+    for step in range(rounds + 1):
+        buckets = risk_buckets(score_percent(score_arrays(arrays, mask), max_score))
+        high_other, high_swiss = high_risk_rates(buckets, is_other)
+        fpr_other, fpr_swiss = group_rates(buckets == HIGH, is_other, ~reoffended)
+        metrics["high_risk_other"][step], metrics["high_risk_swiss"][step] = high_other, high_swiss
+        metrics["high_risk_gap"][step], metrics["high_risk_ratio"][step] = disparity(high_other, high_swiss)
+        metrics["false_positive_gap"][step] = disparity(fpr_other, fpr_swiss)[0]
+        metrics["encounters_swiss"][step], metrics["encounters_other"][step] = np.bincount(is_other, arrays["encounters"], minlength=2) / counts
+        if step < rounds:
+            _patrol(rng, arrays, history, step % memory, base_rate * attention_by_bucket[buckets], conviction_rate)
+    return metrics
+
+
+def cached_feedback(**params):
+    return shared_cache().get(("feedback_loop", tuple(sorted(params.items()))), lambda: feedback_loop(**params))
+
+
+def _run(params):
+    return params, feedback_loop(**params)
+
+
+# Feedback loops of every combination of the given parameter values, one process per run when `workers` > 1.
+# Returns one row per run and round.
+def sweep_feedback(grid, workers=1, **params):
+    names = list(grid)
+    runs = [dict(params, **dict(zip(names, values))) for values in itertools.product(*grid.values())]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run, runs))
+    else:
+        results = [_run(run) for run in runs]
+    frames = []
+    for run, metrics in results:
+        frame = pd.DataFrame(metrics).rename_axis("round").reset_index()
+        frames.append(frame.assign(**{name: run[name] for name in names}))
+    return pd.concat(frames, ignore_index=True)[names + ["round", *METRICS]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the feedback loop of predictive policing over several rounds.")
+    parser.add_argument("--profiles", type=int, default=1_000_000)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[2.0], help="extra police checks of non-Swiss people")
+    parser.add_argument("--attention", type=float, nargs="+", default=[2.0], help="extra police checks of profiles rated high-risk")
+    parser.add_argument("--mask", default="encounters+convictions", help="toggle mask, as a number, feature names joined with + or all")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="CSV file for the metrics of every run and round")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = sweep_feedback({"oversampling": args.oversampling, "attention": args.attention}, workers=args.workers,
+                             rounds=args.rounds, nbr_profiles=args.profiles, mask=parse_mask(args.mask), seed=args.seed)
+    seconds = time.perf_counter() - started
+    if args.out:
+        results.to_csv(args.out, index=False)
+    last = results[results["round"].isin([0, args.rounds])]
+    print(last.pivot_table(index=["oversampling", "attention"], columns="round", values="high_risk_gap").round(1).to_string())
+    print(f"{len(last) // 2} runs of {args.profiles:,} profiles x {args.rounds} rounds in {seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from collections import namedtuple
+
+import numpy as np
+
+from engine.cache import cached_scores, population_key, shared_cache
+from engine.fairness import disparity, group_rates
+from engine.outcomes import has_outcomes
+from engine.proxies import cached_proxy_report
+from engine.scoring import FEATURES, HIGH, MEDIUM, ScoredPopulation, label_flags, risk_buckets, uses
+from engine.simulation import sample_profiles
+
+INTERVENTIONS = ("none", "group_thresholds", "reweighing", "suppress_proxies")
+
+# Features whose Cramér's V with ethnicity reaches this value are treated as proxies for it
+PROXY_THRESHOLD = 0.2
+# With fewer profiles every feature looks like a proxy, so the simulated population is used to find them instead
+MIN_PROXY_PROFILES = 1000
+# Seed of the random order of profiles with the same score in group thresholds and reweighing
+TIE_BREAK_SEED = 0
+
+# Scores after the intervention, the toggle mask they were computed with and the fairness metrics before and after
+InterventionResult = namedtuple("InterventionResult", ["scored", "mask", "suppressed", "before", "after"])
+
+
+# High-risk rates (and false positive rates when outcomes are known) of non-Swiss and Swiss profiles
+def fairness_metrics(df, scored):
+    is_other = label_flags(df["ethnicity"], "Other")
+    is_high = scored.bucket == HIGH
+    high_other, high_swiss = group_rates(is_high, is_other)
+    gap, ratio = disparity(high_other, high_swiss)
+    metrics = {
+        "high_risk_other": float(high_other),
+        "high_risk_swiss": float(high_swiss),
+        "high_risk_gap": float(gap),
+        "high_risk_ratio": float(ratio),
+        "mean_percent_other": float(scored.percent[is_other].mean()) if is_other.any() else np.nan,
+        "mean_percent_swiss": float(scored.percent[~is_other].mean()) if (~is_other).any() else np.nan,
+    }
+    if has_outcomes(df):
+        innocent = ~df["reoffended"].to_numpy(dtype=bool, na_value=True)
+        fp_other, fp_swiss = group_rates(is_high, is_other, where=innocent)
+        metrics["false_positive_other"] = float(fp_other)
+        metrics["false_positive_swiss"] = float(fp_swiss)
+        metrics["false_positive_gap"] = float(disparity(fp_other, fp_swiss)[0])
+    return metrics
+
+
+# Every group gets its own high-risk cutoff so that the same share of each group is rated high-risk as in the
+# whole population. Scores are unchanged, profiles only move between the medium and high buckets.
+def group_thresholds(scored, is_other):
+    groups = (is_other, ~is_other)
+    sizes = np.array([np.count_nonzero(group) for group in groups])
+    # The profiles rated high-risk are shared between the groups in proportion to their sizes, the ones left by
+    # rounding down going to the largest remainders, so that the total stays the same
+    quotas = np.count_nonzero(scored.bucket == HIGH) * sizes / max(sizes.sum(), 1)
+    nbr_highs = np.floor(quotas).astype(np.int64)
+    nbr_highs[np.argsort(nbr_highs - quotas, kind="stable")[:int(round(quotas.sum())) - nbr_highs.sum()]] += 1
+    bucket = np.where(scored.bucket == HIGH, MEDIUM, scored.bucket).astype(scored.bucket.dtype)
+    rng = np.random.default_rng(TIE_BREAK_SEED)
+    for group, nbr_high in zip(groups, nbr_highs):
+        if nbr_high == 0:
+            continue
+        rows = np.flatnonzero(group)
+        percent = scored.percent[rows]
+        # The nbr_high-th largest score of the group is its cutoff. Many profiles share a score, so the ones tied
+        # with the cutoff are drawn at random until the group reaches its share.
+        cutoff = np.partition(percent, len(percent) - nbr_high)[len(percent) - nbr_high]
+        bucket[rows[percent > cutoff]] = HIGH
+        bucket[rng.choice(rows[percent == cutoff], nbr_high - np.count_nonzero(percent > cutoff), replace=False)] = HIGH
+    return scored._replace(bucket=bucket)
+
+
+# The profiles of every group are ranked by score and get the score of the same rank in the whole population, so
+# that every group has the same shares of low, medium and high risk as the whole population. The rules themselves
+# have no training step, so the groups are reweighed at the output.
+def reweighing(scored, is_other):
+    # Scores are rounded to a tenth of a percent: as integers, they are sorted by counting, not by comparisons
+    tenths = np.rint(scored.percent * 10).astype(np.int16)
+    pooled = np.sort(tenths, kind="stable")
+    new_tenths = tenths.copy()
+    rng = np.random.default_rng(TIE_BREAK_SEED)
+    for group in (is_other, ~is_other):
+        # Profiles with the same score are ranked at random, otherwise the first ones of the file would come first
+        rows = rng.permutation(np.flatnonzero(group))
+        rows = rows[np.argsort(tenths[rows], kind="stable")]
+        ranks = ((np.arange(len(rows)) + 0.5) * len(pooled) / max(len(rows), 1)).astype(np.int64)
+        new_tenths[rows] = pooled[ranks]
+    percent = new_tenths / 10
+    score = percent * scored.max_score / 100
+    return ScoredPopulation(score, scored.max_score, percent, risk_buckets(percent))
+
+
+# Ethnicity and the features that reveal it, found on the population itself or on the simulated one when it is small
+def proxy_features(df):
+    report = cached_proxy_report(df if len(df) >= MIN_PROXY_PROFILES else sample_profiles())
+    strength = report[("ethnicity", "cramers_v")] if ("ethnicity", "cramers_v") in report.columns else {}
+    return ("ethnicity",) + tuple(feature for feature in FEATURES if feature in strength and strength[feature] >= PROXY_THRESHOLD)
+
+
+def suppress_proxies(df, mask, table=None):
+    suppressed = tuple(feature for feature in proxy_features(df) if uses(mask, feature))
+    for feature in suppressed:
+        mask &= ~(1 << FEATURES.index(feature))
+    return cached_scores(df, mask, table), mask, suppressed
+
+
+# `table` is an exported scoring table to use instead of the rules of the app
+def apply_intervention(df, mask, intervention, table=None):
+    scored = cached_scores(df, mask, table)
+    before = fairness_metrics(df, scored)
+    used_mask, suppressed = mask, ()
+    if intervention == "group_thresholds":
+        scored = group_thresholds(scored, label_flags(df["ethnicity"], "Other"))
+    elif intervention == "reweighing":
+        scored = reweighing(scored, label_flags(df["ethnicity"], "Other"))
+    elif intervention == "suppress_proxies":
+        scored, used_mask, suppressed = suppress_proxies(df, mask, table)
+    elif intervention != "none":
+        raise ValueError(f"Unknown intervention: {intervention}")
+    return InterventionResult(scored, used_mask, suppressed, before, fairness_metrics(df, scored))
+
+
+# Without a mitigation, or with suppressed proxies, the scores are those of another toggle mask. They are already in
+# the cache, so only the metrics are kept and the scores are looked up again instead of being counted twice.
+def cached_intervention(df, mask, intervention):
+    key = ("intervention", population_key(df), mask, intervention)
+    if intervention in ("group_thresholds", "reweighing"):
+        return shared_cache().get(key, lambda: apply_intervention(df, mask, intervention))
+    result = shared_cache().get(key, lambda: apply_intervention(df, mask, intervention)._replace(scored=None))
+    return result._replace(scored=cached_scores(df, result.mask))
@@ -0,0 +1,140 @@
+import argparse
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+from engine.scoring import DEFAULT_WEIGHTS, NBR_MASKS, ScoredPopulation, profile_arrays, score_profile_arrays
+
+# Every rule only looks at a few bins of each feature, so all profiles fall into one of 144 cells and the whole
+# scoring system fits in a table of 64 toggle masks x 144 cells
+BINS = (
+    ("encounters", 3),   # 0, 1 to 9, 10 or more
+    ("convictions", 3),  # 0 or 1, 2 to 4, 5 or more
+    ("is_male", 2),
+    ("is_other", 2),
+    ("is_young", 2),     # younger than 25
+    ("high_foreign_share", 2),
+)
+NBR_CELLS = int(np.prod([size for _, size in BINS]))
+
+TABLE_DTYPE = np.dtype([("score", np.float64), ("max_score", np.float64), ("percent", np.float64), ("bucket", np.int8)])
+
+
+# Bin of every feature of every profile, as small integers. The thresholds of the weights can be arrays
+# broadcast against the profiles.
+def profile_bins(arrays, weights=DEFAULT_WEIGHTS):
+    encounters, convictions = arrays["encounters"], arrays["convictions"]
+    return {
+        "encounters": (encounters > 0).astype(np.uint8) + (encounters >= weights.encounters_high),
+        "convictions": (convictions > 1).astype(np.uint8) + (convictions >= weights.convictions_high),
+        "is_male": arrays["is_male"],
+        "is_other": arrays["is_other"],
+        "is_young": arrays["age"] < weights.age_threshold,
+        "high_foreign_share": arrays["high_foreign_share"],
+    }
+
+
+# Cell of every profile: the bins combined in the order of BINS, like the digits of a number
+def cell_index(arrays, weights=DEFAULT_WEIGHTS):
+    bins = profile_bins(arrays, weights)
+    index = np.zeros(np.broadcast_shapes(*(np.shape(values) for values in bins.values())), dtype=np.uint8)
+    for name, size in BINS:
+        np.multiply(index, size, out=index)
+        np.add(index, bins[name], out=index, casting="unsafe")
+    return index
+
+
+# One representative profile per cell, in cell order
+def cell_profiles():
+    digits = np.indices([size for _, size in BINS]).reshape(len(BINS), NBR_CELLS)
+    bins = dict(zip((name for name, _ in BINS), digits))
+    return {
+        "encounters": np.array([0, 1, 10], dtype=np.int16)[bins["encounters"]],
+        "convictions": np.array([0, 2, 5], dtype=np.int16)[bins["convictions"]],
+        "age": np.where(bins["is_young"] == 1, 24, 25).astype(np.int16),
+        "is_male": bins["is_male"] == 1,
+        "is_other": bins["is_other"] == 1,
+        "high_foreign_share": bins["high_foreign_share"] == 1,
+    }
+
+
+# Whether the profiles of every cell are non-Swiss
+IS_OTHER_CELL = cell_profiles()["is_other"]
+
+
+# Scores of the representative profiles with every toggle mask, computed with the rules themselves
+def build_lookup_table():
+    profiles = cell_profiles()
+    table = np.empty((NBR_MASKS, NBR_CELLS), dtype=TABLE_DTYPE)
+    for mask in range(NBR_MASKS):
+        scored = score_profile_arrays(profiles, mask)
+        for field in TABLE_DTYPE.names:
+            table[field][mask] = getattr(scored, field)
+    table.flags.writeable = False
+    return table
+
+
+@lru_cache(maxsize=None)
+def compiled_table():
+    return build_lookup_table()
+
+
+def table_key(table):
+    return hashlib.blake2b(np.ascontiguousarray(table).tobytes(), digest_size=16).hexdigest()
+
+
+# Scoring is one take per output: the 144 values of the mask (made contiguous first) indexed by the cells
+def lookup_scores(table, cells, mask):
+    row = table[mask]
+    return ScoredPopulation(*(np.ascontiguousarray(row[field]).take(cells) for field in TABLE_DTYPE.names))
+
+
+def lookup_population(df, mask, table=None):
+    table = compiled_table() if table is None else table
+    return lookup_scores(table, cell_index(profile_arrays(df)), mask)
+
+
+# The table as a long Arrow table, one row per (mask, cell) with the bins spelled out, for use outside NumPy
+def lookup_table_to_arrow(table):
+    masks, cells = np.divmod(np.arange(NBR_MASKS * NBR_CELLS), NBR_CELLS)
+    digits = np.indices([size for _, size in BINS]).reshape(len(BINS), NBR_CELLS)
+    columns = {"mask": masks.astype(np.uint8), "cell": cells.astype(np.uint8)}
+    columns.update({name: np.tile(values, NBR_MASKS).astype(np.uint8) for (name, _), values in zip(BINS, digits)})
+    columns.update({field: table[field].ravel() for field in TABLE_DTYPE.names})
+    return pa.table(columns)
+
+
+def export_lookup_table(path, table=None):
+    table = compiled_table() if table is None else table
+    if Path(path).suffix == ".npy":
+        np.save(path, table, allow_pickle=False)
+    else:
+        with pa.OSFile(str(path), "wb") as sink:
+            arrow_table = lookup_table_to_arrow(table)
+            with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                writer.write_table(arrow_table)
+
+
+def load_lookup_table(path):
+    if Path(path).suffix == ".npy":
+        table = np.load(path, allow_pickle=False)
+    else:
+        arrow_table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all().sort_by([("mask", "ascending"), ("cell", "ascending")])
+        table = np.empty(NBR_MASKS * NBR_CELLS, dtype=TABLE_DTYPE)
+        for field in TABLE_DTYPE.names:
+            table[field] = arrow_table.column(field).to_numpy()
+    if table.dtype != TABLE_DTYPE or table.size != NBR_MASKS * NBR_CELLS:
+        raise ValueError(f"{path} is not a scoring table of {NBR_MASKS} masks x {NBR_CELLS} cells")
+    table = table.reshape(NBR_MASKS, NBR_CELLS)
+    table.flags.writeable = False
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the scoring rules as a lookup table (.npy or Arrow IPC file).")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    export_lookup_table(args.path)
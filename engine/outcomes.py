@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from engine.cache import population_key, shared_cache
+from engine.fairness import _ratio
+from engine.lookup import cell_index, lookup_scores, table_key
+from engine.scoring import BUCKET_EDGES, NBR_MASKS, max_score_arrays, profile_arrays, score_arrays, score_percent
+
+# Scores are counted per whole percent (0 to 100), enough to apply the bucket edges exactly
+NBR_SCORE_BINS = 101
+
+
+# Confusion counts of a labeled population for every toggle mask: counts[mask, group, score percent, reoffended].
+# Accumulators of different chunks of a population can be merged, so large datasets are processed piece by piece.
+# `table` is an exported scoring table to use instead of the rules of the app.
+class ConfusionAccumulator:
+    def __init__(self, groups=("Swiss", "Other"), group_column="ethnicity", masks=range(NBR_MASKS), table=None):
+        self.groups = tuple(groups)
+        self.group_column = group_column
+        self.masks = tuple(masks)
+        self.table = table
+        self.table_key = None if table is None else table_key(table)
+        self.counts = np.zeros((len(self.masks), len(self.groups), NBR_SCORE_BINS, 2), dtype=np.int64)
+
+    def update(self, df):
+        codes = pd.Categorical(df[self.group_column], categories=self.groups).codes
+        labels = df["reoffended"]
+        # Profiles without a known outcome or outside the compared groups are left out
+        keep = labels.notna().to_numpy() & (codes >= 0)
+        arrays = {name: values[keep] for name, values in profile_arrays(df).items()}
+        reoffended = labels.to_numpy(dtype=bool, na_value=False)[keep]
+        base = codes[keep].astype(np.intp) * NBR_SCORE_BINS
+
+        size = len(self.groups) * NBR_SCORE_BINS * 2
+        cells = None if self.table is None else cell_index(arrays)
+        for m, mask in enumerate(self.masks):
+            if self.table is None:
+                percent = score_percent(score_arrays(arrays, mask), max_score_arrays(arrays, mask))
+            else:
+                percent = lookup_scores(self.table, cells, mask).percent
+            index = (base + percent.astype(np.intp)) * 2 + reoffended
+            self.counts[m] += np.bincount(index, minlength=size).reshape(self.counts.shape[1:])
+        return self
+
+    def merge(self, other):
+        if (self.groups, self.group_column, self.masks, self.table_key) != (other.groups, other.group_column, other.masks, other.table_key):
+            raise ValueError("Only accumulators over the same groups, masks and scoring table can be merged.")
+        merged = ConfusionAccumulator(self.groups, self.group_column, self.masks, self.table)
+        merged.counts = self.counts + other.counts
+        return merged
+
+    __add__ = merge
+
+    # Error rates of "high risk" (score >= threshold) and observed reoffense rate per bucket, one row per group
+    def report(self, mask, threshold=BUCKET_EDGES[1]):
+        counts = self.counts[self.masks.index(mask)]
+        flagged = counts[:, threshold:].sum(axis=1)
+        not_flagged = counts[:, :threshold].sum(axis=1)
+        true_positives, false_positives = flagged[:, 1], flagged[:, 0]
+        false_negatives, true_negatives = not_flagged[:, 1], not_flagged[:, 0]
+        profiles = counts.sum(axis=(1, 2))
+
+        report = pd.DataFrame({
+            "profiles": profiles,
+            "reoffense_rate": _ratio(true_positives + false_negatives, profiles),
+            "high_risk_rate": _ratio(true_positives + false_positives, profiles),
+            "false_positive_rate": _ratio(false_positives, false_positives + true_negatives),
+            "false_negative_rate": _ratio(false_negatives, false_negatives + true_positives),
+            "precision": _ratio(true_positives, true_positives + false_positives),
+        }, index=pd.Index(self.groups, name="group"))
+
+        # Calibration: how often the people of each bucket actually reoffended
+        edges = (0,) + BUCKET_EDGES + (NBR_SCORE_BINS,)
+        for name, start, stop in zip(("low", "medium", "high"), edges[:-1], edges[1:]):
+            bucket = counts[:, start:stop].sum(axis=1)
+            report[f"reoffense_rate_{name}"] = _ratio(bucket[:, 1], bucket.sum(axis=1))
+        return report
+
+
+# Streams a labeled population through an accumulator in chunks of `chunk_rows` profiles
+def analyze_outcomes(df, chunk_rows=1_000_000, **accumulator_options):
+    accumulator = ConfusionAccumulator(**accumulator_options)
+    for start in range(0, len(df), chunk_rows):
+        accumulator.update(df.iloc[start:start + chunk_rows])
+    return accumulator
+
+
+def has_outcomes(df):
+    return "reoffended" in df.columns and df["reoffended"].notna().any()
+
+
+def cached_outcome_analysis(df):
+    return shared_cache().get(("outcomes", population_key(df)), lambda: analyze_outcomes(df))
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from engine.cache import population_key, shared_cache
+
+SENSITIVE_ATTRIBUTES = ("ethnicity", "gender")
+# Numeric columns with more distinct values than this are grouped into quantile bins
+MAX_CATEGORIES = 100
+NBR_QUANTILE_BINS = 10
+
+
+# Integer category codes of a column (-1 for missing values) and the number of categories
+def category_codes(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), len(column.cat.categories)
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column) and len(uniques) > MAX_CATEGORIES:
+        values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+        edges = np.unique(np.nanquantile(values, np.linspace(0, 1, NBR_QUANTILE_BINS + 1)[1:-1]))
+        codes = np.where(np.isnan(values), -1, np.searchsorted(edges, values, side="right"))
+        return codes, len(edges) + 1
+    return codes, len(uniques)
+
+
+# Counts of every pair of categories, from a single bincount over the combined codes
+def contingency_table(codes_a, size_a, codes_b, size_b):
+    keep = (codes_a >= 0) & (codes_b >= 0)
+    combined = codes_a[keep].astype(np.intp) * size_b + codes_b[keep]
+    return np.bincount(combined, minlength=size_a * size_b).reshape(size_a, size_b)
+
+
+def mutual_information(table):
+    joint = table / table.sum()
+    expected = joint.sum(axis=1, keepdims=True) * joint.sum(axis=0, keepdims=True)
+    present = joint > 0
+    return float((joint[present] * np.log2(joint[present] / expected[present])).sum())
+
+
+def cramers_v(table):
+    # Categories that never occur do not count as rows or columns of the table
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    if min(table.shape) < 2:
+        return 0.0
+    total = table.sum()
+    expected = table.sum(axis=1, keepdims=True) * table.sum(axis=0, keepdims=True) / total
+    chi2 = ((table - expected) ** 2 / expected).sum()
+    return float(np.sqrt(chi2 / total / (min(table.shape) - 1)))
+
+
+# Mutual information (bits) and Cramér's V between every column and each sensitive attribute
+def proxy_report(df, sensitive=SENSITIVE_ATTRIBUTES, ignore=("name",)):
+    codes = {name: category_codes(df[name]) for name in df.columns if name not in ignore}
+    rows = {}
+    for feature, (feature_codes, feature_size) in codes.items():
+        if feature in sensitive:
+            continue
+        row = {}
+        for attribute in sensitive:
+            if attribute not in codes:
+                continue
+            table = contingency_table(feature_codes, feature_size, *codes[attribute])
+            row[(attribute, "mutual_information")] = mutual_information(table)
+            row[(attribute, "cramers_v")] = cramers_v(table)
+        rows[feature] = row
+    report = pd.DataFrame.from_dict(rows, orient="index")
+    report.columns = pd.MultiIndex.from_tuples(report.columns)
+    return report
+
+
+def cached_proxy_report(df):
+    return shared_cache().get(("proxies", population_key(df)), lambda: proxy_report(df))
@@ -0,0 +1,49 @@
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+POSTCODE_AREAS_CSV = Path(__file__).resolve().parent.parent / "data" / "postcodes" / "swiss_postcode_areas.csv"
+NBR_POSTCODES = 10000
+
+# Areas where at least this share of the residents are foreign nationals count as "high share" in the scoring rules
+HIGH_FOREIGN_SHARE = 0.3
+
+
+# Share of foreign residents for every possible postcode, built once from the bundled table so that looking up
+# a whole population is a single array indexing operation. The extra last entry (NaN) stands for unknown postcodes.
+@lru_cache(maxsize=None)
+def foreign_share_index(csv_path=POSTCODE_AREAS_CSV):
+    areas = pd.read_csv(csv_path)
+    index = np.full(NBR_POSTCODES + 1, np.nan)
+    for start, stop, share in zip(areas["postcode_from"], areas["postcode_to"], areas["foreign_share"]):
+        index[start:stop + 1] = share
+    index.flags.writeable = False
+    return index
+
+
+def postcode_positions(zip_codes):
+    column = pd.Series(zip_codes)
+    codes = column.to_numpy(dtype=np.int32, na_value=-1) if column.hasnans else column.to_numpy(dtype=np.int32)
+    return np.where((codes >= 0) & (codes < NBR_POSTCODES), codes, NBR_POSTCODES)
+
+
+def foreign_shares(zip_codes):
+    return foreign_share_index().take(postcode_positions(zip_codes))
+
+
+def in_high_share_area(zip_codes):
+    return foreign_shares(zip_codes) >= HIGH_FOREIGN_SHARE
+
+
+def is_high_share_postcode(zip_code):
+    return bool(in_high_share_area([zip_code])[0])
+
+
+# Known postcodes in high-share or low-share areas, used to give simulated profiles a plausible ZIP code
+@lru_cache(maxsize=None)
+def postcodes_by_share(high):
+    index = foreign_share_index()[:NBR_POSTCODES]
+    known = ~np.isnan(index)
+    return np.flatnonzero(known & ((index >= HIGH_FOREIGN_SHARE) == high)).astype(np.int16)
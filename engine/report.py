@@ -0,0 +1,170 @@
+import html
+import json
+import math
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from engine.data import read_population
+from engine.interventions import apply_intervention
+from engine.lookup import table_key
+from engine.outcomes import analyze_outcomes, has_outcomes
+from engine.proxies import proxy_report
+from engine.scoring import BUCKET_NAMES, mask_features
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ border: 1px solid #ccc; padding: 0.3em 0.6em; text-align: right; }}
+th {{ background: #f0f0f0; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+"""
+
+
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    yield
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+# Scores a profile file with every toggle mask and collects its fairness metrics, error rates and proxies.
+# `table` is an exported scoring table to use instead of the rules of the app.
+def dataset_report(path, masks, intervention="none", table=None):
+    timings = {}
+    with timed(timings, "load"):
+        df = read_population(path)
+
+    with timed(timings, "score"):
+        results = {mask: apply_intervention(df, mask, intervention, table) for mask in masks}
+
+    outcomes = {}
+    if has_outcomes(df):
+        with timed(timings, "outcomes"):
+            accumulator = analyze_outcomes(df, masks=masks, table=table)
+            outcomes = {mask: accumulator.report(mask).to_dict(orient="index") for mask in masks}
+
+    with timed(timings, "proxies"):
+        proxies = proxy_report(df)
+
+    return {
+        "dataset": Path(path).name,
+        "profiles": len(df),
+        "intervention": intervention,
+        "scoring_table": "rules" if table is None else table_key(table),
+        "masks": [{
+            "mask": mask,
+            "features": mask_features(mask),
+            "used_features": mask_features(result.mask),
+            "buckets": dict(zip(BUCKET_NAMES, np.bincount(result.scored.bucket, minlength=3).tolist())),
+            "before": result.before,
+            "after": result.after,
+            "outcomes": outcomes.get(mask, {}),
+        } for mask, result in results.items()],
+        "proxies": {feature: {attribute: dict(proxies.loc[feature, attribute]) for attribute in proxies.columns.levels[0]}
+                    for feature in proxies.index},
+        "timings": timings,
+    }
+
+
+# NaN becomes null and NumPy numbers become plain numbers, so reports are valid JSON
+def _json_ready(value):
+    if isinstance(value, dict):
+        return {str(key): _json_ready(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_ready(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def write_json(report, path):
+    with open(path, "w") as file:
+        json.dump(_json_ready(report), file, indent=2)
+
+
+def _table(df, **options):
+    return df.to_html(float_format=lambda value: f"{value:.3f}", na_rep="–", border=0, **options)
+
+
+# One row per toggle mask with the high-risk rates of both groups before and after the intervention
+def mask_summary(report):
+    rows = []
+    for entry in report["masks"]:
+        row = {"mask": entry["mask"], "features": " + ".join(entry["features"]) or "none"}
+        row.update(entry["buckets"])
+        row["high_risk_other"] = entry["after"]["high_risk_other"]
+        row["high_risk_swiss"] = entry["after"]["high_risk_swiss"]
+        row["gap_before"] = entry["before"]["high_risk_gap"]
+        row["gap_after"] = entry["after"]["high_risk_gap"]
+        if "false_positive_gap" in entry["after"]:
+            row["false_positive_gap"] = entry["after"]["false_positive_gap"]
+        rows.append(row)
+    return pd.DataFrame(rows).set_index("mask")
+
+
+def render_html(report):
+    parts = [
+        f"<p>{report['profiles']} profiles, intervention: {html.escape(report['intervention'])}, "
+        f"scoring table: {html.escape(report['scoring_table'])}</p>",
+        "<h2>High-risk rates per toggle mask</h2>",
+        "<p>Rates are shares of each group (non-Swiss and Swiss) rated high-risk, gaps are in percentage points.</p>",
+        _table(mask_summary(report)),
+    ]
+    for entry in report["masks"]:
+        if entry["outcomes"]:
+            parts.append(f"<h2>Error rates with {html.escape(' + '.join(entry['features']) or 'no features')}</h2>")
+            parts.append(_table(pd.DataFrame.from_dict(entry["outcomes"], orient="index")))
+    proxies = pd.DataFrame({(feature, attribute): values for feature, by_attribute in report["proxies"].items()
+                            for attribute, values in by_attribute.items()}).T.unstack()
+    parts += ["<h2>Proxies of the sensitive attributes</h2>", _table(proxies)]
+    timings = pd.Series(report["timings"], name="seconds").to_frame()
+    parts += ["<h2>Timings</h2>", _table(timings)]
+    return PAGE_TEMPLATE.format(title=html.escape(f"Fairness report: {report['dataset']}"), body="\n".join(parts))
+
+
+def write_html(report, path):
+    Path(path).write_text(render_html(report), encoding="utf-8")
+
+
+# Builds the report of one file and writes it in the requested formats, this is what the batch workers run
+def build_report(path, out_dir, masks, intervention="none", formats=("html", "json"), table=None):
+    report = dataset_report(path, masks, intervention, table)
+    with timed(report["timings"], "write"):
+        stem = Path(out_dir) / Path(path).stem
+        if "json" in formats:
+            write_json(report, stem.with_suffix(".json"))
+        if "html" in formats:
+            write_html(report, stem.with_suffix(".html"))
+    return report
+
+
+# Overview of all datasets, linking to their own reports
+def render_index(reports, formats=("html", "json")):
+    rows = []
+    for report in reports:
+        summary = mask_summary(report).reset_index()
+        summary.insert(0, "profiles", report["profiles"])
+        link = Path(report["dataset"]).stem + ".html"
+        name = f'<a href="{html.escape(link)}">{html.escape(report["dataset"])}</a>' if "html" in formats else html.escape(report["dataset"])
+        summary.insert(0, "dataset", name)
+        rows.append(summary)
+    table = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
+    body = _table(table, index=False, escape=False)
+    return PAGE_TEMPLATE.format(title="Fairness reports", body=body)
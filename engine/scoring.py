@@ -0,0 +1,201 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from engine.regions import in_high_share_area, is_high_share_postcode
+
+# ---------- Features ----------
+# Same order as the toggles on the app page, bit i of a toggle mask enables FEATURES[i]
+FEATURES = ("gender", "ethnicity", "encounters", "convictions", "age", "zip_code")
+NBR_MASKS = 1 << len(FEATURES)
+
+# Risk buckets shown on the cards (low in blue, medium in yellow, high in red)
+LOW, MEDIUM, HIGH = 0, 1, 2
+BUCKET_NAMES = ("low", "medium", "high")
+BUCKET_EDGES = (33, 66)
+
+ScoredPopulation = namedtuple("ScoredPopulation", ["score", "max_score", "percent", "bucket"])
+
+# Weights of the rules: multipliers of non-Swiss and young people, age under which people count as young, and
+# the numbers of encounters and convictions from which they add two points instead of one
+Weights = namedtuple("Weights", ["ethnicity_factor", "age_factor", "age_threshold", "encounters_high", "convictions_high"])
+DEFAULT_WEIGHTS = Weights(ethnicity_factor=1.2, age_factor=2.5, age_threshold=25, encounters_high=10, convictions_high=5)
+
+
+def toggle_mask(**enabled):
+    mask = 0
+    for name, use in enabled.items():
+        if use:
+            mask |= 1 << FEATURES.index(name)
+    return mask
+
+
+def uses(mask, feature):
+    return bool(mask & (1 << FEATURES.index(feature)))
+
+
+# A toggle mask given as a number, as feature names joined with "+" (e.g. "encounters+convictions") or as "all"
+def parse_mask(text):
+    if text == "all":
+        return NBR_MASKS - 1
+    if text.isdigit():
+        mask = int(text)
+        if mask >= NBR_MASKS:
+            raise ValueError(f"Toggle masks go from 0 to {NBR_MASKS - 1}: {text}")
+        return mask
+    unknown = [name for name in text.split("+") if name not in FEATURES]
+    if unknown:
+        raise ValueError(f"Unknown features {unknown}, expected some of {FEATURES}")
+    return toggle_mask(**{name: True for name in text.split("+")})
+
+
+def mask_features(mask):
+    return [feature for feature in FEATURES if uses(mask, feature)]
+
+
+# ---------- Scoring logic (one profile) ----------
+def calculate_recidivism_score(*, nbr_encounter_police=None, nbr_prior_convictions=None, age=None, gender=None, ethnicity=None, zip_code=None):
+    score = 0
+
+    # Encounters with police
+    if nbr_encounter_police is not None:
+        if nbr_encounter_police == 0:
+            pass
+        elif 0 < nbr_encounter_police < 10:
+            score += 1
+        elif nbr_encounter_police >= 10:
+            score += 2
+
+    # Prior convictions
+    if nbr_prior_convictions is not None:
+        if nbr_prior_convictions == 1:
+            pass
+        elif 1 < nbr_prior_convictions < 5:
+            score += 1
+        elif nbr_prior_convictions >= 5:
+            score += 2
+
+    if gender is not None and gender == "M":
+        score += 1
+
+    # Living in an area with a high share of foreign residents
+    if zip_code is not None and is_high_share_postcode(zip_code):
+        score += 1
+
+    if ethnicity is not None and ethnicity == "Other":
+        if score == 0:
+            score = 1
+        score *= 1.2
+
+    # Age multiplier
+    if age is not None and age < 25:
+        if score == 0:
+            score = 1
+        score *= 2.5
+
+    return float(score)
+
+
+def max_possible_score_for_row(row, use_encounters, use_convictions, use_age, use_ethnicity, use_gender, use_zip_code=False):
+    # Worst-case inputs for enabled features, keeping the person's actual age for the age rule
+    worst_encounters = 2 if use_encounters else 0
+    worst_convictions = 2 if use_convictions else 0
+    worst_gender = 1 if use_gender else 0
+    worst_zip_code = 1 if use_zip_code else 0
+    base = worst_encounters + worst_convictions + worst_gender + worst_zip_code
+    if use_age and row["age"] < 25:
+        if base == 0:
+            base = 1
+        base *= 2.5
+    if use_ethnicity and row['ethnicity'] == "Other":
+        if base == 0:
+            base = 1
+        base *= 1.2
+    return float(base)
+
+
+# ---------- Scoring logic (whole population at once) ----------
+# Boolean array telling which rows hold the given label, using the category codes when possible
+def label_flags(column, label):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        categories = column.cat.categories
+        if label not in categories:
+            return np.zeros(len(column), dtype=bool)
+        return column.cat.codes.to_numpy() == categories.get_loc(label)
+    return column.to_numpy() == label
+
+
+# The columns the rules look at, as plain NumPy arrays
+def profile_arrays(df):
+    return {
+        "encounters": df["encounters"].to_numpy(),
+        "convictions": df["convictions"].to_numpy(),
+        "age": df["age"].to_numpy(),
+        "is_male": label_flags(df["gender"], "M"),
+        "is_other": label_flags(df["ethnicity"], "Other"),
+        "high_foreign_share": in_high_share_area(df["zip_code"]) if "zip_code" in df.columns else np.zeros(len(df), dtype=bool),
+    }
+
+
+# "if score == 0: score = 1" followed by "score *= factor", in place and only for the selected rows.
+# Scores are never between 0 and 1, so raising them to at least 1 is the same as replacing 0 by 1.
+def _apply_multiplier(score, rows, factor):
+    np.maximum(score, 1, out=score, where=rows)
+    np.multiply(score, factor, out=score, where=rows)
+
+
+# Same rules as calculate_recidivism_score, applied to every profile with array operations. The weights can be
+# arrays broadcast against the profiles (e.g. one row per weight setting), the result then has the broadcast shape.
+def score_arrays(arrays, mask, weights=DEFAULT_WEIGHTS):
+    encounters = arrays["encounters"]
+    score = np.zeros(np.broadcast_shapes(encounters.shape, *map(np.shape, weights)), dtype=np.float64)
+
+    if uses(mask, "encounters"):
+        np.add(score, encounters > 0, out=score)
+        np.add(score, encounters >= weights.encounters_high, out=score)
+    if uses(mask, "convictions"):
+        convictions = arrays["convictions"]
+        np.add(score, convictions > 1, out=score)
+        np.add(score, convictions >= weights.convictions_high, out=score)
+    if uses(mask, "gender"):
+        np.add(score, arrays["is_male"], out=score)
+    if uses(mask, "zip_code"):
+        np.add(score, arrays["high_foreign_share"], out=score)
+    if uses(mask, "ethnicity"):
+        _apply_multiplier(score, arrays["is_other"], weights.ethnicity_factor)
+    if uses(mask, "age"):
+        _apply_multiplier(score, arrays["age"] < weights.age_threshold, weights.age_factor)
+    return score
+
+
+# Same rules as max_possible_score_for_row, applied to every profile with array operations
+def max_score_arrays(arrays, mask, weights=DEFAULT_WEIGHTS):
+    base = 2 * uses(mask, "encounters") + 2 * uses(mask, "convictions") + uses(mask, "gender") + uses(mask, "zip_code")
+    max_score = np.full(np.broadcast_shapes(arrays["encounters"].shape, *map(np.shape, weights)), base, dtype=np.float64)
+    if uses(mask, "age"):
+        _apply_multiplier(max_score, arrays["age"] < weights.age_threshold, weights.age_factor)
+    if uses(mask, "ethnicity"):
+        _apply_multiplier(max_score, arrays["is_other"], weights.ethnicity_factor)
+    return max_score
+
+
+def score_percent(score, max_score):
+    percent = np.divide(score, max_score, out=np.zeros_like(score), where=max_score != 0)
+    np.multiply(percent, 100.0, out=percent)
+    return np.round(percent, 1, out=percent)
+
+
+def risk_buckets(percent):
+    return np.digitize(percent, BUCKET_EDGES).astype(np.int8)
+
+
+def score_population(df, mask):
+    return score_profile_arrays(profile_arrays(df), mask)
+
+
+def score_profile_arrays(arrays, mask, weights=DEFAULT_WEIGHTS):
+    score = score_arrays(arrays, mask, weights)
+    max_score = max_score_arrays(arrays, mask, weights)
+    percent = score_percent(score, max_score)
+    return ScoredPopulation(score, max_score, percent, risk_buckets(percent))
@@ -0,0 +1,140 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from engine.cache import population_key, shared_cache
+from engine.fairness import disparity
+from engine.lookup import IS_OTHER_CELL, NBR_CELLS, cell_index, cell_profiles
+from engine.scoring import DEFAULT_WEIGHTS, HIGH, Weights, max_score_arrays, parse_mask, profile_arrays, risk_buckets, score_arrays, score_percent
+from engine.simulation import DEFAULT_MASK, sample_profiles
+
+# Sensitivity of the disparity to the weights of the rules, over a full grid of weight settings. The grid
+# contains the default weights.
+GRID = {
+    "ethnicity_factor": np.round(np.linspace(1.0, 2.0, 11), 2),
+    "age_factor": np.round(np.linspace(1.0, 4.0, 13), 2),
+    "age_threshold": np.arange(18, 36),
+    "encounters_high": np.arange(2, 21),
+    "convictions_high": np.arange(2, 11),
+}
+# The thresholds decide which of the 144 cells of engine.lookup a profile falls into, the multipliers only the
+# scores of the cells
+THRESHOLDS = ("age_threshold", "encounters_high", "convictions_high")
+MULTIPLIERS = ("ethnicity_factor", "age_factor")
+# Memory for the cells of a chunk of profiles under every combination of thresholds
+MEMORY_CAP_MB = 256
+METRICS = ("high_risk_other", "high_risk_swiss", "high_risk_gap", "high_risk_ratio", "false_positive_gap")
+
+
+# Profiles the grid cannot tell apart are counted once: counts above the highest thresholds and ages outside
+# the range of age thresholds are clipped before looking for distinct profiles
+def distinct_profiles(arrays, reoffended, grid):
+    ages = grid["age_threshold"]
+    columns = {
+        "encounters": np.minimum(arrays["encounters"], grid["encounters_high"].max()).astype(np.int64),
+        "convictions": np.minimum(arrays["convictions"], grid["convictions_high"].max()).astype(np.int64),
+        "age": np.clip(arrays["age"], ages.min() - 1, ages.max()).astype(np.int64),
+    }
+    flags = sum(values.astype(np.int64) << bit for bit, values in enumerate((arrays["is_male"], arrays["is_other"], arrays["high_foreign_share"], reoffended)))
+    key = ((columns["encounters"] * (grid["convictions_high"].max() + 1) + columns["convictions"]) * (ages.max() + 1) + columns["age"]) * 16 + flags
+    _, first, counts = np.unique(key, return_index=True, return_counts=True)
+    distinct = {name: values[first] for name, values in columns.items()}
+    distinct.update({name: arrays[name][first] for name in ("is_male", "is_other", "high_foreign_share")})
+    return distinct, reoffended[first], counts
+
+
+# Number of profiles per threshold combination, cell and outcome (did not reoffend, reoffended). Every threshold
+# gets its own axis and the profiles the last one, so all combinations are binned at once, a chunk of profiles
+# at a time.
+def threshold_cell_counts(arrays, reoffended, counts, grid, memory_mb=MEMORY_CAP_MB):
+    shape = [len(grid[name]) for name in THRESHOLDS]
+    axes = {name: grid[name].reshape([-1 if i == axis else 1 for i in range(len(shape))] + [1]) for axis, name in enumerate(THRESHOLDS)}
+    thresholds = DEFAULT_WEIGHTS._replace(**axes)
+    combinations = int(np.prod(shape))
+    # About 32 bytes per combination and profile: the cells (uint8), their flat index (int64), the profile counts
+    # (float64) and temporaries
+    chunk = max(1, int(memory_mb * 1e6 // (combinations * 32)))
+    offsets = (np.arange(combinations, dtype=np.int64) * NBR_CELLS * 2).reshape(shape + [1])
+    totals = np.zeros(combinations * NBR_CELLS * 2)
+    for start in range(0, len(counts), chunk):
+        part = {name: values[start:start + chunk] for name, values in arrays.items()}
+        index = offsets + cell_index(part, thresholds).astype(np.int64) * 2 + reoffended[start:start + chunk]
+        totals += np.bincount(index.ravel(), np.broadcast_to(counts[start:start + chunk], index.shape).ravel(), minlength=len(totals))
+    return totals.reshape(combinations, NBR_CELLS, 2)
+
+
+# High-risk flag of every cell for every combination of multipliers: (multiplier combinations, cells)
+def multiplier_high_risk(mask, grid):
+    profiles = cell_profiles()
+    factors = DEFAULT_WEIGHTS._replace(ethnicity_factor=grid["ethnicity_factor"][:, None, None], age_factor=grid["age_factor"][None, :, None])
+    percent = score_percent(score_arrays(profiles, mask, factors), max_score_arrays(profiles, mask, factors))
+    return (risk_buckets(percent) == HIGH).reshape(-1, NBR_CELLS)
+
+
+# Disparity of the population for every weight setting of the grid, one row per setting
+def weight_sensitivity(df, mask=DEFAULT_MASK, grid=None, memory_mb=MEMORY_CAP_MB):
+    grid = {name: np.asarray(values) for name, values in (grid or GRID).items()}
+    reoffended = df["reoffended"].fillna(False).to_numpy(dtype=bool) if "reoffended" in df.columns else np.zeros(len(df), dtype=bool)
+    arrays, reoffended, counts = distinct_profiles(profile_arrays(df), reoffended, grid)
+    cells = threshold_cell_counts(arrays, reoffended, counts, grid, memory_mb)
+    high = multiplier_high_risk(mask, grid).T.astype(np.float64)
+
+    # High-risk profiles of every (threshold combination, multiplier combination), per group
+    rates = {}
+    for group, in_group in (("other", IS_OTHER_CELL), ("swiss", ~IS_OTHER_CELL)):
+        group_cells = cells[:, in_group]
+        rates[group] = group_cells.sum(axis=2) @ high[in_group] / group_cells[0].sum()
+        # Among the people who did not reoffend
+        rates[f"fp_{group}"] = group_cells[:, :, 0] @ high[in_group] / group_cells[0, :, 0].sum()
+    gap, ratio = disparity(rates["other"], rates["swiss"])
+
+    settings = pd.MultiIndex.from_product([grid[name] for name in THRESHOLDS + MULTIPLIERS], names=THRESHOLDS + MULTIPLIERS)
+    results = pd.DataFrame({
+        "high_risk_other": rates["other"].ravel(),
+        "high_risk_swiss": rates["swiss"].ravel(),
+        "high_risk_gap": gap.ravel(),
+        "high_risk_ratio": ratio.ravel(),
+        "false_positive_gap": disparity(rates["fp_other"], rates["fp_swiss"])[0].ravel(),
+    }, index=settings).reset_index()
+    return results[list(Weights._fields) + list(METRICS)]
+
+
+def cached_sensitivity(df, mask=DEFAULT_MASK):
+    return shared_cache().get(("weight_sensitivity", population_key(df), mask), lambda: weight_sensitivity(df, mask))
+
+
+# Values of `metric` over two weights, the other weights at their default values (or the ones in `fixed`)
+def heatmap_data(results, x, y, metric="high_risk_gap", fixed=None):
+    fixed = dict(DEFAULT_WEIGHTS._asdict(), **(fixed or {}))
+    rows = np.ones(len(results), dtype=bool)
+    for name, value in fixed.items():
+        if name not in (x, y):
+            rows &= np.isclose(results[name].to_numpy(), value)
+    return results.loc[rows, list(dict.fromkeys([x, y, metric]))].reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Disparity of the scoring system over a grid of weight settings.")
+    parser.add_argument("--profiles", type=int, default=20000, help="size of the simulated population")
+    parser.add_argument("--oversampling", type=float, default=2.0, help="extra police checks of non-Swiss people")
+    parser.add_argument("--mask", default="all", help="toggle mask, as a number, feature names joined with + or all")
+    parser.add_argument("--memory-mb", type=float, default=MEMORY_CAP_MB)
+    parser.add_argument("--out", help="CSV or Parquet file for the metrics of every weight setting")
+    args = parser.parse_args(argv)
+
+    df = sample_profiles(args.oversampling, args.profiles)
+    started = time.perf_counter()
+    results = weight_sensitivity(df, parse_mask(args.mask), memory_mb=args.memory_mb)
+    seconds = time.perf_counter() - started
+    if args.out:
+        results.to_parquet(args.out, index=False) if args.out.endswith(".parquet") else results.to_csv(args.out, index=False)
+    for name in Weights._fields:
+        # How far the gap moves when only this weight changes
+        print(heatmap_data(results, name, name).groupby(name)["high_risk_gap"].first().round(1).to_frame().T.to_string())
+    print(f"{len(results):,} weight settings x {len(df):,} profiles in {seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import numpy as np
+import tornado.web
+
+from engine.data import REQUIRED_COLUMNS
+from engine.lookup import cell_index, compiled_table, lookup_scores
+from engine.regions import in_high_share_area
+from engine.scoring import BUCKET_NAMES, parse_mask
+
+# Profile columns used by the scoring rules besides the required ones
+OPTIONAL_COLUMNS = ("zip_code",)
+
+
+# Columns of the profiles of a request, sent either as a list of records or as a dict of equally long lists
+def parse_profiles(body):
+    profiles = body.get("profiles")
+    if isinstance(profiles, list):
+        # Every profile needs the required columns, the optional ones can be left out of some profiles
+        missing = [name for name in REQUIRED_COLUMNS if not all(name in profile for profile in profiles)]
+        names = REQUIRED_COLUMNS + tuple(name for name in OPTIONAL_COLUMNS if any(name in profile for profile in profiles))
+        columns = {name: [profile.get(name) for profile in profiles] for name in names}
+    elif isinstance(profiles, dict):
+        columns = {name: list(profiles[name]) for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if name in profiles}
+        missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    else:
+        raise ValueError("'profiles' must be a list of profiles or a dict of columns")
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("All columns must have the same length")
+    return columns, lengths.pop()
+
+
+# Same arrays as profile_arrays, built straight from the JSON lists: going through a DataFrame would cost more
+# than scoring a batch of a few thousand profiles
+def request_arrays(columns):
+    nbr_rows = len(columns["age"])
+    zip_codes = columns.get("zip_code")
+    return {
+        "encounters": np.asarray(columns["encounters"], dtype=np.int16),
+        "convictions": np.asarray(columns["convictions"], dtype=np.int16),
+        "age": np.asarray(columns["age"], dtype=np.int16),
+        "is_male": np.asarray(columns["gender"], dtype=object) == "M",
+        "is_other": np.asarray(columns["ethnicity"], dtype=object) == "Other",
+        "high_foreign_share": in_high_share_area(zip_codes) if zip_codes is not None else np.zeros(nbr_rows, dtype=bool),
+    }
+
+
+def score_columns(columns, mask, table):
+    return lookup_scores(table, cell_index(request_arrays(columns)), mask)
+
+
+def _response(scored, start=0, stop=None):
+    return {
+        "score": scored.score[start:stop].tolist(),
+        "max_score": scored.max_score[start:stop].tolist(),
+        "percent": scored.percent[start:stop].tolist(),
+        "bucket": np.asarray(BUCKET_NAMES)[scored.bucket[start:stop]].tolist(),
+    }
+
+
+# Requests arriving within `max_delay` seconds of each other with the same toggle mask are scored together, so
+# many small requests cost one vectorized pass instead of one pandas conversion each. Everything runs on the
+# event loop thread, so the queues need no lock.
+class MicroBatcher:
+    def __init__(self, max_delay=0.002, max_rows=50_000, table=None):
+        self.table = compiled_table() if table is None else table
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self._pending = {}
+
+    def score(self, columns, nbr_rows, mask):
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        queue = self._pending.setdefault(mask, [])
+        queue.append((columns, nbr_rows, future))
+        if sum(size for _, size, _ in queue) >= self.max_rows:
+            self.flush(mask)
+        elif len(queue) == 1:
+            asyncio.get_running_loop().call_later(self.max_delay, self.flush, mask)
+        return future
+
+    def flush(self, mask):
+        queue = self._pending.pop(mask, None)
+        if not queue:
+            return
+        self.batches += 1
+        self.rows += sum(size for _, size, _ in queue)
+        names = {name for columns, _, _ in queue for name in columns}
+        merged = {name: [value for columns, size, _ in queue for value in columns.get(name, [None] * size)] for name in names}
+        try:
+            scored = score_columns(merged, mask, self.table)
+        except (ValueError, TypeError, OverflowError):
+            # One bad request must not fail the others, score them one by one to find it
+            for columns, _, future in queue:
+                try:
+                    future.set_result(_response(score_columns(columns, mask, self.table)))
+                except (ValueError, TypeError, OverflowError) as error:
+                    future.set_exception(ValueError(str(error)))
+            return
+        start = 0
+        for _, size, future in queue:
+            future.set_result(_response(scored, start, start + size))
+            start += size
+
+    def stats(self):
+        return {"requests": self.requests, "batches": self.batches, "rows": self.rows, "pending": len(self._pending)}
+
+
+class ScoreHandler(tornado.web.RequestHandler):
+    def initialize(self, batcher):
+        self.batcher = batcher
+
+    def _error(self, message):
+        self.set_status(400)
+        self.finish({"error": message})
+
+    async def post(self):
+        try:
+            body = json.loads(self.request.body)
+            mask = parse_mask(str(body.get("mask", 0)))
+            columns, nbr_rows = parse_profiles(body)
+        except (ValueError, TypeError, AttributeError) as error:
+            return self._error(str(error))
+        try:
+            result = await self.batcher.score(columns, nbr_rows, mask)
+        except ValueError as error:
+            return self._error(str(error))
+        self.finish(result)
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, batcher):
+        self.batcher = batcher
+
+    def get(self):
+        self.finish(self.batcher.stats())
+
+
+def make_app(max_delay=0.002, max_rows=50_000, table=None):
+    batcher = MicroBatcher(max_delay, max_rows, table)
+    return tornado.web.Application([
+        (r"/score", ScoreHandler, {"batcher": batcher}),
+        (r"/stats", StatsHandler, {"batcher": batcher}),
+    ])
@@ -0,0 +1,100 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from engine.cache import shared_cache
+from engine.data import to_profile_schema
+from engine.fairness import disparity, group_rates, high_risk_rates
+from engine.regions import postcodes_by_share
+from engine.scoring import HIGH, max_score_arrays, risk_buckets, score_arrays, score_percent, toggle_mask
+
+DEFAULT_MASK = toggle_mask(encounters=True, convictions=True)
+CHUNK_SIZE = 250
+
+
+# Populations (replications x profiles) in which everybody reoffends at the same rate, but non-Swiss
+# people are checked by the police `oversampling` times more often, so they accumulate more encounters.
+# Non-Swiss people also live more often in areas with a high share of foreign residents.
+def biased_populations(rng, replications, nbr_profiles, oversampling, other_share, reoffense_rate):
+    shape = (replications, nbr_profiles)
+    is_other = rng.random(shape) < other_share
+    reoffended = rng.random(shape) < reoffense_rate
+    encounter_rate = np.where(reoffended, 6.0, 3.0) * np.where(is_other, oversampling, 1.0)
+    return {
+        "encounters": rng.poisson(encounter_rate).astype(np.int16),
+        "convictions": rng.poisson(np.where(reoffended, 2.5, 1.0)).astype(np.int16),
+        "age": rng.integers(18, 70, shape, dtype=np.int16),
+        "is_male": rng.random(shape) < 0.5,
+        "is_other": is_other,
+        "high_foreign_share": rng.random(shape) < np.where(is_other, 0.6, 0.3),
+        "reoffended": reoffended,
+    }
+
+
+# One simulated population with its outcomes, as plain arrays
+def sample_population(oversampling=2.0, nbr_profiles=20000, other_share=0.4, reoffense_rate=0.3, seed=0):
+    rng = np.random.default_rng(seed)
+    arrays = biased_populations(rng, 1, nbr_profiles, oversampling, other_share, reoffense_rate)
+    return {name: values[0] for name, values in arrays.items()}
+
+
+def _sample_postcodes(rng, high_foreign_share):
+    high, low = postcodes_by_share(True), postcodes_by_share(False)
+    return np.where(high_foreign_share, rng.choice(high, len(high_foreign_share)), rng.choice(low, len(high_foreign_share)))
+
+
+# The same simulated population in the profile schema, with its "reoffended" outcomes
+def sample_profiles(oversampling=2.0, nbr_profiles=20000, seed=0):
+    arrays = sample_population(oversampling, nbr_profiles, seed=seed)
+    df = to_profile_schema(pd.DataFrame({
+        "age": arrays["age"],
+        "ethnicity": pd.Categorical.from_codes(arrays["is_other"].astype(np.int8), ["Swiss", "Other"]),
+        "convictions": arrays["convictions"],
+        "encounters": arrays["encounters"],
+        "gender": pd.Categorical.from_codes(np.where(arrays["is_male"], 0, 1), ["M", "F", "N/S"]),
+        "zip_code": _sample_postcodes(np.random.default_rng(seed), arrays["high_foreign_share"]),
+        "reoffended": arrays["reoffended"],
+    }))
+    df.attrs["source_key"] = f"simulated:{oversampling}:{nbr_profiles}:{seed}"
+    return df
+
+
+# Disparity metrics of one chunk of replications, one value per replication
+def _simulate_chunk(seed, replications, nbr_profiles, oversampling, other_share, reoffense_rate, mask):
+    rng = np.random.default_rng(seed)
+    arrays = biased_populations(rng, replications, nbr_profiles, oversampling, other_share, reoffense_rate)
+    score = score_arrays(arrays, mask)
+    buckets = risk_buckets(score_percent(score, max_score_arrays(arrays, mask)))
+
+    high_other, high_swiss = high_risk_rates(buckets, arrays["is_other"])
+    # False positives: people flagged as high risk although they did not reoffend
+    fpr_other, fpr_swiss = group_rates(buckets == HIGH, arrays["is_other"], ~arrays["reoffended"])
+    high_gap, high_ratio = disparity(high_other, high_swiss)
+    fpr_gap, _ = disparity(fpr_other, fpr_swiss)
+    return {
+        "high_risk_other": high_other,
+        "high_risk_swiss": high_swiss,
+        "high_risk_gap": high_gap,
+        "high_risk_ratio": high_ratio,
+        "false_positive_gap": fpr_gap,
+    }
+
+
+# Monte Carlo runs of the scoring system on biased populations. Replications are processed in chunks of
+# CHUNK_SIZE populations at a time, each with its own seed, so the results do not depend on `workers`.
+def simulate_bias(oversampling=2.0, replications=1000, nbr_profiles=1000, other_share=0.4, reoffense_rate=0.3,
+                  mask=DEFAULT_MASK, seed=0, workers=1):
+    sizes = [min(CHUNK_SIZE, replications - start) for start in range(0, replications, CHUNK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(s, size, nbr_profiles, oversampling, other_share, reoffense_rate, mask) for s, size in zip(seeds, sizes)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(_simulate_chunk, *zip(*args)))
+    else:
+        chunks = [_simulate_chunk(*a) for a in args]
+    return {metric: np.concatenate([chunk[metric] for chunk in chunks]) for metric in chunks[0]}
+
+
+def cached_simulation(**params):
+    return shared_cache().get(("bias_simulation", tuple(sorted(params.items()))), lambda: simulate_bias(**params))
@@ -0,0 +1,166 @@
+import argparse
+import atexit
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Telemetry is off unless ALGODISC_TELEMETRY names the directory the event log is written to, and even then
+# only the sessions that opted in (session_state["telemetry_consent"]) are recorded. No profile data is logged,
+# only which toggles, languages and mitigations a random session id chose and when.
+TELEMETRY_ENV = "ALGODISC_TELEMETRY"
+CONSENT_KEY = "telemetry_consent"
+
+EVENT_SCHEMA = pa.schema([
+    ("time", pa.timestamp("us")),
+    ("session", pa.string()),
+    ("language", pa.string()),
+    ("name", pa.string()),
+    ("value", pa.string()),
+])
+
+
+# Events are appended to a bounded deque (atomic in CPython, so sessions never wait on a lock) and a background
+# thread writes them in batches as Parquet files. When the writer falls behind, the oldest events are dropped.
+class EventLog:
+    def __init__(self, directory, capacity=100_000, flush_seconds=5.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_seconds = flush_seconds
+        self.written = 0
+        self._buffer = deque(maxlen=capacity)
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._writer.start()
+
+    def append(self, session, language, name, value):
+        self._buffer.append((time.time(), session, language, name, str(value)))
+
+    def flush(self):
+        events = []
+        while True:
+            try:
+                events.append(self._buffer.popleft())
+            except IndexError:
+                break
+        if not events:
+            return 0
+        times, sessions, languages, names, values = zip(*events)
+        table = pa.table({
+            "time": (np.array(times) * 1e6).astype("datetime64[us]"),
+            "session": sessions,
+            "language": languages,
+            "name": names,
+            "value": values,
+        }, schema=EVENT_SCHEMA)
+        # One new file per batch, so the log is append-only and can be read while it is written
+        path = self.directory / f"events-{time.time_ns()}-{os.getpid()}.parquet"
+        pq.write_table(table, path, compression="zstd")
+        self.written += len(events)
+        return len(events)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._writer.join()
+        self.flush()
+
+
+_event_log = None
+_event_log_lock = threading.Lock()
+
+
+def shared_event_log():
+    global _event_log
+    directory = os.environ.get(TELEMETRY_ENV)
+    if not directory:
+        return None
+    with _event_log_lock:
+        if _event_log is None:
+            _event_log = EventLog(directory)
+            atexit.register(_event_log.close)
+        return _event_log
+
+
+def telemetry_enabled():
+    return bool(os.environ.get(TELEMETRY_ENV))
+
+
+# Records `value` when it differs from the previous value of `name` in this session, e.g. the toggle mask after a
+# rerun. Costs a few dictionary lookups when nothing changed, so it can be called on every rerun.
+def record_change(session_state, language, name, value):
+    if not session_state.get(CONSENT_KEY):
+        return
+    log = shared_event_log()
+    if log is None:
+        return
+    state_key = f"_telemetry_{name}"
+    if session_state.get(state_key) == value:
+        return
+    session_state[state_key] = value
+    if "_telemetry_session" not in session_state:
+        session_state["_telemetry_session"] = uuid.uuid4().hex[:16]
+    log.append(session_state["_telemetry_session"], language, name, value)
+
+
+# ---------- Offline aggregation ----------
+def read_events(directory, columns=None):
+    return ds.dataset(directory, format="parquet", schema=EVENT_SCHEMA).to_table(columns=columns)
+
+
+# Number of sessions that tried each value of `name` (e.g. every toggle mask), per language
+def popularity(events, name):
+    chosen = events.filter(pc.equal(events["name"], name))
+    counts = chosen.group_by(["language", "value"]).aggregate([("session", "count_distinct")])
+    return counts.rename_columns(["language", "value", "sessions"]).sort_by([("sessions", "descending")])
+
+
+# Duration (first to last event) and number of events of every session
+def session_summary(events):
+    sessions = events.group_by("session").aggregate([("time", "min"), ("time", "max"), ("time", "count")])
+    duration = pc.divide(pc.cast(pc.subtract(sessions["time_max"], sessions["time_min"]), pa.int64()), 1_000_000)
+    return pa.table({"session": sessions["session"], "seconds": duration, "events": sessions["time_count"]})
+
+
+# (language, toggle mask) pairs ordered by the number of sessions that tried them
+def popular_configurations(directory, top=None):
+    counts = popularity(read_events(directory, ["session", "language", "name", "value"]), "mask").to_pylist()
+    pairs = [(row["language"], int(row["value"])) for row in counts]
+    return pairs[:top] if top else pairs
+
+
+def aggregate(directory):
+    events = read_events(directory)
+    sessions = session_summary(events)
+    return {
+        "events": events.num_rows,
+        "sessions": sessions.num_rows,
+        "median_session_seconds": float(np.median(sessions["seconds"].to_numpy())) if sessions.num_rows else 0.0,
+        "languages": popularity(events, "language").to_pandas(),
+        "masks": popularity(events, "mask").to_pandas(),
+        "interventions": popularity(events, "intervention").to_pandas(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the telemetry event log.")
+    parser.add_argument("directory")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    summary = aggregate(args.directory)
+    print(f"{summary['events']} events from {summary['sessions']} sessions, "
+          f"median session {summary['median_session_seconds']:.0f}s")
+    for name in ("languages", "masks", "interventions"):
+        print(f"\nMost chosen {name}:")
+        print(summary[name].head(args.top).to_string(index=False))
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from engine.cache import shared_cache
+from engine.fairness import _ratio
+from engine.scoring import max_score_arrays, score_arrays, score_percent
+from engine.simulation import sample_population
+
+
+# Group-wise statistics for every possible cut point "high risk if percent >= threshold", from a single
+# sort of the scores and cumulative sums, instead of re-bucketing the population once per threshold.
+# `groups` maps a group name to a boolean array, `labels` (optional) tells who actually reoffended.
+def threshold_sweep(percent, groups, labels=None):
+    order = np.argsort(-percent, kind="stable")
+    sorted_percent = percent[order]
+    # Last position of each distinct score: everybody up to it is flagged when the threshold is that score
+    last = np.r_[np.flatnonzero(sorted_percent[1:] != sorted_percent[:-1]), len(sorted_percent) - 1]
+    thresholds = np.r_[np.inf, sorted_percent[last]]
+
+    frames = []
+    for name, in_group in groups.items():
+        members = in_group[order]
+        stats = {"group": name, "threshold": thresholds}
+        flagged = np.r_[0, np.cumsum(members)[last]]
+        stats["high_risk_rate"] = _ratio(flagged, members.sum())
+        if labels is not None:
+            reoffended = labels[order]
+            true_positives = np.r_[0, np.cumsum(members & reoffended)[last]]
+            false_positives = flagged - true_positives
+            stats["true_positive_rate"] = _ratio(true_positives, (members & reoffended).sum())
+            stats["false_positive_rate"] = _ratio(false_positives, (members & ~reoffended).sum())
+            stats["precision"] = _ratio(true_positives, flagged)
+        frames.append(pd.DataFrame(stats))
+    return pd.concat(frames, ignore_index=True)
+
+
+# Observed reoffense rate against the mean score, per group and per score bin of `bin_width` percent
+def calibration_curve(percent, groups, labels, bin_width=10):
+    bins = np.minimum(percent // bin_width, 100 // bin_width - 1).astype(np.intp)
+    nbr_bins = 100 // bin_width
+    frames = []
+    for name, in_group in groups.items():
+        counts = np.bincount(bins[in_group], minlength=nbr_bins)
+        frames.append(pd.DataFrame({
+            "group": name,
+            "mean_percent": _ratio(np.bincount(bins[in_group], weights=percent[in_group], minlength=nbr_bins), counts),
+            "reoffense_rate": _ratio(np.bincount(bins[in_group], weights=labels[in_group], minlength=nbr_bins), counts),
+            "profiles": counts,
+        }))
+    return pd.concat(frames, ignore_index=True).dropna()
+
+
+# Threshold sweep and calibration of the scoring system on a simulated population with known outcomes
+def simulated_threshold_analysis(oversampling, mask):
+    def compute():
+        arrays = sample_population(oversampling)
+        percent = score_percent(score_arrays(arrays, mask), max_score_arrays(arrays, mask))
+        groups = {"Other": arrays["is_other"], "Swiss": ~arrays["is_other"]}
+        return threshold_sweep(percent, groups, arrays["reoffended"]), calibration_curve(percent, groups, arrays["reoffended"])
+    return shared_cache().get(("threshold_analysis", oversampling, mask), compute)
@@ -0,0 +1,186 @@
+import hashlib
+import zipfile
+from collections import namedtuple
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.types import union_categoricals
+
+from engine.cache import shared_cache
+from engine.data import PROFILE_SCHEMA, REQUIRED_COLUMNS, load_population
+
+# Profiles uploaded by a facilitator replace the population of the app for their session only
+UPLOAD_KEY = "uploaded_population"
+UPLOAD_ERROR_KEY = "upload_error"
+UPLOAD_SUFFIXES = (".csv", ".xlsx")
+
+# Files are parsed and validated this many rows at a time, only the converted (compact) rows are kept
+CHUNK_ROWS = 100_000
+# Rejected rows are all counted, but only the first ones are described
+MAX_ERRORS = 50
+
+# Spellings accepted for the categorical columns, compared in lower case
+GENDER_CODES = {"m": "M", "male": "M", "man": "M", "f": "F", "female": "F", "woman": "F", "n/s": "N/S", "ns": "N/S", "x": "N/S"}
+ETHNICITY_CODES = {"swiss": "Swiss", "ch": "Swiss", "other": "Other", "non-swiss": "Other", "foreign": "Other"}
+BOOLEAN_CODES = {"1": True, "true": True, "yes": True, "0": False, "false": False, "no": False}
+# Inclusive ranges of the integer columns, small enough for int16
+INTEGER_RANGES = {"age": (0, 120), "convictions": (0, 999), "encounters": (0, 9999), "zip_code": (1000, 9999)}
+
+# Parsed profiles, number of rejected rows and descriptions of the first rejected values
+UploadResult = namedtuple("UploadResult", ["population", "rejected", "errors"])
+
+
+def _report(errors, invalid, text, column, first_line, expected):
+    for row in np.flatnonzero(invalid)[:MAX_ERRORS - len(errors)]:
+        errors.append((first_line + row, f"line {first_line + row}: {column} {text.iloc[row]!r} is not {expected}"))
+
+
+# Numbers of a text column, NaN where the cell is empty or not a number
+def _numbers(text):
+    cells = pc.utf8_trim_whitespace(pa.array(text, type=pa.string()))
+    cells = pc.if_else(pc.equal(cells, ""), pa.scalar(None, pa.string()), cells)
+    try:
+        # Clean columns are parsed by Arrow in one pass, which fails on the first value that is not an integer
+        return pc.cast(cells, pa.int64()).to_numpy(zero_copy_only=False).astype(np.float64)
+    except pa.ArrowInvalid:
+        return pd.to_numeric(cells.to_pandas(), errors="coerce").to_numpy(dtype=np.float64)
+
+
+# Codes of a categorical text column, None where the spelling is unknown. Only the distinct spellings are looked
+# up, not every cell.
+def _codes(text, codes):
+    spellings = text.astype("category")
+    known = spellings.cat.categories.str.strip().str.lower().map(codes)
+    return np.asarray(known, dtype=object)[spellings.cat.codes.to_numpy()]
+
+
+# Validates a chunk of text cells (the header is line 1, so its first row is `first_line`) and converts the valid
+# rows to the profile schema
+def convert_chunk(chunk, first_line, errors):
+    bad = np.zeros(len(chunk), dtype=bool)
+    columns = {}
+    for column, (low, high) in INTEGER_RANGES.items():
+        if column not in chunk:
+            continue
+        values = _numbers(chunk[column])
+        valid = (values >= low) & (values <= high) & (values % 1 == 0)
+        if column == "zip_code":
+            valid |= (chunk[column].str.strip() == "").to_numpy()
+        _report(errors, ~valid, chunk[column], column, first_line, f"a whole number from {low} to {high}")
+        bad |= ~valid
+        columns[column] = values
+    for column, codes in (("gender", GENDER_CODES), ("ethnicity", ETHNICITY_CODES), ("reoffended", BOOLEAN_CODES)):
+        if column not in chunk:
+            continue
+        values = _codes(chunk[column], codes)
+        valid = pd.notna(values)
+        if column == "reoffended":
+            valid |= (chunk[column].str.strip() == "").to_numpy()
+        _report(errors, ~valid, chunk[column], column, first_line, f"one of {sorted(set(codes.values()), key=str)}")
+        bad |= ~valid
+        columns[column] = values
+
+    keep = ~bad
+    df = pd.DataFrame({
+        "name": chunk["name"].str.strip()[keep] if "name" in chunk else [f"Profile {line - 1}" for line in first_line + np.flatnonzero(keep)],
+        "age": columns["age"][keep].astype(np.int16),
+        "ethnicity": pd.Categorical(columns["ethnicity"][keep], categories=["Swiss", "Other"]),
+        "convictions": columns["convictions"][keep].astype(np.int16),
+        "encounters": columns["encounters"][keep].astype(np.int16),
+        "gender": pd.Categorical(columns["gender"][keep], categories=["M", "F", "N/S"]),
+    })
+    if "zip_code" in columns:
+        df["zip_code"] = pd.array(columns["zip_code"][keep], dtype="Float64").astype(PROFILE_SCHEMA["zip_code"])
+    if "reoffended" in columns:
+        df["reoffended"] = pd.array(columns["reoffended"][keep], dtype=PROFILE_SCHEMA["reoffended"])
+    df["name"] = df["name"].astype("category")
+    return df, int(bad.sum())
+
+
+def _excel_chunks(file):
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ValueError("Reading Excel files needs the openpyxl package, upload a CSV file instead")
+    # Read-only mode streams the rows of the first sheet instead of loading the whole workbook. Files that are not
+    # zip archives, or zip archives without the parts of a workbook, are refused like any other unusable file.
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError) as error:
+        raise ValueError("The file is not an Excel workbook, save it again as .xlsx or upload a CSV file") from error
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(value) if value is not None else "" for value in next(rows, ())]
+        while batch := list(islice(rows, CHUNK_ROWS)):
+            yield pd.DataFrame([["" if value is None else str(value) for value in row] for row in batch], columns=header)
+    finally:
+        workbook.close()
+
+
+def _csv_chunks(file):
+    return pd.read_csv(file, dtype=str, keep_default_na=False, chunksize=CHUNK_ROWS, skipinitialspace=True)
+
+
+# Parses a CSV or Excel file (path or file object with a name) chunk by chunk
+def parse_upload(file, name=None):
+    name = name or getattr(file, "name", str(file))
+    suffix = Path(name).suffix.lower()
+    if suffix not in UPLOAD_SUFFIXES:
+        raise ValueError(f"Unsupported file type {suffix!r}, upload a {' or '.join(UPLOAD_SUFFIXES)} file")
+    chunks = _excel_chunks(file) if suffix == ".xlsx" else _csv_chunks(file)
+
+    parts, errors, rejected, first_line = [], [], 0, 2
+    for chunk in chunks:
+        chunk.columns = [str(column).strip().lower() for column in chunk.columns]
+        missing = [column for column in REQUIRED_COLUMNS if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {missing}")
+        part, nbr_rejected = convert_chunk(chunk, first_line, errors)
+        parts.append(part)
+        rejected += nbr_rejected
+        first_line += len(chunk)
+    if not parts or not sum(len(part) for part in parts):
+        raise ValueError("The file has no valid profiles")
+
+    # Every chunk has its own name categories, they are merged once at the end
+    names = union_categoricals([part["name"] for part in parts])
+    df = pd.concat([part.drop(columns="name") for part in parts], ignore_index=True)
+    df.insert(0, "name", names)
+    return UploadResult(df, rejected, [message for _, message in sorted(errors)])
+
+
+# Uploads are cached by content, so uploading the same file again (in any session) only costs the hash
+def cached_upload(file):
+    digest = hashlib.blake2b(file.getbuffer(), digest_size=16).hexdigest()
+
+    def parse():
+        file.seek(0)
+        result = parse_upload(file)
+        result.population.attrs["source_key"] = f"upload:{digest}"
+        return result
+
+    return shared_cache().get(("upload", digest), parse)
+
+
+# on_change callback of the file uploader: keeps the parsed profiles (or the error) in the session
+def store_upload(session_state, file):
+    session_state.pop(UPLOAD_ERROR_KEY, None)
+    if file is None:
+        session_state.pop(UPLOAD_KEY, None)
+        return
+    try:
+        session_state[UPLOAD_KEY] = cached_upload(file)
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as error:
+        session_state.pop(UPLOAD_KEY, None)
+        session_state[UPLOAD_ERROR_KEY] = str(error)
+
+
+# Population of a session: its uploaded profiles, or the population of the app
+def session_population(session_state):
+    result = session_state.get(UPLOAD_KEY)
+    return load_population() if result is None else result.population
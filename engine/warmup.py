@@ -0,0 +1,85 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from engine.cache import cached_cells, population_key, shared_cache
+from engine.data import load_population
+from engine.interventions import cached_intervention
+from engine.scoring import NBR_MASKS
+from engine.telemetry import TELEMETRY_ENV, popular_configurations
+
+# The first session of a process starts a background thread that fills the shared cache with the scores and
+# fairness metrics of every toggle mask, the most popular ones first. ALGODISC_PREWARM limits the number of
+# masks ("0" turns the warm-up off).
+PREWARM_ENV = "ALGODISC_PREWARM"
+
+logger = logging.getLogger(__name__)
+
+
+def prewarm_limit():
+    value = os.environ.get(PREWARM_ENV, "all")
+    return None if value == "all" else int(value)
+
+
+# Toggle masks in warm-up order: the ones most sessions tried according to the telemetry log, then the others.
+# All language pages share the same cache entries, so the language of a configuration does not matter.
+def prewarm_masks(limit=None):
+    masks = []
+    directory = os.environ.get(TELEMETRY_ENV)
+    if directory and any(Path(directory).glob("*.parquet")):
+        for _, mask in popular_configurations(directory):
+            if mask not in masks:
+                masks.append(mask)
+    masks += [mask for mask in range(NBR_MASKS) if mask not in masks]
+    return masks if limit is None else masks[:limit]
+
+
+# Scores the population with every mask in turn and stops before the cache would have to evict entries, so a
+# large population only warms the most popular masks. Returns the masks it computed.
+def prewarm(df=None, masks=None):
+    started = time.perf_counter()
+    df = load_population() if df is None else df
+    masks = prewarm_masks(prewarm_limit()) if masks is None else masks
+    cache = shared_cache()
+    key = population_key(df)
+    cached_cells(df)
+    filled, entry_size = [], 0
+    for mask in masks:
+        if ("intervention", key, mask, "none") in cache:
+            continue
+        nbytes = cache.stats()["nbytes"]
+        if nbytes + entry_size > cache.max_bytes:
+            break
+        cached_intervention(df, mask, "none")
+        filled.append(mask)
+        entry_size = max(entry_size, cache.stats()["nbytes"] - nbytes)
+    stats = cache.stats()
+    logger.info("Cache warm-up of %d profiles (%s): %d of %d toggle masks in %.2fs, %d entries, %.1f MB. Filled scores and "
+                "fairness metrics of masks %s", len(df), key, len(filled), len(masks), time.perf_counter() - started,
+                stats["entries"], stats["nbytes"] / 1e6, filled)
+    return filled
+
+
+_prewarm_thread = None
+_prewarm_lock = threading.Lock()
+
+
+# Starts the warm-up once per process, later calls return the same thread
+def start_prewarm():
+    global _prewarm_thread
+    with _prewarm_lock:
+        if _prewarm_thread is None and prewarm_limit() != 0:
+            _prewarm_thread = threading.Thread(target=prewarm, name="cache-prewarm", daemon=True)
+            _prewarm_thread.start()
+        return _prewarm_thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the cache warm-up of the app population (ALGODISC_DATASET).")
+    parser.add_argument("--masks", type=int, help="number of toggle masks to warm (default: all)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    prewarm(masks=prewarm_masks(args.masks))
@@ -0,0 +1,204 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from engine.cache import population_key, shared_cache
+from engine.fairness import disparity
+from engine.scoring import DEFAULT_WEIGHTS, HIGH, Weights, max_score_arrays, parse_mask, profile_arrays, risk_buckets, score_arrays, score_percent
+from engine.sensitivity import GRID, THRESHOLDS, distinct_profiles
+from engine.simulation import DEFAULT_MASK, sample_profiles
+
+# Search for weights of the rules that lower the gap in high-risk rate between non-Swiss and Swiss people while
+# ranking the profiles like the original weights. Candidates stay inside the range of the sensitivity grid.
+LOWER = np.array([GRID[name].min() for name in Weights._fields], dtype=np.float64)
+UPPER = np.array([GRID[name].max() for name in Weights._fields], dtype=np.float64)
+IS_THRESHOLD = np.array([name in THRESHOLDS for name in Weights._fields])
+# Multipliers are rounded to this step (thresholds to whole numbers), so that close candidates share their cache entry
+MULTIPLIER_STEP = 0.05
+# Candidates scored at once in one process: (candidates, distinct profiles) arrays
+EVALUATION_CHUNK = 256
+# Percents are rounded to 0.1, so they take one of 1001 values
+NBR_LEVELS = 1001
+
+
+def round_candidates(candidates):
+    candidates = np.clip(candidates, LOWER, UPPER)
+    return np.where(IS_THRESHOLD, np.round(candidates), np.round(np.round(candidates / MULTIPLIER_STEP) * MULTIPLIER_STEP, 2))
+
+
+# Weighted mid-ranks of every row of percents (profiles with the same percent share their rank), from a histogram
+# of the 1001 possible values per row instead of a sort per row
+def weighted_ranks(percent, counts):
+    levels = np.rint(percent * 10).astype(np.int64)
+    rows = np.arange(len(levels))[:, None] * NBR_LEVELS
+    histogram = np.bincount((levels + rows).ravel(), np.broadcast_to(counts, levels.shape).ravel(), minlength=len(levels) * NBR_LEVELS)
+    histogram = histogram.reshape(len(levels), NBR_LEVELS)
+    mid_ranks = histogram.cumsum(axis=1) - (histogram - 1) / 2
+    return np.take_along_axis(mid_ranks, levels, axis=1)
+
+
+# Weighted Pearson correlation of every row of `ranks` with `reference`, i.e. Spearman's rank correlation. Constant
+# rows (every profile gets the same score) have no correlation, they count as 0.
+def rank_agreement(ranks, reference, counts):
+    weights = counts / counts.sum()
+    centered = ranks - (ranks * weights).sum(axis=1, keepdims=True)
+    reference = reference - (reference * weights).sum()
+    spread = np.sqrt((centered ** 2 * weights).sum(axis=1) * (reference ** 2 * weights).sum())
+    return np.divide((centered * reference * weights).sum(axis=1), spread, out=np.zeros(len(ranks)), where=spread > 0)
+
+
+# Metrics of a batch of candidates (one row of weights each) on distinct profiles with their counts: every
+# candidate is broadcast against every profile at once
+def evaluate_candidates(candidates, arrays, reoffended, counts, mask, reference_ranks):
+    weights = Weights(*(column[:, None] for column in candidates.T))
+    percent = score_percent(score_arrays(arrays, mask, weights), max_score_arrays(arrays, mask, weights))
+    high = (risk_buckets(percent) == HIGH) * counts
+    is_other = arrays["is_other"]
+    high_other, high_swiss = high[:, is_other].sum(axis=1) / counts[is_other].sum(), high[:, ~is_other].sum(axis=1) / counts[~is_other].sum()
+    # Among the people who did not reoffend
+    other, swiss = is_other & ~reoffended, ~is_other & ~reoffended
+    fp_other, fp_swiss = high[:, other].sum(axis=1) / counts[other].sum(), high[:, swiss].sum(axis=1) / counts[swiss].sum()
+    gap, ratio = disparity(high_other, high_swiss)
+    return {
+        "high_risk_other": high_other,
+        "high_risk_swiss": high_swiss,
+        "high_risk_gap": gap,
+        "high_risk_ratio": ratio,
+        "false_positive_gap": disparity(fp_other, fp_swiss)[0],
+        "agreement": rank_agreement(weighted_ranks(percent, counts), reference_ranks, counts),
+    }
+
+
+# Profiles of the worker processes, sent once when the pool starts instead of with every batch
+_population = {}
+
+
+def _init_worker(population):
+    _population.update(population)
+
+
+def _evaluate_in_worker(candidates):
+    return evaluate_candidates(candidates, **_population)
+
+
+class CandidateEvaluator:
+    def __init__(self, df, mask=DEFAULT_MASK, workers=1):
+        reoffended = df["reoffended"].fillna(False).to_numpy(dtype=bool) if "reoffended" in df.columns else np.zeros(len(df), dtype=bool)
+        arrays, reoffended, counts = distinct_profiles(profile_arrays(df), reoffended, GRID)
+        reference = Weights(*(np.full((1, 1), value, dtype=np.float64) for value in DEFAULT_WEIGHTS))
+        percent = score_percent(score_arrays(arrays, mask, reference), max_score_arrays(arrays, mask, reference))
+        self.population = {"arrays": arrays, "reoffended": reoffended, "counts": counts, "mask": mask,
+                           "reference_ranks": weighted_ranks(percent, counts)[0]}
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self.population,)) if workers > 1 else None
+        # Metrics of every candidate evaluated so far, by weights
+        self.evaluated = {}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    # Metrics of the candidates, in their order. Only candidates that were never evaluated are scored, in chunks
+    # spread over the pool.
+    def evaluate(self, candidates):
+        keys = [tuple(row) for row in candidates.tolist()]
+        new = np.array(list(dict.fromkeys(key for key in keys if key not in self.evaluated)), dtype=np.float64).reshape(-1, len(Weights._fields))
+        if len(new):
+            chunks = np.array_split(new, max(self.workers, -(-len(new) // EVALUATION_CHUNK)))
+            if self.pool is not None:
+                results = list(self.pool.map(_evaluate_in_worker, chunks))
+            else:
+                results = [evaluate_candidates(chunk, **self.population) for chunk in chunks]
+            for chunk, metrics in zip(chunks, results):
+                for i, row in enumerate(chunk.tolist()):
+                    self.evaluated[tuple(row)] = {name: float(values[i]) for name, values in metrics.items()}
+        return pd.DataFrame([self.evaluated[key] for key in keys])
+
+
+# Candidates that no other candidate beats on both the gap (absolute value) and the agreement with the original
+# ranking, by increasing gap
+def pareto_front(results):
+    ordered = results.assign(absolute_gap=results["high_risk_gap"].abs()).sort_values(["absolute_gap", "agreement"], ascending=[True, False])
+    best_agreement = ordered["agreement"].cummax().shift(fill_value=-np.inf)
+    return ordered[ordered["agreement"] > best_agreement].drop(columns="absolute_gap").reset_index(drop=True)
+
+
+# Evolution strategy: every generation samples `batch_size` candidates around the mean of the best quarter of the
+# previous one, with steps that shrink over time. Candidates ranking the profiles less like the original weights
+# than `min_agreement` are penalized. Stops early when the best candidate did not improve for `patience`
+# generations.
+def search_weights(df, mask=DEFAULT_MASK, min_agreement=0.9, batch_size=64, generations=40, patience=6, tolerance=0.01,
+                   workers=1, seed=0):
+    if not mask:
+        # Without any information every profile gets the same score whatever the weights, there is nothing to search
+        original = CandidateEvaluator(df, mask).evaluate(np.array([DEFAULT_WEIGHTS], dtype=np.float64))
+        results = pd.DataFrame([DEFAULT_WEIGHTS]).join(original).assign(generation=0)
+        return results, pareto_front(results), original.iloc[0]
+
+    rng = np.random.default_rng(seed)
+    evaluator = CandidateEvaluator(df, mask, workers)
+    scale = UPPER - LOWER
+    center, step = (np.array(DEFAULT_WEIGHTS, dtype=np.float64) - LOWER) / scale, 0.25
+    best, stale, history = np.inf, 0, []
+    try:
+        original = evaluator.evaluate(np.array([DEFAULT_WEIGHTS], dtype=np.float64)).iloc[0]
+        for generation in range(generations):
+            samples = center + step * rng.standard_normal((batch_size, len(center)))
+            candidates = round_candidates(LOWER + np.vstack([center, samples]) * scale)
+            results = evaluator.evaluate(candidates)
+            fitness = (results["high_risk_gap"].abs() + 100 * np.maximum(min_agreement - results["agreement"], 0)).to_numpy()
+            history.append(pd.DataFrame(candidates, columns=Weights._fields).join(results).assign(generation=generation))
+
+            elite = np.argsort(fitness)[:max(1, batch_size // 4)]
+            center = ((candidates[elite] - LOWER) / scale).mean(axis=0)
+            step *= 0.85
+            if fitness.min() < best - tolerance:
+                best, stale = fitness.min(), 0
+            else:
+                stale += 1
+                if stale >= patience:
+                    break
+    finally:
+        evaluator.close()
+
+    # Every candidate once, with the generation that first evaluated it
+    results = pd.concat(history, ignore_index=True).drop_duplicates(subset=list(Weights._fields)).reset_index(drop=True)
+    return results, pareto_front(results), original
+
+
+def cached_weight_search(df, mask=DEFAULT_MASK, min_agreement=0.9):
+    return shared_cache().get(("weight_search", population_key(df), mask, min_agreement), lambda: search_weights(df, mask, min_agreement))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search for weights of the rules with a smaller gap between groups and a similar ranking.")
+    parser.add_argument("--profiles", type=int, default=20000, help="size of the simulated population")
+    parser.add_argument("--oversampling", type=float, default=2.0, help="extra police checks of non-Swiss people")
+    parser.add_argument("--mask", default="ethnicity+encounters+convictions+age", help="toggle mask, as a number, feature names joined with + or all")
+    parser.add_argument("--min-agreement", type=float, default=0.9, help="lowest rank correlation with the original scores")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--generations", type=int, default=40)
+    parser.add_argument("--patience", type=int, default=6, help="generations without improvement before stopping")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="CSV file for every evaluated candidate")
+    args = parser.parse_args(argv)
+
+    df = sample_profiles(args.oversampling, args.profiles)
+    started = time.perf_counter()
+    results, front, original = search_weights(df, parse_mask(args.mask), args.min_agreement, args.batch_size, args.generations,
+                                              args.patience, workers=args.workers, seed=args.seed)
+    seconds = time.perf_counter() - started
+    if args.out:
+        results.to_csv(args.out, index=False)
+    print(f"Original weights: gap {original['high_risk_gap']:+.1f} points")
+    print("Pareto front (gap against agreement with the original ranking):")
+    print(front[list(Weights._fields) + ["high_risk_gap", "false_positive_gap", "agreement"]].round(3).to_string(index=False))
+    print(f"{len(results):,} candidates in {results['generation'].max() + 1} generations, {seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
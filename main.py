@@ -1,5 +1,13 @@
 import streamlit as st
 
+from engine.classroom import ROOM_KEY
+from engine.telemetry import CONSENT_KEY, record_change, telemetry_enabled
+from engine.upload import UPLOAD_ERROR_KEY, UPLOAD_KEY, store_upload
+from engine.warmup import start_prewarm
+
+# Scores every toggle mask in the background once per process, while the first visitor reads the introduction
+start_prewarm()
+
 st.logo("assets/img/BFH_Logo_C_en_100_RGB.png", size="large")
 
 
@@ -10,32 +18,103 @@ with st.sidebar:
 main_page = f"pages/app_page/app_{language}.py"
 about_page = f"pages/about_page/about_{language}.py"
 resources_page = f"pages/resources_page/resources_{language}.py"
+lab_page = f"pages/lab_page/lab_{language}.py"
+classroom_page = f"pages/classroom_page/classroom_{language}.py"
 
 lang_dict = {
     "English": {
         "home" : "Homepage",
         "resources" : "Resources",
-        "about" : "About"
+        "lab" : "Lab",
+        "about" : "About",
+        "classroom" : "Classroom",
+        "room" : "Room code (classroom mode)",
+        "room_help" : "Enter the code given by your facilitator to share your choices with the room.",
+        "telemetry" : "Share anonymous usage statistics",
+        "telemetry_help" : "Records which options you choose and when, never your survey answers.",
+        "upload" : "Upload profiles (CSV or Excel)",
+        "upload_help" : "Replaces the profiles of the homepage and the lab for your session. Required columns: age, ethnicity, convictions, encounters, gender. Optional: name, zip_code, reoffended.",
+        "upload_loaded" : "{profiles:,} profiles loaded, {rejected:,} rows rejected"
     },
     "French": {
         "home" : "Page d'accueil",
         "resources" : "Ressources",
-        "about" : "À propos"
+        "lab" : "Laboratoire",
+        "about" : "À propos",
+        "classroom" : "Classe",
+        "room" : "Code de salle (mode classe)",
+        "room_help" : "Entrez le code donné par l’animateur·rice pour partager vos choix avec la salle.",
+        "telemetry" : "Partager des statistiques d’utilisation anonymes",
+        "telemetry_help" : "Enregistre les options que vous choisissez et quand, jamais vos réponses au sondage.",
+        "upload" : "Importer des profils (CSV ou Excel)",
+        "upload_help" : "Remplace les profils de la page d’accueil et du laboratoire pour votre session. Colonnes requises : age, ethnicity, convictions, encounters, gender. Facultatives : name, zip_code, reoffended.",
+        "upload_loaded" : "{profiles:,} profils chargés, {rejected:,} lignes rejetées"
     },
     "German": {
         "home" : "Homepage",
         "resources" : "Ressourcen",
-        "about" : "Über"
+        "lab" : "Labor",
+        "about" : "Über",
+        "classroom" : "Klassenzimmer",
+        "room" : "Raumcode (Klassenmodus)",
+        "room_help" : "Geben Sie den Code der Kursleitung ein, um Ihre Auswahl mit dem Raum zu teilen.",
+        "telemetry" : "Anonyme Nutzungsstatistiken teilen",
+        "telemetry_help" : "Erfasst, welche Optionen Sie wann wählen, nie Ihre Antworten auf die Umfrage.",
+        "upload" : "Profile hochladen (CSV oder Excel)",
+        "upload_help" : "Ersetzt die Profile der Homepage und des Labors für Ihre Sitzung. Erforderliche Spalten: age, ethnicity, convictions, encounters, gender. Optional: name, zip_code, reoffended.",
+        "upload_loaded" : "{profiles:,} Profile geladen, {rejected:,} Zeilen abgelehnt"
     },
     "Italian": {
         "home" : "Pagina iniziale",
         "resources" : "Risorse",
-        "about" : "Info"
+        "lab" : "Laboratorio",
+        "about" : "Info",
+        "classroom" : "Classe",
+        "room" : "Codice dell’aula (modalità classe)",
+        "room_help" : "Inserite il codice ricevuto dal facilitatore per condividere le vostre scelte con l’aula.",
+        "telemetry" : "Condividere statistiche d’uso anonime",
+        "telemetry_help" : "Registra quali opzioni scegliete e quando, mai le vostre risposte al sondaggio.",
+        "upload" : "Caricare profili (CSV o Excel)",
+        "upload_help" : "Sostituisce i profili della pagina iniziale e del laboratorio per la vostra sessione. Colonne richieste: age, ethnicity, convictions, encounters, gender. Facoltative: name, zip_code, reoffended.",
+        "upload_loaded" : "{profiles:,} profili caricati, {rejected:,} righe rifiutate"
     }
 }
 
+# Opt-in usage statistics, only offered when the operator set ALGODISC_TELEMETRY
+if telemetry_enabled():
+    with st.sidebar:
+        # The checkbox is relabelled by every language switch, the choice itself is kept under CONSENT_KEY
+        consent_widget = f"{CONSENT_KEY}_{language}"
+        st.checkbox(lang_dict[language]["telemetry"], value=st.session_state.get(CONSENT_KEY, False), key=consent_widget,
+                    help=lang_dict[language]["telemetry_help"],
+                    on_change=lambda: st.session_state.update({CONSENT_KEY: st.session_state[consent_widget]}))
+    record_change(st.session_state, language, "language", language)
+
+# Classroom mode: participants join the facilitator's room with its code, or with a link ending in ?room=CODE
+if ROOM_KEY not in st.session_state:
+    st.session_state[ROOM_KEY] = st.query_params.get("room", "")
+with st.sidebar:
+    room_widget = f"{ROOM_KEY}_{language}"
+    st.text_input(lang_dict[language]["room"], value=st.session_state[ROOM_KEY], key=room_widget, help=lang_dict[language]["room_help"],
+                  on_change=lambda: st.session_state.update({ROOM_KEY: st.session_state[room_widget]}))
+
+# Custom profiles: parsed and validated once per file content, then used by the pages instead of the demo profiles
+with st.sidebar:
+    upload_widget = f"{UPLOAD_KEY}_{language}"
+    st.file_uploader(lang_dict[language]["upload"], type=["csv", "xlsx"], key=upload_widget, help=lang_dict[language]["upload_help"],
+                     on_change=lambda: store_upload(st.session_state, st.session_state[upload_widget]))
+    if UPLOAD_ERROR_KEY in st.session_state:
+        st.error(st.session_state[UPLOAD_ERROR_KEY])
+    elif UPLOAD_KEY in st.session_state:
+        upload = st.session_state[UPLOAD_KEY]
+        st.caption(lang_dict[language]["upload_loaded"].format(profiles=len(upload.population), rejected=upload.rejected))
+        if upload.errors:
+            st.warning("\n\n".join(upload.errors[:5]))
+
 pg = st.navigation([st.Page(main_page, title=lang_dict[language]['home'], default=True, icon="🏠"),
                     # st.Page("app_pics.py", title="Second experience"),
+                    st.Page(lab_page, title=lang_dict[language]['lab'], icon="🧪"),
+                    st.Page(classroom_page, title=lang_dict[language]['classroom'], icon="👥"),
                     st.Page(resources_page, title=lang_dict[language]['resources'], icon="📖"),
                     st.Page(about_page, title=lang_dict[language]['about'], icon="ℹ️")])
 pg.run()
\ No newline at end of file
@@ -1,8 +1,18 @@
+import numpy as np
 import streamlit as st
-import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
+from engine.attribution import mean_shapley_values, shapley_values
+from engine.bootstrap import RESAMPLES, cached_bootstrap
+from engine.classroom import publish_choice
+from engine.compact import profile_names, render_profiles
+from engine.counterfactual import cached_counterfactuals
+from engine.interventions import INTERVENTIONS, cached_intervention
+from engine.scoring import FEATURES, LOW, MEDIUM, NBR_MASKS, toggle_mask, uses
+from engine.telemetry import record_change
+from engine.upload import session_population
+
 st.set_page_config(page_title="Discrimination through Data and Algorithms", layout="wide")
 
 # Function to authenticate and connect to Google Sheets using Streamlit Secrets
@@ -41,68 +51,23 @@ def update_google_sheet(data):
     sheet.append_row(data)  # Add the form data as a new row
 
 # ---------- Data ----------
-df = pd.DataFrame({
-    "name": ["John", "Janine", "Joe", "Jack", "Janet", "Jocelyn", "Leo", "Lara"],
-    "age": [21, 18, 36, 98, 45, 63, 28, 24],
-    "ethnicity": ["Swiss", "Other", "Swiss", "Other", "Other", "Other", "Other", "Swiss"],
-    "convictions": [0, 1, 2, 3, 4, 5, 0, 9],
-    "encounters": [12, 2, 0, 0, 45, 5, 2, 9],
-    "gender": ["M", "F", "N/S", "N/S", "M", "F", "M", "N/S"],
-})
-
-# ---------- Scoring logic ----------
-def calculate_recidivism_score(*, nbr_encounter_police=None, nbr_prior_convictions=None, age=None, gender=None, ethnicity=None):
-    score = 0
-
-    # Encounters with police
-    if nbr_encounter_police is not None:
-        if nbr_encounter_police == 0:
-            pass
-        elif 0 < nbr_encounter_police < 10:
-            score += 1
-        elif nbr_encounter_police >= 10:
-            score += 2
-
-    # Prior convictions
-    if nbr_prior_convictions is not None:
-        if nbr_prior_convictions == 1:
-            pass
-        elif 1 < nbr_prior_convictions < 5:
-            score += 1
-        elif nbr_prior_convictions >= 5:
-            score += 2
-
-    if gender is not None and gender == "M":
-        score += 1
-
-    if ethnicity is not None and ethnicity == "Other":
-        if score == 0:
-            score = 1
-        score *= 1.2
-
-    # Age multiplier
-    if age is not None and age < 25:
-        if score == 0:
-            score = 1 
-        score *= 2.5
-
-    return float(score)
-
-def max_possible_score_for_row(row, use_encounters, use_convictions, use_age, use_ethnicity, use_gender):
-    # Worst-case inputs for enabled features, keeping the person's actual age for the age rule
-    worst_encounters = 2 if use_encounters else 0
-    worst_convictions = 2 if use_convictions else 0
-    worst_gender = 1 if use_gender else 0
-    base = worst_encounters + worst_convictions + worst_gender
-    if use_age and row["age"] < 25:
-        if base == 0:
-            base = 1
-        base *= 2.5
-    if use_ethnicity and row['ethnicity'] == "Other":
-        if base == 0:
-            base = 1
-        base *= 1.2
-    return float(base)
+# Profiles uploaded in the sidebar, else the demo profiles or the Arrow file given by ALGODISC_DATASET (memory-mapped
+# and shared by all sessions)
+df = session_population(st.session_state)
+
+# Names of the toggles, used in the contribution charts
+feature_labels = {"gender": "Gender", "ethnicity": "Ethnicity", "encounters": "Police encounters", "convictions": "Convictions", "age": "Age", "zip_code": "ZIP code"}
+
+# Names of the mitigations offered in the profiles section
+intervention_labels = {"none": "None", "group_thresholds": "Group-specific thresholds", "reweighing": "Reweighing", "suppress_proxies": "Remove proxy information"}
+
+# Ways of showing the profiles
+view_labels = {"cards": "Cards", "compact": "Compact table"}
+
+# Information shown for each profile in the compact view, as on the cards
+profile_fields = [("Name", "name"), ("Age", "age"), ("Gender", "gender"), ("Ethnicity", "ethnicity"), ("Number of convictions", "convictions"), ("Number of police encounters", "encounters")]
+if "zip_code" in df.columns:
+    profile_fields.append(("ZIP code", "zip_code"))
 
 # ---------- UI ----------
 
@@ -133,92 +98,142 @@ st.subheader("Create your system")
 with st.container(border=True):
     "Here, you can create your own risk assessment system. Select the information you want to use (you can choose several options), and observe how the risk ratings of the profiles change accordingly."
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.write("Select which information you want to include in your system:")
-
-    use_gender = st.toggle("Gender", key="use_gender")
-    if use_gender:
-        st.info("According to the [Swiss Federal Statistical Office](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html), men tend to have a higher recidivism rate than women. No data is currently available for other genders.")
-
-    use_ethnicity = st.toggle("Ethnicity", key="use_ethnicity")
-    if use_ethnicity:
-        st.info("According to [this analysis](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html) by the Swiss Federal Statistical Office, non-Swiss individuals tend to reoffend more often.")
-
-    use_encounters = st.toggle("Number of encounters with the police", key="use_encounters")
-    if use_encounters:
-        st.info("Since police checks can be performed on discriminatory grounds, the number of encounters with the police can reflect bias in data. ‘Encounters’ include any interaction with the police, from roadside checks to interventions.")
-
-    use_convictions = st.toggle("Number of previous convictions", key="use_convictions")
-    if use_convictions:
-        st.info("Conviction rates may be influenced by systemic biases, thus affecting the recidivism score.")
-
-    use_age = st.toggle("Age", key="use_age")
-    if use_age:
-        st.info("According to [this study on the US COMPAS system](https://www.propublica.org/article/how-we-analyzed-the-compas-recidivism-algorithm), younger individuals are often categorized as higher-risk profiles for recidivism.")
-
-st.subheader("Profiles")
-
-# ---------- Compute scores dynamically ----------
-scores = []
-percents = []
-for _, row in df.iterrows():
-    kwargs = {}
-    if use_gender:
-        kwargs["gender"] = row["gender"]
-    if use_ethnicity:
-        kwargs["ethnicity"] = row["ethnicity"]
-    if use_encounters:
-        kwargs["nbr_encounter_police"] = row["encounters"]
-    if use_convictions:
-        kwargs["nbr_prior_convictions"] = row["convictions"]
-    if use_age:
-        kwargs["age"] = row["age"]
-
-    score = calculate_recidivism_score(**kwargs)
-    scores.append(score)
-
-    max_score = max_possible_score_for_row(row, use_encounters, use_convictions, use_age, use_ethnicity, use_gender)
-    percent = 0.0 if max_score == 0 else (score / max_score) * 100.0
-    percents.append(round(percent, 1))
-
-df_display = df.copy()
-df_display["recidivism_score_percent"] = percents
-
-# ---------- Show cards ----------
-row1 = st.columns(4)
-row2 = st.columns(4)
-cards = row1 + row2
-nbr_low, nbr_medium, nbr_high = 0, 0, 0
-
-for i, col in enumerate(cards):
-    with col.container(border=True):
-        c1, c2 = st.columns(2)
-        c1.write("**Profile**")
-        c1.image("assets/img/user.png")
-        c2.write(f"**Name:** {df_display['name'][i]}")
-        c2.write(f"**Age:** {df_display['age'][i]}")
-        c2.write(f"**Gender:** {df_display['gender'][i]}")
-        c2.write(f"**Ethnicity:** {df_display['ethnicity'][i]}")
-        c2.write(f"**Number of convictions:** {df_display['convictions'][i]}")
-        c2.write(f"**Number of police encounters:** {df_display['encounters'][i]}")
-
-        pct = df_display["recidivism_score_percent"][i]
-        if pct < 33:
-            st.info(f"Recidivism score: {pct}%")
-            nbr_low += 1
-        elif 33 <= pct < 66:
-            nbr_medium += 1
-            st.warning(f"Recidivism score: {pct}%")
-        else:
-            nbr_high += 1
-            st.error(f"Recidivism score: {pct}%")
-
-with col2:
-    st.info(f"Number of low-risk profiles: {nbr_low}")
-    st.warning(f"Number of medium-risk profiles: {nbr_medium}")
-    st.error(f"Number of high-risk profiles: {nbr_high}")
+# ---------- System and profiles ----------
+# Only this fragment reruns when a toggle changes, the static text and the survey are left untouched
+@st.fragment
+def create_system_and_profiles():
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.write("Select which information you want to include in your system:")
+
+        use_gender = st.toggle("Gender", key="use_gender")
+        if use_gender:
+            st.info("According to the [Swiss Federal Statistical Office](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html), men tend to have a higher recidivism rate than women. No data is currently available for other genders.")
+
+        use_ethnicity = st.toggle("Ethnicity", key="use_ethnicity")
+        if use_ethnicity:
+            st.info("According to [this analysis](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html) by the Swiss Federal Statistical Office, non-Swiss individuals tend to reoffend more often.")
+
+        use_encounters = st.toggle("Number of encounters with the police", key="use_encounters")
+        if use_encounters:
+            st.info("Since police checks can be performed on discriminatory grounds, the number of encounters with the police can reflect bias in data. ‘Encounters’ include any interaction with the police, from roadside checks to interventions.")
+
+        use_convictions = st.toggle("Number of previous convictions", key="use_convictions")
+        if use_convictions:
+            st.info("Conviction rates may be influenced by systemic biases, thus affecting the recidivism score.")
+
+        use_age = st.toggle("Age", key="use_age")
+        if use_age:
+            st.info("According to [this study on the US COMPAS system](https://www.propublica.org/article/how-we-analyzed-the-compas-recidivism-algorithm), younger individuals are often categorized as higher-risk profiles for recidivism.")
+
+        use_zip_code = st.toggle("ZIP code", key="use_zip_code")
+        if use_zip_code:
+            st.info("A ZIP code says nothing about a person, but some areas have a much higher share of foreign residents than others. A system that uses the ZIP code can therefore discriminate by origin without ever using it directly. The share of foreign residents per area comes from the [Swiss Federal Statistical Office](https://www.bfs.admin.ch/bfs/en/home/statistics/population.html).")
+
+    with col2:
+        what_if = st.toggle("What if? Show the effect of a different gender, ethnicity or age", key="use_what_if")
+        if what_if:
+            st.info("Each profile also shows how its score would change if its gender (M ↔ F), ethnicity (Swiss ↔ Other) or age (below or above 25) were different, all other information being equal.")
+        show_contributions = st.toggle("Show how much each piece of information contributes to the score", key="use_contributions")
+        if show_contributions:
+            st.info("The bar under each profile splits its score between the information you selected. The shares are exact Shapley values: each piece of information is credited with its average effect over every order in which the selected information could be added.")
+        intervention = st.selectbox("Mitigation", INTERVENTIONS, format_func=intervention_labels.get, key="intervention")
+        if intervention == "group_thresholds":
+            st.info("Non-Swiss and Swiss profiles get their own high-risk threshold, so that the same share of each group is rated high-risk, up to one profile. Scores do not change, only the color of some profiles does: the groups are treated differently to get equal outcomes.")
+        elif intervention == "reweighing":
+            st.info("Within each group, profiles are ranked by score and get the score of the same rank in the whole population, so that each group has the same shares of low, medium and high risk, up to one profile.")
+        elif intervention == "suppress_proxies":
+            st.info("The system ignores ethnicity and every piece of information that strongly reveals it (Cramér’s V of at least 0.2, see the Lab page).")
+
+    st.subheader("Profiles")
+    view = st.radio("View", ("cards", "compact"), format_func=view_labels.get, horizontal=True, key="profile_view",
+                    help="The compact table shows the same information in a single block, which loads faster on slow connections and devices.")
+
+    # ---------- Compute scores ----------
+    # Only the first profiles are shown
+    nbr_profiles = min(8, len(df))
+    # Scores are shared between all sessions, each toggle combination is only computed once per population
+    mask = toggle_mask(gender=use_gender, ethnicity=use_ethnicity, encounters=use_encounters, convictions=use_convictions, age=use_age, zip_code=use_zip_code)
+    record_change(st.session_state, "English", "mask", mask)
+    record_change(st.session_state, "English", "intervention", intervention)
+    # The mitigation can change the scores, the buckets or the information that is used
+    result = cached_intervention(df, mask, intervention)
+    publish_choice(st.session_state, mask, intervention, result.after)
+    # Uncertainty of the counters and of the gap, from resamples of the profiles
+    intervals = cached_bootstrap(df, mask, intervention, nbr_profiles)
+    mask, scored = result.mask, result.scored
+    if what_if:
+        deltas = cached_counterfactuals(df, mask, nbr_profiles)
+    if show_contributions:
+        contributions = shapley_values(df, mask, nbr_profiles)
+
+    # ---------- Show profiles ----------
+    if what_if:
+        what_if_notes = [f"What if… gender: {deltas['gender'][0][i]:+.1f} pts ({deltas['gender'][1][i]:+.1f}%) · ethnicity: {deltas['ethnicity'][0][i]:+.1f} pts ({deltas['ethnicity'][1][i]:+.1f}%) · age: {deltas['age'][0][i]:+.1f} pts ({deltas['age'][1][i]:+.1f}%)" for i in range(nbr_profiles)]
+
+    if view == "compact":
+        # One HTML block for all profiles instead of about ten elements per card
+        nbr_low, nbr_medium, nbr_high = np.bincount(scored.bucket[:nbr_profiles], minlength=3)
+        notes = [[] for _ in range(nbr_profiles)]
+        for i in range(nbr_profiles):
+            if what_if:
+                notes[i].append(what_if_notes[i])
+            if show_contributions and mask:
+                notes[i].append("Contributions: " + " · ".join(f"{feature_labels[feature]} {contributions[i, j]:+.1f} pts" for j, feature in enumerate(FEATURES) if uses(mask, feature)))
+        st.html(render_profiles(df, scored, profile_fields, "Recidivism score", nbr_profiles, notes))
+    else:
+        row1 = st.columns(4)
+        row2 = st.columns(4)
+        cards = (row1 + row2)[:nbr_profiles]
+        names = profile_names(df, nbr_profiles)
+        nbr_low, nbr_medium, nbr_high = 0, 0, 0
+
+        for i, col in enumerate(cards):
+            with col.container(border=True):
+                c1, c2 = st.columns(2)
+                c1.write("**Profile**")
+                c1.image("assets/img/user.png")
+                c2.write(f"**Name:** {names[i]}")
+                c2.write(f"**Age:** {df['age'][i]}")
+                c2.write(f"**Gender:** {df['gender'][i]}")
+                c2.write(f"**Ethnicity:** {df['ethnicity'][i]}")
+                c2.write(f"**Number of convictions:** {df['convictions'][i]}")
+                c2.write(f"**Number of police encounters:** {df['encounters'][i]}")
+                if "zip_code" in df.columns:
+                    c2.write(f"**ZIP code:** {df['zip_code'][i]}")
+
+                pct = scored.percent[i]
+                if scored.bucket[i] == LOW:
+                    st.info(f"Recidivism score: {pct}%")
+                    nbr_low += 1
+                elif scored.bucket[i] == MEDIUM:
+                    nbr_medium += 1
+                    st.warning(f"Recidivism score: {pct}%")
+                else:
+                    nbr_high += 1
+                    st.error(f"Recidivism score: {pct}%")
+
+                if what_if:
+                    st.caption(what_if_notes[i])
+
+                if show_contributions and mask:
+                    st.bar_chart({feature_labels[feature]: [contributions[i, j]] for j, feature in enumerate(FEATURES) if uses(mask, feature)},
+                                 horizontal=True, stack=True, x_label="Score points", height=120)
+
+    with col2:
+        shown, gap = intervals["shown"], intervals["population"]["high_risk_gap"]
+        st.info(f"Number of low-risk profiles: {nbr_low} (95% interval: {shown['low'][0]:.0f} to {shown['low'][1]:.0f})")
+        st.warning(f"Number of medium-risk profiles: {nbr_medium} (95% interval: {shown['medium'][0]:.0f} to {shown['medium'][1]:.0f})")
+        st.error(f"Number of high-risk profiles: {nbr_high} (95% interval: {shown['high'][0]:.0f} to {shown['high'][1]:.0f})")
+        if intervention != "none":
+            st.caption(f"Gap in high-risk rates between non-Swiss and Swiss profiles: {result.before['high_risk_gap']:+.1f} pp without the mitigation, {result.after['high_risk_gap']:+.1f} pp with it.")
+        if not np.isnan(result.after["high_risk_gap"]):
+            st.caption(f"Gap in high-risk rates between non-Swiss and Swiss people, over all {len(df)} profiles: {result.after['high_risk_gap']:+.1f} pp (95% interval: {gap[0]:+.1f} to {gap[1]:+.1f} pp).", help=f"The intervals come from {RESAMPLES} bootstrap resamples: the profiles are drawn again at random, with replacement, and the numbers are computed again. With few profiles, the numbers could easily have been different.")
+        if result.suppressed:
+            st.caption(f"Ignored information: {', '.join(feature_labels[feature] for feature in result.suppressed)}")
+
+create_system_and_profiles()
 
 st.divider()
 
@@ -238,11 +253,15 @@ expander_weight = st.expander("Do all variables have the same impact on the scor
 expander_weight.write("""
 Not all pieces of information contribute equally to recidivism score calculations. Some variables (e.g., “Age”) tend to have a greater influence. This stems from the algorithm’s design and the choices made during its construction and programming.
 """)
+expander_weight.write("With all six pieces of information enabled, this is how much each one contributes on average to the profiles’ scores (exact Shapley values):")
+expander_weight.bar_chart({feature_labels[feature]: [value] for feature, value in zip(FEATURES, mean_shapley_values(df, NBR_MASKS - 1))},
+                          horizontal=True, stack=True, x_label="Score points", height=120)
 
 expander_missing = st.expander("Would removing sensitive information (e.g., gender or ethnicity) make the system fairer?")
 expander_missing.write("""
 Removing sensitive data does not necessarily reduce discrimination. For instance, even though ethnicity or race are not explicitly included in Swiss recidivism scoring systems such as [FaST](https://www.rosnet.ch/fr-ch/Processus/Tri) and [FOTRES](https://www.mwv-berlin.de/produkte/!/title/fotres--forensisches-operationalisiertes-therapie-risiko-evaluations-system/id/804), bias can still emerge through correlated data or practices. Racial profiling, for example, can introduce hidden discrimination via arrest rates or police encounters. Similarly, ZIP codes can indirectly reveal a person’s origin or ethnicity based on demographic data.
 """)
+expander_missing.write("The Lab page measures how strongly each piece of information reveals a person’s ethnicity.")
 
 expander_box = st.expander("What is the situation in Switzerland?")
 expander_box.write("""
@@ -1,8 +1,18 @@
+import numpy as np
 import streamlit as st
-import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
+from engine.attribution import mean_shapley_values, shapley_values
+from engine.bootstrap import RESAMPLES, cached_bootstrap
+from engine.classroom import publish_choice
+from engine.compact import profile_names, render_profiles
+from engine.counterfactual import cached_counterfactuals
+from engine.interventions import INTERVENTIONS, cached_intervention
+from engine.scoring import FEATURES, LOW, MEDIUM, NBR_MASKS, toggle_mask, uses
+from engine.telemetry import record_change
+from engine.upload import session_population
+
 st.set_page_config(page_title="Discrimination par les données et les algorithmes", layout="wide")
 
 # Function to authenticate and connect to Google Sheets using Streamlit Secrets
@@ -41,66 +51,23 @@ def update_google_sheet(data):
     sheet.append_row(data)  # Add the form data as a new row
 
 # ---------- Data ----------
-df = pd.DataFrame({
-    "name": ["John", "Janine", "Joe", "Jack", "Janet", "Jocelyn", "Leo", "Lara"],
-    "age": [21, 18, 36, 98, 45, 63, 28, 24],
-    "ethnicity": ["Swiss", "Other", "Swiss", "Other", "Other", "Other", "Other", "Swiss"],
-    "convictions": [0, 1, 2, 3, 4, 5, 0, 9],
-    "encounters": [12, 2, 0, 0, 45, 5, 2, 9],
-    "gender": ["M", "F", "N/S", "N/S", "M", "F", "M", "N/S"],
-})
-
-# ---------- Scoring logic (same as yours, kept simple) ----------
-def calculate_recidive_score(*, nbr_encounter_police=None, nbr_prior_convictions=None, age=None, gender=None, ethnicity=None):
-    score = 0
-
-    # Encounters with police
-    if nbr_encounter_police is not None:
-        if nbr_encounter_police == 0:
-            pass
-        elif 0 < nbr_encounter_police < 10:
-            score += 1
-        elif nbr_encounter_police >= 10:
-            score += 2
-
-    # Prior convictions
-    if nbr_prior_convictions is not None:
-        if nbr_prior_convictions == 1:
-            pass
-        elif 1 < nbr_prior_convictions < 5:
-            score += 1
-        elif nbr_prior_convictions >= 5:
-            score += 2
-    if gender is not None and gender == "M":
-        score +=1
-    if ethnicity is not None and ethnicity == "Other":
-        if score == 0:
-            score = 1
-        score *= 1.2
-
-    # Age multiplier
-    if age is not None and age < 25:
-        if score == 0:
-            score = 1 
-        score *= 2.5
-
-    return float(score)
-
-def max_possible_score_for_row(row, use_encounters, use_convictions, use_age, use_ethnicity, use_gender):
-    # Worst-case inputs for enabled features, keeping the person's actual age for the age rule
-    worst_encounters = 2 if use_encounters else 0
-    worst_convictions = 2 if use_convictions else 0
-    worst_gender = 1 if use_gender else 0
-    base = worst_encounters + worst_convictions + worst_gender
-    if use_age and row["age"] < 25:
-        if base == 0:
-            base = 1
-        base *= 2.5
-    if use_ethnicity and row['ethnicity'] == "Other":
-        if base == 0:
-            base = 1
-        base *= 1.2
-    return float(base)
+# Profiles uploaded in the sidebar, else the demo profiles or the Arrow file given by ALGODISC_DATASET (memory-mapped
+# and shared by all sessions)
+df = session_population(st.session_state)
+
+# Names of the toggles, used in the contribution charts
+feature_labels = {"gender": "Genre", "ethnicity": "Origine / nationalité", "encounters": "Rencontres avec la police", "convictions": "Condamnations", "age": "Âge", "zip_code": "Code postal"}
+
+# Names of the mitigations offered in the profiles section
+intervention_labels = {"none": "Aucune", "group_thresholds": "Seuils par groupe", "reweighing": "Repondération", "suppress_proxies": "Retirer les informations indirectes"}
+
+# Ways of showing the profiles
+view_labels = {"cards": "Cartes", "compact": "Tableau compact"}
+
+# Information shown for each profile in the compact view, as on the cards
+profile_fields = [("Nom", "name"), ("Âge", "age"), ("Genre", "gender"), ("Origine / nationalité", "ethnicity"), ("Nombre de condamnations", "convictions"), ("Nombre de rencontres avec la police", "encounters")]
+if "zip_code" in df.columns:
+    profile_fields.append(("Code postal", "zip_code"))
 
 # ---------- UI ----------
 
@@ -136,91 +103,139 @@ st.subheader("Créez votre système")
 with st.container(border=True):
     "Vous allez ici créer votre propre système d’évaluation du risque. Vous pouvez sélectionner les informations que vous souhaitez utiliser (plusieurs choix possibles) et vous verrez les évaluations des profils changer en conséquence."
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.write("Sélectionnez les informations que vous souhaitez utiliser dans votre système :")
-
-    use_gender = st.toggle("Genre", key="use_gender")
-    if use_gender:
-        st.info("Selon [l’Office fédéral de la statistique](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html), les hommes ont tendance à présenter un taux de récidive plus élevé que les femmes. Nous n’avons pas de données concernant les autres genres.")
-    use_ethnicity = st.toggle("Origine / nationalité", key="use_ethnicity")
-    if use_ethnicity:
-        st.info("Selon [cette analyse](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html) de l’Office fédéral de la statistique, les personnes non suisses ont tendance à récidiver davantage.")
-    use_encounters = st.toggle("Nombre de rencontres avec la police", key="use_encounters")
-    if use_encounters:
-        st.info("Comme les contrôles de police peuvent être effectués sur des bases discriminatoires, le nombre de rencontres avec la police peut induire de la discrimination via les données. Les rencontres incluent toute interaction avec la police, des contrôles routiers aux interventions policières.")
-    use_convictions = st.toggle("Nombre de condamnations antérieures", key="use_convictions")
-    if use_convictions:
-        st.info("Le taux de condamnations peut être influencé par des décisions discriminatoires, ce qui impacte le score de récidive.")
-    use_age = st.toggle("Âge", key="use_age")
-    if use_age:
-        st.info("Selon [cette étude sur le système américain **COMPAS**](https://www.propublica.org/article/how-we-analyzed-the-compas-recidivism-algorithm), les personnes plus jeunes sont souvent considérées comme présentant un risque plus élevé de récidive.")
-
-st.subheader("Profils")
-
-# ---------- Compute scores dynamically on every rerun ----------
-scores = []
-percents = []
-for _, row in df.iterrows():
-    kwargs = {}
-    if use_gender:
-        kwargs["gender"] = row["gender"]
-    if use_ethnicity:
-        kwargs["ethnicity"] = row["ethnicity"]
-    if use_encounters:
-        kwargs["nbr_encounter_police"] = row["encounters"]
-    if use_convictions:
-        kwargs["nbr_prior_convictions"] = row["convictions"]
-    if use_age:
-        kwargs["age"] = row["age"]
-
-    score = calculate_recidive_score(**kwargs)
-    scores.append(score)
-
-    # Convert to percent relative to this profile's max possible given current toggles
-    max_score = max_possible_score_for_row(row, use_encounters, use_convictions, use_age, use_ethnicity, use_gender)
-    percent = 0.0 if max_score == 0 else (score / max_score) * 100.0
-    percents.append(round(percent, 1))
-
-df_display = df.copy()
-df_display["recidive_score_percent"] = percents
-
-# ---------- Show cards ----------
-row1 = st.columns(4)
-row2 = st.columns(4)
-cards = row1 + row2
-nbr_low = 0
-nbr_medium = 0
-nbr_high = 0
-
-for i, col in enumerate(cards):
-    with col.container(border=True):
-        c1, c2 = st.columns(2)
-        c1.write("**Profil**")
-        c1.image(f"assets/img/user.png")
-        c2.write(f"**Nom**: {df_display['name'][i]}")
-        c2.write(f"**Âge**: {df_display['age'][i]}")
-        c2.write(f"**Genre**: {df_display['gender'][i]}")
-        c2.write(f"**Origine / nationalité**: {df_display['ethnicity'][i]}")
-        c2.write(f"**Nombre de condamnations**: {df_display['convictions'][i]}")
-        c2.write(f"**Nombre de rencontres avec la police**: {df_display['encounters'][i]}")
-
-        pct = df_display["recidive_score_percent"][i]
-        if pct < 33:
-            nbr_low += 1
-            st.info(f"Score de récidive : {pct}%")
-        elif 33 <= pct < 66:
-            nbr_medium += 1
-            st.warning(f"Score de récidive : {pct}%")
-        else:
-            nbr_high += 1
-            st.error(f"Score de récidive : {pct}%")
-
-with col2:
-    st.info(f"Nombre de profils à faible risque : {nbr_low}")
-    st.warning(f"Nombre de profils à risque moyen : {nbr_medium}")
-    st.error(f"Nombre de profils à risque élevé : {nbr_high}")
+# ---------- System and profiles ----------
+# Only this fragment reruns when a toggle changes, the static text and the survey are left untouched
+@st.fragment
+def create_system_and_profiles():
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.write("Sélectionnez les informations que vous souhaitez utiliser dans votre système :")
+
+        use_gender = st.toggle("Genre", key="use_gender")
+        if use_gender:
+            st.info("Selon [l’Office fédéral de la statistique](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html), les hommes ont tendance à présenter un taux de récidive plus élevé que les femmes. Nous n’avons pas de données concernant les autres genres.")
+        use_ethnicity = st.toggle("Origine / nationalité", key="use_ethnicity")
+        if use_ethnicity:
+            st.info("Selon [cette analyse](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html) de l’Office fédéral de la statistique, les personnes non suisses ont tendance à récidiver davantage.")
+        use_encounters = st.toggle("Nombre de rencontres avec la police", key="use_encounters")
+        if use_encounters:
+            st.info("Comme les contrôles de police peuvent être effectués sur des bases discriminatoires, le nombre de rencontres avec la police peut induire de la discrimination via les données. Les rencontres incluent toute interaction avec la police, des contrôles routiers aux interventions policières.")
+        use_convictions = st.toggle("Nombre de condamnations antérieures", key="use_convictions")
+        if use_convictions:
+            st.info("Le taux de condamnations peut être influencé par des décisions discriminatoires, ce qui impacte le score de récidive.")
+        use_age = st.toggle("Âge", key="use_age")
+        if use_age:
+            st.info("Selon [cette étude sur le système américain **COMPAS**](https://www.propublica.org/article/how-we-analyzed-the-compas-recidivism-algorithm), les personnes plus jeunes sont souvent considérées comme présentant un risque plus élevé de récidive.")
+        use_zip_code = st.toggle("Code postal", key="use_zip_code")
+        if use_zip_code:
+            st.info("Un code postal ne dit rien d’une personne, mais certaines régions comptent une part bien plus élevée de résidents étrangers que d’autres. Un système qui utilise le code postal peut donc discriminer selon l’origine sans jamais l’utiliser directement. La part de résidents étrangers par région provient de l’[Office fédéral de la statistique](https://www.bfs.admin.ch/bfs/fr/home/statistiques/population.html).")
+
+    with col2:
+        what_if = st.toggle("Et si… ? Montrer l’effet d’un autre genre, d’une autre origine ou d’un autre âge", key="use_what_if")
+        if what_if:
+            st.info("Chaque profil indique aussi comment son score changerait si son genre (M ↔ F), son origine (Suisse ↔ Autre) ou son âge (en dessous ou au-dessus de 25 ans) était différent, toutes les autres informations restant les mêmes.")
+        show_contributions = st.toggle("Montrer la contribution de chaque information au score", key="use_contributions")
+        if show_contributions:
+            st.info("La barre sous chaque profil répartit son score entre les informations sélectionnées. Les parts sont des valeurs de Shapley exactes : chaque information reçoit son effet moyen sur tous les ordres possibles d’ajout des informations sélectionnées.")
+        intervention = st.selectbox("Mesure de correction", INTERVENTIONS, format_func=intervention_labels.get, key="intervention")
+        if intervention == "group_thresholds":
+            st.info("Les profils suisses et non suisses reçoivent chacun leur propre seuil de risque élevé, afin que la même part de chaque groupe soit classée à risque élevé, à un profil près. Les scores ne changent pas, seule la couleur de certains profils change : les groupes sont traités différemment pour obtenir des résultats égaux.")
+        elif intervention == "reweighing":
+            st.info("Dans chaque groupe, les profils sont classés par score et reçoivent le score du même rang dans l’ensemble de la population, afin que chaque groupe ait les mêmes parts de risque faible, moyen et élevé, à un profil près.")
+        elif intervention == "suppress_proxies":
+            st.info("Le système ignore l’origine ainsi que toute information qui la révèle fortement (V de Cramér d’au moins 0,2, voir la page Laboratoire).")
+
+    st.subheader("Profils")
+    view = st.radio("Affichage", ("cards", "compact"), format_func=view_labels.get, horizontal=True, key="profile_view",
+                    help="Le tableau compact montre les mêmes informations en un seul bloc, qui se charge plus vite sur les connexions et appareils lents.")
+
+    # ---------- Compute scores ----------
+    # Only the first profiles are shown
+    nbr_profiles = min(8, len(df))
+    # Scores are shared between all sessions, each toggle combination is only computed once per population
+    mask = toggle_mask(gender=use_gender, ethnicity=use_ethnicity, encounters=use_encounters, convictions=use_convictions, age=use_age, zip_code=use_zip_code)
+    record_change(st.session_state, "French", "mask", mask)
+    record_change(st.session_state, "French", "intervention", intervention)
+    # The mitigation can change the scores, the buckets or the information that is used
+    result = cached_intervention(df, mask, intervention)
+    publish_choice(st.session_state, mask, intervention, result.after)
+    # Uncertainty of the counters and of the gap, from resamples of the profiles
+    intervals = cached_bootstrap(df, mask, intervention, nbr_profiles)
+    mask, scored = result.mask, result.scored
+    if what_if:
+        deltas = cached_counterfactuals(df, mask, nbr_profiles)
+    if show_contributions:
+        contributions = shapley_values(df, mask, nbr_profiles)
+
+    # ---------- Show profiles ----------
+    if what_if:
+        what_if_notes = [f"Et si… genre : {deltas['gender'][0][i]:+.1f} pts ({deltas['gender'][1][i]:+.1f}%) · origine : {deltas['ethnicity'][0][i]:+.1f} pts ({deltas['ethnicity'][1][i]:+.1f}%) · âge : {deltas['age'][0][i]:+.1f} pts ({deltas['age'][1][i]:+.1f}%)" for i in range(nbr_profiles)]
+
+    if view == "compact":
+        # One HTML block for all profiles instead of about ten elements per card
+        nbr_low, nbr_medium, nbr_high = np.bincount(scored.bucket[:nbr_profiles], minlength=3)
+        notes = [[] for _ in range(nbr_profiles)]
+        for i in range(nbr_profiles):
+            if what_if:
+                notes[i].append(what_if_notes[i])
+            if show_contributions and mask:
+                notes[i].append("Contributions : " + " · ".join(f"{feature_labels[feature]} {contributions[i, j]:+.1f} pts" for j, feature in enumerate(FEATURES) if uses(mask, feature)))
+        st.html(render_profiles(df, scored, profile_fields, "Score de récidive", nbr_profiles, notes))
+    else:
+        row1 = st.columns(4)
+        row2 = st.columns(4)
+        cards = (row1 + row2)[:nbr_profiles]
+        names = profile_names(df, nbr_profiles)
+        nbr_low = 0
+        nbr_medium = 0
+        nbr_high = 0
+
+        for i, col in enumerate(cards):
+            with col.container(border=True):
+                c1, c2 = st.columns(2)
+                c1.write("**Profil**")
+                c1.image(f"assets/img/user.png")
+                c2.write(f"**Nom**: {names[i]}")
+                c2.write(f"**Âge**: {df['age'][i]}")
+                c2.write(f"**Genre**: {df['gender'][i]}")
+                c2.write(f"**Origine / nationalité**: {df['ethnicity'][i]}")
+                c2.write(f"**Nombre de condamnations**: {df['convictions'][i]}")
+                c2.write(f"**Nombre de rencontres avec la police**: {df['encounters'][i]}")
+                if "zip_code" in df.columns:
+                    c2.write(f"**Code postal**: {df['zip_code'][i]}")
+
+                pct = scored.percent[i]
+                if scored.bucket[i] == LOW:
+                    nbr_low += 1
+                    st.info(f"Score de récidive : {pct}%")
+                elif scored.bucket[i] == MEDIUM:
+                    nbr_medium += 1
+                    st.warning(f"Score de récidive : {pct}%")
+                else:
+                    nbr_high += 1
+                    st.error(f"Score de récidive : {pct}%")
+
+                if what_if:
+                    st.caption(what_if_notes[i])
+
+                if show_contributions and mask:
+                    st.bar_chart({feature_labels[feature]: [contributions[i, j]] for j, feature in enumerate(FEATURES) if uses(mask, feature)},
+                                 horizontal=True, stack=True, x_label="Points de score", height=120)
+
+    with col2:
+        shown, gap = intervals["shown"], intervals["population"]["high_risk_gap"]
+        st.info(f"Nombre de profils à faible risque : {nbr_low} (intervalle à 95 % : {shown['low'][0]:.0f} à {shown['low'][1]:.0f})")
+        st.warning(f"Nombre de profils à risque moyen : {nbr_medium} (intervalle à 95 % : {shown['medium'][0]:.0f} à {shown['medium'][1]:.0f})")
+        st.error(f"Nombre de profils à risque élevé : {nbr_high} (intervalle à 95 % : {shown['high'][0]:.0f} à {shown['high'][1]:.0f})")
+        if intervention != "none":
+            st.caption(f"Écart de taux de risque élevé entre profils non suisses et suisses : {result.before['high_risk_gap']:+.1f} points sans la mesure, {result.after['high_risk_gap']:+.1f} points avec.")
+        if not np.isnan(result.after["high_risk_gap"]):
+            st.caption(f"Écart de taux de risque élevé entre personnes non suisses et suisses, sur l’ensemble des {len(df)} profils : {result.after['high_risk_gap']:+.1f} points (intervalle à 95 % : {gap[0]:+.1f} à {gap[1]:+.1f} points).", help=f"Les intervalles viennent de {RESAMPLES} rééchantillonnages bootstrap : les profils sont tirés à nouveau au hasard, avec remise, et les chiffres sont recalculés. Avec peu de profils, les chiffres auraient facilement pu être différents.")
+        if result.suppressed:
+            st.caption(f"Informations ignorées : {', '.join(feature_labels[feature] for feature in result.suppressed)}")
+
+create_system_and_profiles()
 
 st.divider()
 
@@ -242,12 +257,16 @@ expander_weight.write("""
 Toutes les informations ne jouent pas le même rôle dans le calcul du score de récidive. 
 Par exemple, certaines variables (comme l’« âge ») pèsent plus lourd que d’autres. 
 Cela provient de l’architecture de l’algorithme utilisé pour l’évaluation, et donc de sa construction et programmation.""")
+expander_weight.write("Lorsque les six informations sont utilisées, voici la contribution moyenne de chacune au score des profils (valeurs de Shapley exactes) :")
+expander_weight.bar_chart({feature_labels[feature]: [value] for feature, value in zip(FEATURES, mean_shapley_values(df, NBR_MASKS - 1))},
+                          horizontal=True, stack=True, x_label="Points de score", height=120)
 
 expander_missing = st.expander("Le système serait-il plus juste si l’on supprimait certaines informations sensibles (genre, origine, etc.) ?")
 expander_missing.write("""
 Le fait de supprimer certaines informations ne signifie pas nécessairement moins de discrimination. 
 Par exemple, même si l’origine ou l’ethnicité ne sont pas prises en compte dans les systèmes suisses (comme [FaST](https://www.rosnet.ch/fr-ch/Processus/Tri) ou [FOTRES](https://www.mwv-berlin.de/produkte/!/title/fotres--forensisches-operationalisiertes-therapie-risiko-evaluations-system/id/804)), la discrimination peut être présente via les données et les pratiques. 
 Le profilage racial est un bon exemple : il influence les statistiques d’arrestations ou de contrôles de police. On peut aussi utiliser le code postal pour déduire indirectement l’origine d’une personne via des statistiques démographiques régionales.""")
+expander_missing.write("La page Laboratoire mesure à quel point chaque information révèle l’origine d’une personne.")
 
 expander_box = st.expander("Quelle est la situation en Suisse ?")
 expander_box.write("""
@@ -1,8 +1,18 @@
+import numpy as np
 import streamlit as st
-import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
+from engine.attribution import mean_shapley_values, shapley_values
+from engine.bootstrap import RESAMPLES, cached_bootstrap
+from engine.classroom import publish_choice
+from engine.compact import profile_names, render_profiles
+from engine.counterfactual import cached_counterfactuals
+from engine.interventions import INTERVENTIONS, cached_intervention
+from engine.scoring import FEATURES, LOW, MEDIUM, NBR_MASKS, toggle_mask, uses
+from engine.telemetry import record_change
+from engine.upload import session_population
+
 st.set_page_config(page_title="Diskriminierung durch Daten und Algorithmen", layout="wide")
 
 # Function to authenticate and connect to Google Sheets using Streamlit Secrets
@@ -32,58 +42,26 @@ def update_google_sheet(data):
     sheet.append_row(data)
 
 # ---------- Data ----------
-df = pd.DataFrame({
-    "name": ["John", "Janine", "Joe", "Jack", "Janet", "Jocelyn", "Leo", "Lara"],
-    "age": [21, 18, 36, 98, 45, 63, 28, 24],
-    "ethnicity": ["Schweizer", "Andere", "Schweizer", "Andere", "Andere", "Andere", "Andere", "Schweizer"],
-    "convictions": [0, 1, 2, 3, 4, 5, 0, 9],
-    "encounters": [12, 2, 0, 0, 45, 5, 2, 9],
-    "gender": ["M", "F", "N/S", "N/S", "M", "F", "M", "N/S"],
-})
-
-# ---------- Scoring logic ----------
-def calculate_recidive_score(*, nbr_encounter_police=None, nbr_prior_convictions=None, age=None, gender=None, ethnicity=None):
-    score = 0
-    if nbr_encounter_police is not None:
-        if nbr_encounter_police == 0:
-            pass
-        elif 0 < nbr_encounter_police < 10:
-            score += 1
-        elif nbr_encounter_police >= 10:
-            score += 2
-    if nbr_prior_convictions is not None:
-        if nbr_prior_convictions == 1:
-            pass
-        elif 1 < nbr_prior_convictions < 5:
-            score += 1
-        elif nbr_prior_convictions >= 5:
-            score += 2
-    if gender is not None and gender == "M":
-        score +=1
-    if ethnicity is not None and ethnicity == "Andere":
-        if score == 0:
-            score = 1
-        score *= 1.2
-    if age is not None and age < 25:
-        if score == 0:
-            score = 1 
-        score *= 2.5
-    return float(score)
-
-def max_possible_score_for_row(row, use_encounters, use_convictions, use_age, use_ethnicity, use_gender):
-    worst_encounters = 2 if use_encounters else 0
-    worst_convictions = 2 if use_convictions else 0
-    worst_gender = 1 if use_gender else 0
-    base = worst_encounters + worst_convictions + worst_gender
-    if use_age and row["age"] < 25:
-        if base == 0:
-            base = 1
-        base *= 2.5
-    if use_ethnicity and row['ethnicity'] == "Andere":
-        if base == 0:
-            base = 1
-        base *= 1.2
-    return float(base)
+# Profiles uploaded in the sidebar, else the demo profiles or the Arrow file given by ALGODISC_DATASET (memory-mapped
+# and shared by all sessions)
+df = session_population(st.session_state)
+
+# Labels shown on the cards, the data uses the same values as the other languages
+ethnicity_labels = {"Swiss": "Schweizer", "Other": "Andere"}
+
+# Names of the toggles, used in the contribution charts
+feature_labels = {"gender": "Geschlecht", "ethnicity": "Ethnizität", "encounters": "Polizeikontakte", "convictions": "Verurteilungen", "age": "Alter", "zip_code": "Postleitzahl"}
+
+# Names of the mitigations offered in the profiles section
+intervention_labels = {"none": "Keine", "group_thresholds": "Schwellen pro Gruppe", "reweighing": "Neugewichtung", "suppress_proxies": "Stellvertretende Informationen entfernen"}
+
+# Ways of showing the profiles
+view_labels = {"cards": "Karten", "compact": "Kompakte Tabelle"}
+
+# Information shown for each profile in the compact view, as on the cards
+profile_fields = [("Name", "name"), ("Alter", "age"), ("Geschlecht", "gender"), ("Ethnizität", "ethnicity"), ("Anzahl Verurteilungen", "convictions"), ("Anzahl Polizeikontakte", "encounters")]
+if "zip_code" in df.columns:
+    profile_fields.append(("Postleitzahl", "zip_code"))
 
 # ---------- UI ----------
 
@@ -121,88 +99,139 @@ st.subheader("Erstellen Sie Ihr System")
 with st.container(border=True):
     "Hier erstellen Sie Ihr eigenes Risikobewertungssystem. Wählen Sie die Informationen aus, die Sie verwenden möchten (mehrere gleichzeitig möglich), und beobachten Sie, wie sich die Bewertungen der Profile ändern."
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.write("Wählen Sie die Informationen, die Sie in Ihrem System verwenden möchten:")
-
-    use_gender = st.toggle("Geschlecht", key="use_gender")
-    if use_gender:
-        st.info("Laut dem [Bundesamt für Statistik](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html) neigen Männer eher zu Rückfällen als Frauen. Für andere Geschlechter liegen keine Daten vor.")
-    use_ethnicity = st.toggle("Ethnizität", key="use_ethnicity")
-    if use_ethnicity:
-        st.info("Laut [dieser Analyse](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html) des Bundesamtes für Statistik neigen Nicht-Schweizer häufiger zu Rückfällen.")
-    use_encounters = st.toggle("Anzahl Polizeikontakte", key="use_encounters")
-    if use_encounters:
-        st.info("Da Polizeikontrollen diskriminierend erfolgen können, führen Zahlen zu Polizeikontakten zu Diskriminierung durch Daten. Kontakte umfassen alle Interaktionen, von Verkehrskontrollen bis Polizeieinsätzen.")
-    use_convictions = st.toggle("Anzahl früherer Verurteilungen", key="use_convictions")
-    if use_convictions:
-        st.info("Die Anzahl der Verurteilungen kann durch diskriminierende Entscheidungen beeinflusst sein und so den Rückfall-Score verzerren.")
-    use_age = st.toggle("Alter", key="use_age")
-    if use_age:
-        st.info("Laut [dieser Studie zum US-System **COMPAS**](https://www.propublica.org/article/how-we-analyzed-the-compas-recidivism-algorithm) werden jüngere Personen tendenziell als riskantere Profile eingestuft.")
-
-st.subheader("Profile")
-
-# ---------- Compute scores ----------
-scores = []
-percents = []
-for _, row in df.iterrows():
-    kwargs = {}
-    if use_gender:
-        kwargs["gender"] = row["gender"]
-    if use_ethnicity:
-        kwargs["ethnicity"] = row["ethnicity"]
-    if use_encounters:
-        kwargs["nbr_encounter_police"] = row["encounters"]
-    if use_convictions:
-        kwargs["nbr_prior_convictions"] = row["convictions"]
-    if use_age:
-        kwargs["age"] = row["age"]
-    score = calculate_recidive_score(**kwargs)
-    scores.append(score)
-    max_score = max_possible_score_for_row(row, use_encounters, use_convictions, use_age, use_ethnicity, use_gender)
-    percent = 0.0 if max_score == 0 else (score / max_score) * 100.0
-    percents.append(round(percent, 1))
-
-df_display = df.copy()
-df_display["rezidiv_score_prozent"] = percents
-
-# ---------- Show cards ----------
-row1 = st.columns(4)
-row2 = st.columns(4)
-cards = row1 + row2
-nbr_low = 0
-nbr_medium = 0
-nbr_high = 0
-
-for i, col in enumerate(cards):
-    with col.container(border=True):
-        c1, c2 = st.columns(2)
-        c1.write("**Profil**")
-        c1.image(f"assets/img/user.png")
-        c2.write(f"**Name**: {df_display['name'][i]}")
-        c2.write(f"**Alter**: {df_display['age'][i]}")
-        c2.write(f"**Geschlecht**: {df_display['gender'][i]}")
-        c2.write(f"**Ethnizität**: {df_display['ethnicity'][i]}")
-        c2.write(f"**Anzahl Verurteilungen**: {df_display['convictions'][i]}")
-        c2.write(f"**Anzahl Polizeikontakte**: {df_display['encounters'][i]}")
-
-        pct = df_display["rezidiv_score_prozent"][i]
-        if pct < 33:
-            st.info(f"Rückfall-Score: {pct}%")
-            nbr_low += 1
-        elif 33 <= pct < 66:
-            nbr_medium += 1
-            st.warning(f"Rückfall-Score: {pct}%")
-        else:
-            nbr_high += 1
-            st.error(f"Rückfall-Score: {pct}%")
-
-with col2:
-    st.info(f"Anzahl Profile mit geringem Risiko: {nbr_low}")
-    st.warning(f"Anzahl Profile mit mittlerem Risiko: {nbr_medium}")
-    st.error(f"Anzahl Profile mit hohem Risiko: {nbr_high}")
+# ---------- System and profiles ----------
+# Only this fragment reruns when a toggle changes, the static text and the survey are left untouched
+@st.fragment
+def create_system_and_profiles():
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.write("Wählen Sie die Informationen, die Sie in Ihrem System verwenden möchten:")
+
+        use_gender = st.toggle("Geschlecht", key="use_gender")
+        if use_gender:
+            st.info("Laut dem [Bundesamt für Statistik](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html) neigen Männer eher zu Rückfällen als Frauen. Für andere Geschlechter liegen keine Daten vor.")
+        use_ethnicity = st.toggle("Ethnizität", key="use_ethnicity")
+        if use_ethnicity:
+            st.info("Laut [dieser Analyse](https://www.bfs.admin.ch/bfs/fr/home/statistiques/criminalite-droit-penal/recidive/analyses.html) des Bundesamtes für Statistik neigen Nicht-Schweizer häufiger zu Rückfällen.")
+        use_encounters = st.toggle("Anzahl Polizeikontakte", key="use_encounters")
+        if use_encounters:
+            st.info("Da Polizeikontrollen diskriminierend erfolgen können, führen Zahlen zu Polizeikontakten zu Diskriminierung durch Daten. Kontakte umfassen alle Interaktionen, von Verkehrskontrollen bis Polizeieinsätzen.")
+        use_convictions = st.toggle("Anzahl früherer Verurteilungen", key="use_convictions")
+        if use_convictions:
+            st.info("Die Anzahl der Verurteilungen kann durch diskriminierende Entscheidungen beeinflusst sein und so den Rückfall-Score verzerren.")
+        use_age = st.toggle("Alter", key="use_age")
+        if use_age:
+            st.info("Laut [dieser Studie zum US-System **COMPAS**](https://www.propublica.org/article/how-we-analyzed-the-compas-recidivism-algorithm) werden jüngere Personen tendenziell als riskantere Profile eingestuft.")
+        use_zip_code = st.toggle("Postleitzahl", key="use_zip_code")
+        if use_zip_code:
+            st.info("Eine Postleitzahl sagt nichts über eine Person aus, aber in manchen Regionen ist der Anteil der ausländischen Wohnbevölkerung viel höher als in anderen. Ein System, das die Postleitzahl verwendet, kann daher nach Herkunft diskriminieren, ohne sie je direkt zu verwenden. Der Ausländeranteil pro Region stammt vom [Bundesamt für Statistik](https://www.bfs.admin.ch/bfs/de/home/statistiken/bevoelkerung.html).")
+
+    with col2:
+        what_if = st.toggle("Was wäre, wenn? Wirkung eines anderen Geschlechts, einer anderen Ethnizität oder eines anderen Alters zeigen", key="use_what_if")
+        if what_if:
+            st.info("Jedes Profil zeigt zusätzlich, wie sich sein Score ändern würde, wenn Geschlecht (M ↔ F), Ethnizität (Schweizer ↔ Andere) oder Alter (unter oder über 25) anders wären, bei sonst gleichen Angaben.")
+        show_contributions = st.toggle("Beitrag jeder Information zum Score anzeigen", key="use_contributions")
+        if show_contributions:
+            st.info("Der Balken unter jedem Profil teilt seinen Score auf die ausgewählten Informationen auf. Die Anteile sind exakte Shapley-Werte: Jede Information erhält ihre durchschnittliche Wirkung über alle möglichen Reihenfolgen, in denen die ausgewählten Informationen hinzugefügt werden können.")
+        intervention = st.selectbox("Korrekturmassnahme", INTERVENTIONS, format_func=intervention_labels.get, key="intervention")
+        if intervention == "group_thresholds":
+            st.info("Schweizer und nicht-schweizerische Profile erhalten je eine eigene Schwelle für hohes Risiko, damit in jeder Gruppe bis auf ein Profil der gleiche Anteil als hohes Risiko eingestuft wird. Die Scores ändern sich nicht, nur die Farbe einiger Profile: Die Gruppen werden unterschiedlich behandelt, um gleiche Ergebnisse zu erhalten.")
+        elif intervention == "reweighing":
+            st.info("Innerhalb jeder Gruppe werden die Profile nach Score geordnet und erhalten den Score des gleichen Rangs in der gesamten Bevölkerung, damit jede Gruppe bis auf ein Profil die gleichen Anteile an niedrigem, mittlerem und hohem Risiko hat.")
+        elif intervention == "suppress_proxies":
+            st.info("Das System ignoriert die Ethnizität und jede Information, die sie stark verrät (Cramérs V von mindestens 0,2, siehe Seite Labor).")
+
+    st.subheader("Profile")
+    view = st.radio("Ansicht", ("cards", "compact"), format_func=view_labels.get, horizontal=True, key="profile_view",
+                    help="Die kompakte Tabelle zeigt dieselben Informationen in einem einzigen Block, der auf langsamen Verbindungen und Geräten schneller lädt.")
+
+    # ---------- Compute scores ----------
+    # Only the first profiles are shown
+    nbr_profiles = min(8, len(df))
+    # Scores are shared between all sessions, each toggle combination is only computed once per population
+    mask = toggle_mask(gender=use_gender, ethnicity=use_ethnicity, encounters=use_encounters, convictions=use_convictions, age=use_age, zip_code=use_zip_code)
+    record_change(st.session_state, "German", "mask", mask)
+    record_change(st.session_state, "German", "intervention", intervention)
+    # The mitigation can change the scores, the buckets or the information that is used
+    result = cached_intervention(df, mask, intervention)
+    publish_choice(st.session_state, mask, intervention, result.after)
+    # Uncertainty of the counters and of the gap, from resamples of the profiles
+    intervals = cached_bootstrap(df, mask, intervention, nbr_profiles)
+    mask, scored = result.mask, result.scored
+    if what_if:
+        deltas = cached_counterfactuals(df, mask, nbr_profiles)
+    if show_contributions:
+        contributions = shapley_values(df, mask, nbr_profiles)
+
+    # ---------- Show profiles ----------
+    if what_if:
+        what_if_notes = [f"Was wäre, wenn… Geschlecht: {deltas['gender'][0][i]:+.1f} Pkt. ({deltas['gender'][1][i]:+.1f}%) · Ethnizität: {deltas['ethnicity'][0][i]:+.1f} Pkt. ({deltas['ethnicity'][1][i]:+.1f}%) · Alter: {deltas['age'][0][i]:+.1f} Pkt. ({deltas['age'][1][i]:+.1f}%)" for i in range(nbr_profiles)]
+
+    if view == "compact":
+        # One HTML block for all profiles instead of about ten elements per card
+        nbr_low, nbr_medium, nbr_high = np.bincount(scored.bucket[:nbr_profiles], minlength=3)
+        notes = [[] for _ in range(nbr_profiles)]
+        for i in range(nbr_profiles):
+            if what_if:
+                notes[i].append(what_if_notes[i])
+            if show_contributions and mask:
+                notes[i].append("Beiträge: " + " · ".join(f"{feature_labels[feature]} {contributions[i, j]:+.1f} Pkt." for j, feature in enumerate(FEATURES) if uses(mask, feature)))
+        st.html(render_profiles(df, scored, profile_fields, "Rückfall-Score", nbr_profiles, notes, value_labels={"ethnicity": ethnicity_labels}))
+    else:
+        row1 = st.columns(4)
+        row2 = st.columns(4)
+        cards = (row1 + row2)[:nbr_profiles]
+        names = profile_names(df, nbr_profiles)
+        nbr_low = 0
+        nbr_medium = 0
+        nbr_high = 0
+
+        for i, col in enumerate(cards):
+            with col.container(border=True):
+                c1, c2 = st.columns(2)
+                c1.write("**Profil**")
+                c1.image(f"assets/img/user.png")
+                c2.write(f"**Name**: {names[i]}")
+                c2.write(f"**Alter**: {df['age'][i]}")
+                c2.write(f"**Geschlecht**: {df['gender'][i]}")
+                c2.write(f"**Ethnizität**: {ethnicity_labels.get(df['ethnicity'][i], df['ethnicity'][i])}")
+                c2.write(f"**Anzahl Verurteilungen**: {df['convictions'][i]}")
+                c2.write(f"**Anzahl Polizeikontakte**: {df['encounters'][i]}")
+                if "zip_code" in df.columns:
+                    c2.write(f"**Postleitzahl**: {df['zip_code'][i]}")
+
+                pct = scored.percent[i]
+                if scored.bucket[i] == LOW:
+                    st.info(f"Rückfall-Score: {pct}%")
+                    nbr_low += 1
+                elif scored.bucket[i] == MEDIUM:
+                    nbr_medium += 1
+                    st.warning(f"Rückfall-Score: {pct}%")
+                else:
+                    nbr_high += 1
+                    st.error(f"Rückfall-Score: {pct}%")
+
+                if what_if:
+                    st.caption(what_if_notes[i])
+
+                if show_contributions and mask:
+                    st.bar_chart({feature_labels[feature]: [contributions[i, j]] for j, feature in enumerate(FEATURES) if uses(mask, feature)},
+                                 horizontal=True, stack=True, x_label="Score-Punkte", height=120)
+
+    with col2:
+        shown, gap = intervals["shown"], intervals["population"]["high_risk_gap"]
+        st.info(f"Anzahl Profile mit geringem Risiko: {nbr_low} (95-%-Intervall: {shown['low'][0]:.0f} bis {shown['low'][1]:.0f})")
+        st.warning(f"Anzahl Profile mit mittlerem Risiko: {nbr_medium} (95-%-Intervall: {shown['medium'][0]:.0f} bis {shown['medium'][1]:.0f})")
+        st.error(f"Anzahl Profile mit hohem Risiko: {nbr_high} (95-%-Intervall: {shown['high'][0]:.0f} bis {shown['high'][1]:.0f})")
+        if intervention != "none":
+            st.caption(f"Unterschied der Hochrisiko-Anteile zwischen nicht-schweizerischen und Schweizer Profilen: {result.before['high_risk_gap']:+.1f} Prozentpunkte ohne die Massnahme, {result.after['high_risk_gap']:+.1f} Prozentpunkte mit ihr.")
+        if not np.isnan(result.after["high_risk_gap"]):
+            st.caption(f"Unterschied der Hochrisiko-Anteile zwischen nicht-schweizerischen und Schweizer Personen, über alle {len(df)} Profile: {result.after['high_risk_gap']:+.1f} Prozentpunkte (95-%-Intervall: {gap[0]:+.1f} bis {gap[1]:+.1f} Prozentpunkte).", help=f"Die Intervalle stammen aus {RESAMPLES} Bootstrap-Stichproben: Die Profile werden zufällig und mit Zurücklegen neu gezogen, und die Zahlen werden neu berechnet. Mit wenigen Profilen hätten die Zahlen leicht anders ausfallen können.")
+        if result.suppressed:
+            st.caption(f"Ignorierte Informationen: {', '.join(feature_labels[feature] for feature in result.suppressed)}")
+
+create_system_and_profiles()
 
 st.divider()
 
@@ -224,6 +253,9 @@ expander_weight.write("""
 Nicht alle Informationen spielen dieselbe Rolle bei der Berechnung des Rückfall-Scores. 
 Bestimmte Variablen (z. B. „Alter“) haben ein größeres Gewicht als andere. 
 Das ergibt sich aus der Architektur des Algorithmus und wird durch die Programmierung vorgegeben.""")
+expander_weight.write("Wenn alle sechs Informationen verwendet werden, trägt jede durchschnittlich so viel zum Score der Profile bei (exakte Shapley-Werte):")
+expander_weight.bar_chart({feature_labels[feature]: [value] for feature, value in zip(FEATURES, mean_shapley_values(df, NBR_MASKS - 1))},
+                          horizontal=True, stack=True, x_label="Score-Punkte", height=120)
 
 expander_missing = st.expander("Wäre das System fairer, wenn sensible Informationen (z. B. Geschlecht oder Ethnizität) weggelassen würden?")
 expander_missing.write("""
@@ -232,6 +264,7 @@ Auch wenn Ethnizität oder Herkunft in Schweizer Systemen wie [FaST](https://www
 nicht berücksichtigt werden, kann Diskriminierung durch Daten und Praktiken dennoch auftreten. 
 Racial Profiling ist ein gutes Beispiel für versteckte Diskriminierung, die sich in Verhaftungszahlen oder Polizeikontakten zeigt. 
 Auch Postleitzahlen könnten genutzt werden, um indirekt die Herkunft zu erschließen.""")
+expander_missing.write("Die Seite Labor misst, wie stark jede Information die Ethnizität einer Person verrät.")
 
 expander_box = st.expander("Wie ist die Situation in der Schweiz?")
 expander_box.write("""
@@ -1,8 +1,18 @@
+import numpy as np
 import streamlit as st
-import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
+from engine.attribution import mean_shapley_values, shapley_values
+from engine.bootstrap import RESAMPLES, cached_bootstrap
+from engine.classroom import publish_choice
+from engine.compact import profile_names, render_profiles
+from engine.counterfactual import cached_counterfactuals
+from engine.interventions import INTERVENTIONS, cached_intervention
+from engine.scoring import FEATURES, LOW, MEDIUM, NBR_MASKS, toggle_mask, uses
+from engine.telemetry import record_change
+from engine.upload import session_population
+
 
 st.set_page_config(page_title="Discriminazione tramite dati e algoritmi", layout="wide")
 
@@ -42,66 +52,23 @@ def update_google_sheet(data):
     sheet.append_row(data)  # Add the form data as a new row
 
 # ---------- Data ----------
-df = pd.DataFrame({
-    "name": ["John", "Janine", "Joe", "Jack", "Janet", "Jocelyn", "Leo", "Lara"],
-    "age": [21, 18, 36, 98, 45, 63, 28, 24],
-    "ethnicity": ["Swiss", "Other", "Swiss", "Other", "Other", "Other", "Other", "Swiss"],
-    "convictions": [0, 1, 2, 3, 4, 5, 0, 9],
-    "encounters": [12, 2, 0, 0, 45, 5, 2, 9],
-    "gender": ["M", "F", "N/S", "N/S", "M", "F", "M", "N/S"],
-})
-
-# ---------- Scoring logic (same as yours, kept simple) ----------
-def calculate_recidive_score(*, nbr_encounter_police=None, nbr_prior_convictions=None, age=None, gender=None, ethnicity=None):
-    score = 0
-
-    # Encounters with police
-    if nbr_encounter_police is not None:
-        if nbr_encounter_police == 0:
-            pass
-        elif 0 < nbr_encounter_police < 10:
-            score += 1
-        elif nbr_encounter_police >= 10:
-            score += 2
-
-    # Prior convictions
-    if nbr_prior_convictions is not None:
-        if nbr_prior_convictions == 1:
-            pass
-        elif 1 < nbr_prior_convictions < 5:
-            score += 1
-        elif nbr_prior_convictions >= 5:
-            score += 2
-    if gender is not None and gender == "M":
-        score +=1
-    if ethnicity is not None and ethnicity == "Other":
-        if score == 0:
-            score = 1
-        score *= 1.2
-
-    # Age multiplier
-    if age is not None and age < 25:
-        if score == 0:
-            score = 1 
-        score *= 2.5
-
-    return float(score)
-
-def max_possible_score_for_row(row, use_encounters, use_convictions, use_age, use_ethnicity, use_gender):
-    # Worst-case inputs for enabled features, keeping the person's actual age for the age rule
-    worst_encounters = 2 if use_encounters else 0
-    worst_convictions = 2 if use_convictions else 0
-    worst_gender = 1 if use_gender else 0
-    base = worst_encounters + worst_convictions + worst_gender
-    if use_age and row["age"] < 25:
-        if base == 0:
-            base = 1
-        base *= 2.5
-    if use_ethnicity and row['ethnicity'] == "Other":
-        if base == 0:
-            base = 1
-        base *= 1.2
-    return float(base)
+# Profiles uploaded in the sidebar, else the demo profiles or the Arrow file given by ALGODISC_DATASET (memory-mapped
+# and shared by all sessions)
+df = session_population(st.session_state)
+
+# Names of the toggles, used in the contribution charts
+feature_labels = {"gender": "Genere", "ethnicity": "Origine / nazionalità", "encounters": "Incontri con la polizia", "convictions": "Condanne", "age": "Età", "zip_code": "Codice postale"}
+
+# Names of the mitigations offered in the profiles section
+intervention_labels = {"none": "Nessuna", "group_thresholds": "Soglie per gruppo", "reweighing": "Riponderazione", "suppress_proxies": "Rimuovere le informazioni indirette"}
+
+# Ways of showing the profiles
+view_labels = {"cards": "Schede", "compact": "Tabella compatta"}
+
+# Information shown for each profile in the compact view, as on the cards
+profile_fields = [("Nome", "name"), ("Età", "age"), ("Genere", "gender"), ("Origine / nazionalità", "ethnicity"), ("Numero di condanne", "convictions"), ("Numero di incontri con la polizia", "encounters")]
+if "zip_code" in df.columns:
+    profile_fields.append(("Codice postale", "zip_code"))
 
 # ---------- UI ----------
 
@@ -138,92 +105,140 @@ st.subheader("Create il vostro sistema")
 with st.container(border=True):
     "Qui creerete il vostro sistema di valutazione del rischio. Potete selezionare le informazioni che volete usare (anche più di una) e vedrete cambiare le valutazioni dei profili di conseguenza."
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.write("Selezionate le informazioni che volete usare nel vostro sistema:")
-
-    use_gender = st.toggle("Genere", key="use_gender")
-    if use_gender:
-        st.info("Secondo [l’Ufficio federale di statistica](https://www.bfs.admin.ch/bfs/it/home/statistiche/criminalita-diritto-penale/recidiva/analisi.html), gli uomini tendono ad avere un tasso di recidiva più elevato rispetto alle donne. Non abbiamo dati sugli altri generi.")
-    use_ethnicity = st.toggle("Origine / nazionalità", key="use_ethnicity")
-    if use_ethnicity:
-        st.info("Secondo [questa analisi](https://www.bfs.admin.ch/bfs/it/home/statistiche/criminalita-diritto-penale/recidiva/analisi.html) dell’Ufficio federale di statistica, le persone non svizzere tendono a recidivare di più.")
-    use_encounters = st.toggle("Numero di incontri con la polizia", key="use_encounters")
-    if use_encounters:
-        st.info("Poiché i controlli di polizia possono essere effettuati su basi discriminatorie, il numero di incontri con la polizia può introdurre discriminazione attraverso i dati. Gli incontri includono qualsiasi interazione con la polizia, dai controlli stradali agli interventi.")
-    use_convictions = st.toggle("Numero di condanne precedenti", key="use_convictions")
-    if use_convictions:
-        st.info("Il numero di condanne può essere influenzato da decisioni discriminatorie, con un impatto sul punteggio di recidiva.")
-    use_age = st.toggle("Età", key="use_age")
-    if use_age:
-        st.info("Secondo [questo studio sul sistema americano **COMPAS**](https://www.propublica.org/article/how-we-analyzed-the-compas-recidivism-algorithm), le persone più giovani sono spesso considerate a rischio più elevato di recidiva.")
-
-st.subheader("Profili")
-
-# ---------- Compute scores dynamically on every rerun ----------
-scores = []
-percents = []
-for _, row in df.iterrows():
-    kwargs = {}
-    if use_gender:
-        kwargs["gender"] = row["gender"]
-    if use_ethnicity:
-        kwargs["ethnicity"] = row["ethnicity"]
-    if use_encounters:
-        kwargs["nbr_encounter_police"] = row["encounters"]
-    if use_convictions:
-        kwargs["nbr_prior_convictions"] = row["convictions"]
-    if use_age:
-        kwargs["age"] = row["age"]
-
-    score = calculate_recidive_score(**kwargs)
-    scores.append(score)
-
-    # Convert to percent relative to this profile's max possible given current toggles
-    max_score = max_possible_score_for_row(row, use_encounters, use_convictions, use_age, use_ethnicity, use_gender)
-    percent = 0.0 if max_score == 0 else (score / max_score) * 100.0
-    percents.append(round(percent, 1))
-
-df_display = df.copy()
-df_display["recidive_score_percent"] = percents
-
-# ---------- Show cards ----------
-row1 = st.columns(4)
-row2 = st.columns(4)
-cards = row1 + row2
-nbr_low = 0
-nbr_medium = 0
-nbr_high = 0
-
-# ---------- Cards ----------
-for i, col in enumerate(cards):
-    with col.container(border=True):
-        c1, c2 = st.columns(2)
-        c1.write("**Profilo**")
-        c1.image(f"assets/img/user.png")
-        c2.write(f"**Nome**: {df_display['name'][i]}")
-        c2.write(f"**Età**: {df_display['age'][i]}")
-        c2.write(f"**Genere**: {df_display['gender'][i]}")
-        c2.write(f"**Origine / nazionalità**: {df_display['ethnicity'][i]}")
-        c2.write(f"**Numero di condanne**: {df_display['convictions'][i]}")
-        c2.write(f"**Numero di incontri con la polizia**: {df_display['encounters'][i]}")
-
-        pct = df_display["recidive_score_percent"][i]
-        if pct < 33:
-            nbr_low += 1
-            st.info(f"Punteggio di recidiva: {pct}%")
-        elif 33 <= pct < 66:
-            nbr_medium += 1
-            st.warning(f"Punteggio di recidiva: {pct}%")
-        else:
-            nbr_high += 1
-            st.error(f"Punteggio di recidiva: {pct}%")
-
-with col2:
-    st.info(f"Numero di profili a basso rischio: {nbr_low}")
-    st.warning(f"Numero di profili a rischio medio: {nbr_medium}")
-    st.error(f"Numero di profili ad alto rischio: {nbr_high}")
+# ---------- System and profiles ----------
+# Only this fragment reruns when a toggle changes, the static text and the survey are left untouched
+@st.fragment
+def create_system_and_profiles():
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.write("Selezionate le informazioni che volete usare nel vostro sistema:")
+
+        use_gender = st.toggle("Genere", key="use_gender")
+        if use_gender:
+            st.info("Secondo [l’Ufficio federale di statistica](https://www.bfs.admin.ch/bfs/it/home/statistiche/criminalita-diritto-penale/recidiva/analisi.html), gli uomini tendono ad avere un tasso di recidiva più elevato rispetto alle donne. Non abbiamo dati sugli altri generi.")
+        use_ethnicity = st.toggle("Origine / nazionalità", key="use_ethnicity")
+        if use_ethnicity:
+            st.info("Secondo [questa analisi](https://www.bfs.admin.ch/bfs/it/home/statistiche/criminalita-diritto-penale/recidiva/analisi.html) dell’Ufficio federale di statistica, le persone non svizzere tendono a recidivare di più.")
+        use_encounters = st.toggle("Numero di incontri con la polizia", key="use_encounters")
+        if use_encounters:
+            st.info("Poiché i controlli di polizia possono essere effettuati su basi discriminatorie, il numero di incontri con la polizia può introdurre discriminazione attraverso i dati. Gli incontri includono qualsiasi interazione con la polizia, dai controlli stradali agli interventi.")
+        use_convictions = st.toggle("Numero di condanne precedenti", key="use_convictions")
+        if use_convictions:
+            st.info("Il numero di condanne può essere influenzato da decisioni discriminatorie, con un impatto sul punteggio di recidiva.")
+        use_age = st.toggle("Età", key="use_age")
+        if use_age:
+            st.info("Secondo [questo studio sul sistema americano **COMPAS**](https://www.propublica.org/article/how-we-analyzed-the-compas-recidivism-algorithm), le persone più giovani sono spesso considerate a rischio più elevato di recidiva.")
+        use_zip_code = st.toggle("Codice postale", key="use_zip_code")
+        if use_zip_code:
+            st.info("Un codice postale non dice nulla di una persona, ma alcune regioni hanno una quota di residenti stranieri molto più alta di altre. Un sistema che usa il codice postale può quindi discriminare in base all’origine senza mai usarla direttamente. La quota di residenti stranieri per regione proviene dall’[Ufficio federale di statistica](https://www.bfs.admin.ch/bfs/it/home/statistiche/popolazione.html).")
+
+    with col2:
+        what_if = st.toggle("E se…? Mostrare l’effetto di un altro genere, di un’altra origine o di un’altra età", key="use_what_if")
+        if what_if:
+            st.info("Ogni profilo mostra anche come cambierebbe il suo punteggio se il genere (M ↔ F), l’origine (Svizzera ↔ Altro) o l’età (sotto o sopra i 25 anni) fossero diversi, a parità di tutte le altre informazioni.")
+        show_contributions = st.toggle("Mostrare il contributo di ogni informazione al punteggio", key="use_contributions")
+        if show_contributions:
+            st.info("La barra sotto ogni profilo ripartisce il suo punteggio tra le informazioni selezionate. Le quote sono valori di Shapley esatti: ogni informazione riceve il suo effetto medio su tutti gli ordini possibili in cui le informazioni selezionate possono essere aggiunte.")
+        intervention = st.selectbox("Misura correttiva", INTERVENTIONS, format_func=intervention_labels.get, key="intervention")
+        if intervention == "group_thresholds":
+            st.info("I profili svizzeri e non svizzeri ricevono ciascuno una propria soglia di rischio elevato, affinché la stessa quota di ogni gruppo sia classificata ad alto rischio, a meno di un profilo. I punteggi non cambiano, cambia solo il colore di alcuni profili: i gruppi sono trattati in modo diverso per ottenere risultati uguali.")
+        elif intervention == "reweighing":
+            st.info("All’interno di ogni gruppo i profili sono ordinati per punteggio e ricevono il punteggio dello stesso rango nell’intera popolazione, affinché ogni gruppo abbia le stesse quote di rischio basso, medio ed elevato, a meno di un profilo.")
+        elif intervention == "suppress_proxies":
+            st.info("Il sistema ignora l’origine e ogni informazione che la rivela fortemente (V di Cramér di almeno 0,2, vedi la pagina Laboratorio).")
+
+    st.subheader("Profili")
+    view = st.radio("Visualizzazione", ("cards", "compact"), format_func=view_labels.get, horizontal=True, key="profile_view",
+                    help="La tabella compatta mostra le stesse informazioni in un unico blocco, che si carica più velocemente su connessioni e dispositivi lenti.")
+
+    # ---------- Compute scores ----------
+    # Only the first profiles are shown
+    nbr_profiles = min(8, len(df))
+    # Scores are shared between all sessions, each toggle combination is only computed once per population
+    mask = toggle_mask(gender=use_gender, ethnicity=use_ethnicity, encounters=use_encounters, convictions=use_convictions, age=use_age, zip_code=use_zip_code)
+    record_change(st.session_state, "Italian", "mask", mask)
+    record_change(st.session_state, "Italian", "intervention", intervention)
+    # The mitigation can change the scores, the buckets or the information that is used
+    result = cached_intervention(df, mask, intervention)
+    publish_choice(st.session_state, mask, intervention, result.after)
+    # Uncertainty of the counters and of the gap, from resamples of the profiles
+    intervals = cached_bootstrap(df, mask, intervention, nbr_profiles)
+    mask, scored = result.mask, result.scored
+    if what_if:
+        deltas = cached_counterfactuals(df, mask, nbr_profiles)
+    if show_contributions:
+        contributions = shapley_values(df, mask, nbr_profiles)
+
+    # ---------- Show profiles ----------
+    if what_if:
+        what_if_notes = [f"E se… genere: {deltas['gender'][0][i]:+.1f} pti ({deltas['gender'][1][i]:+.1f}%) · origine: {deltas['ethnicity'][0][i]:+.1f} pti ({deltas['ethnicity'][1][i]:+.1f}%) · età: {deltas['age'][0][i]:+.1f} pti ({deltas['age'][1][i]:+.1f}%)" for i in range(nbr_profiles)]
+
+    if view == "compact":
+        # One HTML block for all profiles instead of about ten elements per card
+        nbr_low, nbr_medium, nbr_high = np.bincount(scored.bucket[:nbr_profiles], minlength=3)
+        notes = [[] for _ in range(nbr_profiles)]
+        for i in range(nbr_profiles):
+            if what_if:
+                notes[i].append(what_if_notes[i])
+            if show_contributions and mask:
+                notes[i].append("Contributi: " + " · ".join(f"{feature_labels[feature]} {contributions[i, j]:+.1f} pti" for j, feature in enumerate(FEATURES) if uses(mask, feature)))
+        st.html(render_profiles(df, scored, profile_fields, "Punteggio di recidiva", nbr_profiles, notes))
+    else:
+        row1 = st.columns(4)
+        row2 = st.columns(4)
+        cards = (row1 + row2)[:nbr_profiles]
+        names = profile_names(df, nbr_profiles)
+        nbr_low = 0
+        nbr_medium = 0
+        nbr_high = 0
+
+        # ---------- Cards ----------
+        for i, col in enumerate(cards):
+            with col.container(border=True):
+                c1, c2 = st.columns(2)
+                c1.write("**Profilo**")
+                c1.image(f"assets/img/user.png")
+                c2.write(f"**Nome**: {names[i]}")
+                c2.write(f"**Età**: {df['age'][i]}")
+                c2.write(f"**Genere**: {df['gender'][i]}")
+                c2.write(f"**Origine / nazionalità**: {df['ethnicity'][i]}")
+                c2.write(f"**Numero di condanne**: {df['convictions'][i]}")
+                c2.write(f"**Numero di incontri con la polizia**: {df['encounters'][i]}")
+                if "zip_code" in df.columns:
+                    c2.write(f"**Codice postale**: {df['zip_code'][i]}")
+
+                pct = scored.percent[i]
+                if scored.bucket[i] == LOW:
+                    nbr_low += 1
+                    st.info(f"Punteggio di recidiva: {pct}%")
+                elif scored.bucket[i] == MEDIUM:
+                    nbr_medium += 1
+                    st.warning(f"Punteggio di recidiva: {pct}%")
+                else:
+                    nbr_high += 1
+                    st.error(f"Punteggio di recidiva: {pct}%")
+
+                if what_if:
+                    st.caption(what_if_notes[i])
+
+                if show_contributions and mask:
+                    st.bar_chart({feature_labels[feature]: [contributions[i, j]] for j, feature in enumerate(FEATURES) if uses(mask, feature)},
+                                 horizontal=True, stack=True, x_label="Punti di punteggio", height=120)
+
+    with col2:
+        shown, gap = intervals["shown"], intervals["population"]["high_risk_gap"]
+        st.info(f"Numero di profili a basso rischio: {nbr_low} (intervallo al 95%: da {shown['low'][0]:.0f} a {shown['low'][1]:.0f})")
+        st.warning(f"Numero di profili a rischio medio: {nbr_medium} (intervallo al 95%: da {shown['medium'][0]:.0f} a {shown['medium'][1]:.0f})")
+        st.error(f"Numero di profili ad alto rischio: {nbr_high} (intervallo al 95%: da {shown['high'][0]:.0f} a {shown['high'][1]:.0f})")
+        if intervention != "none":
+            st.caption(f"Differenza della quota ad alto rischio tra profili non svizzeri e svizzeri: {result.before['high_risk_gap']:+.1f} punti senza la misura, {result.after['high_risk_gap']:+.1f} punti con la misura.")
+        if not np.isnan(result.after["high_risk_gap"]):
+            st.caption(f"Differenza della quota ad alto rischio tra persone non svizzere e svizzere, sull’insieme dei {len(df)} profili: {result.after['high_risk_gap']:+.1f} punti (intervallo al 95%: da {gap[0]:+.1f} a {gap[1]:+.1f} punti).", help=f"Gli intervalli provengono da {RESAMPLES} ricampionamenti bootstrap: i profili vengono estratti di nuovo a caso, con reinserimento, e i numeri vengono ricalcolati. Con pochi profili, i numeri avrebbero potuto facilmente essere diversi.")
+        if result.suppressed:
+            st.caption(f"Informazioni ignorate: {', '.join(feature_labels[feature] for feature in result.suppressed)}")
+
+create_system_and_profiles()
 
 st.divider()
 
@@ -245,6 +260,9 @@ expander_weight.write("""
 Non tutte le informazioni giocano lo stesso ruolo nel calcolo del punteggio di recidiva. 
 Per esempio, alcune variabili (come l’«età») pesano di più di altre. 
 Ciò deriva dall’architettura dell’algoritmo usato per la valutazione, cioè dalla sua costruzione e programmazione.""")
+expander_weight.write("Quando tutte e sei le informazioni sono utilizzate, ecco il contributo medio di ciascuna al punteggio dei profili (valori di Shapley esatti):")
+expander_weight.bar_chart({feature_labels[feature]: [value] for feature, value in zip(FEATURES, mean_shapley_values(df, NBR_MASKS - 1))},
+                          horizontal=True, stack=True, x_label="Punti di punteggio", height=120)
 
 expander_missing = st.expander("Il sistema sarebbe più giusto se eliminassimo alcune informazioni sensibili (genere, origine, ecc.)?")
 expander_missing.write("""
@@ -252,6 +270,7 @@ Eliminare alcune informazioni non significa necessariamente meno discriminazione
 Per esempio, anche se l’origine o l’etnia non sono prese in considerazione nei sistemi svizzeri (come [FaST](https://www.rosnet.ch/fr-ch/Processus/Tri) o [FOTRES](https://www.mwv-berlin.de/produkte/!/title/fotres--forensisches-operationalisiertes-therapie-risiko-evaluations-system/id/804)), la discriminazione può essere presente attraverso i dati e le pratiche. 
 Il profilaggio razziale è un buon esempio: influenza le statistiche di arresti o controlli di polizia. 
 Si può anche usare il codice postale per dedurre indirettamente l’origine di una persona tramite statistiche demografiche regionali.""")
+expander_missing.write("La pagina Laboratorio misura quanto ogni informazione rivela l’origine di una persona.")
 
 expander_box = st.expander("Qual è la situazione in Svizzera?")
 expander_box.write("""
@@ -0,0 +1,59 @@
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+from engine.classroom import format_gap, format_rate, get_room, normalize_code, reset_room
+from engine.scoring import FEATURES, mask_features
+
+st.title("Classroom")
+
+"""
+For workshops: participants enter the room code in the sidebar (or open the app with `?room=CODE` at the end of its address). This page shows which information the room included in their systems and how these systems treat non-Swiss and Swiss profiles. It is updated every two seconds.
+"""
+
+# Names of the toggles and mitigations, as on the homepage
+feature_labels = {"gender": "Gender", "ethnicity": "Ethnicity", "encounters": "Police encounters", "convictions": "Convictions", "age": "Age", "zip_code": "ZIP code"}
+intervention_labels = {"none": "None", "group_thresholds": "Group-specific thresholds", "reweighing": "Reweighing", "suppress_proxies": "Remove proxy information"}
+
+
+def system_label(mask):
+    return " + ".join(feature_labels[feature] for feature in mask_features(mask)) or "No information"
+
+
+# Only this fragment is rerun every two seconds, it reads the totals the room keeps up to date
+@st.fragment(run_every=2)
+def room_view(code):
+    snapshot = get_room(code).snapshot()
+    if not snapshot["participants"]:
+        st.info(f"Nobody has joined room {code} yet.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Participants", snapshot["participants"])
+    col2.metric("High-risk rate (non-Swiss)", format_rate(snapshot["high_risk_other"]))
+    col3.metric("High-risk rate (Swiss)", format_rate(snapshot["high_risk_swiss"]))
+    col4.metric("Gap (percentage points)", format_gap(snapshot["high_risk_gap"]))
+    st.caption("Average over the systems of all participants, with their mitigation.")
+
+    usage = pd.DataFrame({
+        "information": [feature_labels[feature] for feature in FEATURES],
+        "participants": [snapshot["feature_counts"][feature] for feature in FEATURES],
+    })
+    chart = alt.Chart(usage).mark_bar().encode(
+        alt.X("participants:Q", title="Participants using it", scale=alt.Scale(domain=[0, snapshot["participants"]])),
+        alt.Y("information:N", title=None, sort=None),
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+    counts = snapshot["mask_counts"]
+    popular = [mask for mask in counts.argsort()[::-1][:5] if counts[mask]]
+    st.write("**Most common systems**")
+    st.dataframe(pd.DataFrame({"System": [system_label(mask) for mask in popular], "Participants": counts[popular]}), hide_index=True)
+    st.caption("Mitigations: " + ", ".join(f"{intervention_labels[name]} ({count})" for name, count in snapshot["interventions"].items()))
+
+
+code = normalize_code(st.text_input("Room code", key="facilitator_room", help="Choose any code and give it to the participants."))
+if code:
+    if st.button("Reset the room"):
+        reset_room(code)
+    room_view(code)
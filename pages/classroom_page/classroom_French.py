@@ -0,0 +1,59 @@
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+from engine.classroom import format_gap, format_rate, get_room, normalize_code, reset_room
+from engine.scoring import FEATURES, mask_features
+
+st.title("Classe")
+
+"""
+Pour les ateliers : les participant·e·s entrent le code de salle dans la barre latérale (ou ouvrent l’application avec `?room=CODE` à la fin de son adresse). Cette page montre quelles informations la salle a incluses dans ses systèmes et comment ces systèmes traitent les profils non suisses et suisses. Elle est mise à jour toutes les deux secondes.
+"""
+
+# Names of the toggles and mitigations, as on the homepage
+feature_labels = {"gender": "Genre", "ethnicity": "Origine / nationalité", "encounters": "Rencontres avec la police", "convictions": "Condamnations", "age": "Âge", "zip_code": "Code postal"}
+intervention_labels = {"none": "Aucune", "group_thresholds": "Seuils par groupe", "reweighing": "Repondération", "suppress_proxies": "Retirer les informations indirectes"}
+
+
+def system_label(mask):
+    return " + ".join(feature_labels[feature] for feature in mask_features(mask)) or "Aucune information"
+
+
+# Only this fragment is rerun every two seconds, it reads the totals the room keeps up to date
+@st.fragment(run_every=2)
+def room_view(code):
+    snapshot = get_room(code).snapshot()
+    if not snapshot["participants"]:
+        st.info(f"Personne n’a encore rejoint la salle {code}.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Participant·e·s", snapshot["participants"])
+    col2.metric("Taux de risque élevé (non suisses)", format_rate(snapshot["high_risk_other"]))
+    col3.metric("Taux de risque élevé (suisses)", format_rate(snapshot["high_risk_swiss"]))
+    col4.metric("Écart (points de pourcentage)", format_gap(snapshot["high_risk_gap"]))
+    st.caption("Moyenne sur les systèmes de tou·te·s les participant·e·s, avec leur mesure de correction.")
+
+    usage = pd.DataFrame({
+        "information": [feature_labels[feature] for feature in FEATURES],
+        "participants": [snapshot["feature_counts"][feature] for feature in FEATURES],
+    })
+    chart = alt.Chart(usage).mark_bar().encode(
+        alt.X("participants:Q", title="Participant·e·s qui l’utilisent", scale=alt.Scale(domain=[0, snapshot["participants"]])),
+        alt.Y("information:N", title=None, sort=None),
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+    counts = snapshot["mask_counts"]
+    popular = [mask for mask in counts.argsort()[::-1][:5] if counts[mask]]
+    st.write("**Systèmes les plus fréquents**")
+    st.dataframe(pd.DataFrame({"Système": [system_label(mask) for mask in popular], "Participant·e·s": counts[popular]}), hide_index=True)
+    st.caption("Mesures de correction : " + ", ".join(f"{intervention_labels[name]} ({count})" for name, count in snapshot["interventions"].items()))
+
+
+code = normalize_code(st.text_input("Code de salle", key="facilitator_room", help="Choisissez un code et donnez-le aux participant·e·s."))
+if code:
+    if st.button("Réinitialiser la salle"):
+        reset_room(code)
+    room_view(code)
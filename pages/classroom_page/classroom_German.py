@@ -0,0 +1,59 @@
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+from engine.classroom import format_gap, format_rate, get_room, normalize_code, reset_room
+from engine.scoring import FEATURES, mask_features
+
+st.title("Klassenzimmer")
+
+"""
+Für Workshops: Die Teilnehmenden geben den Raumcode in der Seitenleiste ein (oder öffnen die App mit `?room=CODE` am Ende ihrer Adresse). Diese Seite zeigt, welche Informationen der Raum in seine Systeme aufgenommen hat und wie diese Systeme nicht-schweizerische und schweizerische Profile behandeln. Sie wird alle zwei Sekunden aktualisiert.
+"""
+
+# Names of the toggles and mitigations, as on the homepage
+feature_labels = {"gender": "Geschlecht", "ethnicity": "Ethnizität", "encounters": "Polizeikontakte", "convictions": "Verurteilungen", "age": "Alter", "zip_code": "Postleitzahl"}
+intervention_labels = {"none": "Keine", "group_thresholds": "Schwellen pro Gruppe", "reweighing": "Neugewichtung", "suppress_proxies": "Stellvertretende Informationen entfernen"}
+
+
+def system_label(mask):
+    return " + ".join(feature_labels[feature] for feature in mask_features(mask)) or "Keine Informationen"
+
+
+# Only this fragment is rerun every two seconds, it reads the totals the room keeps up to date
+@st.fragment(run_every=2)
+def room_view(code):
+    snapshot = get_room(code).snapshot()
+    if not snapshot["participants"]:
+        st.info(f"Noch niemand ist dem Raum {code} beigetreten.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Teilnehmende", snapshot["participants"])
+    col2.metric("Anteil hohes Risiko (Nicht-Schweizer)", format_rate(snapshot["high_risk_other"]))
+    col3.metric("Anteil hohes Risiko (Schweizer)", format_rate(snapshot["high_risk_swiss"]))
+    col4.metric("Unterschied (Prozentpunkte)", format_gap(snapshot["high_risk_gap"]))
+    st.caption("Durchschnitt über die Systeme aller Teilnehmenden, mit ihrer Korrekturmassnahme.")
+
+    usage = pd.DataFrame({
+        "information": [feature_labels[feature] for feature in FEATURES],
+        "participants": [snapshot["feature_counts"][feature] for feature in FEATURES],
+    })
+    chart = alt.Chart(usage).mark_bar().encode(
+        alt.X("participants:Q", title="Teilnehmende, die sie verwenden", scale=alt.Scale(domain=[0, snapshot["participants"]])),
+        alt.Y("information:N", title=None, sort=None),
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+    counts = snapshot["mask_counts"]
+    popular = [mask for mask in counts.argsort()[::-1][:5] if counts[mask]]
+    st.write("**Häufigste Systeme**")
+    st.dataframe(pd.DataFrame({"System": [system_label(mask) for mask in popular], "Teilnehmende": counts[popular]}), hide_index=True)
+    st.caption("Korrekturmassnahmen: " + ", ".join(f"{intervention_labels[name]} ({count})" for name, count in snapshot["interventions"].items()))
+
+
+code = normalize_code(st.text_input("Raumcode", key="facilitator_room", help="Wählen Sie einen Code und geben Sie ihn den Teilnehmenden."))
+if code:
+    if st.button("Raum zurücksetzen"):
+        reset_room(code)
+    room_view(code)
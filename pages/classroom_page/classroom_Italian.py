@@ -0,0 +1,59 @@
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+from engine.classroom import format_gap, format_rate, get_room, normalize_code, reset_room
+from engine.scoring import FEATURES, mask_features
+
+st.title("Classe")
+
+"""
+Per i workshop: i partecipanti inseriscono il codice dell’aula nella barra laterale (o aprono l’applicazione con `?room=CODE` alla fine del suo indirizzo). Questa pagina mostra quali informazioni l’aula ha incluso nei propri sistemi e come questi sistemi trattano i profili non svizzeri e svizzeri. Viene aggiornata ogni due secondi.
+"""
+
+# Names of the toggles and mitigations, as on the homepage
+feature_labels = {"gender": "Genere", "ethnicity": "Origine / nazionalità", "encounters": "Incontri con la polizia", "convictions": "Condanne", "age": "Età", "zip_code": "Codice postale"}
+intervention_labels = {"none": "Nessuna", "group_thresholds": "Soglie per gruppo", "reweighing": "Riponderazione", "suppress_proxies": "Rimuovere le informazioni indirette"}
+
+
+def system_label(mask):
+    return " + ".join(feature_labels[feature] for feature in mask_features(mask)) or "Nessuna informazione"
+
+
+# Only this fragment is rerun every two seconds, it reads the totals the room keeps up to date
+@st.fragment(run_every=2)
+def room_view(code):
+    snapshot = get_room(code).snapshot()
+    if not snapshot["participants"]:
+        st.info(f"Nessuno è ancora entrato nell’aula {code}.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Partecipanti", snapshot["participants"])
+    col2.metric("Tasso di rischio elevato (non svizzeri)", format_rate(snapshot["high_risk_other"]))
+    col3.metric("Tasso di rischio elevato (svizzeri)", format_rate(snapshot["high_risk_swiss"]))
+    col4.metric("Scarto (punti percentuali)", format_gap(snapshot["high_risk_gap"]))
+    st.caption("Media sui sistemi di tutti i partecipanti, con la loro misura correttiva.")
+
+    usage = pd.DataFrame({
+        "information": [feature_labels[feature] for feature in FEATURES],
+        "participants": [snapshot["feature_counts"][feature] for feature in FEATURES],
+    })
+    chart = alt.Chart(usage).mark_bar().encode(
+        alt.X("participants:Q", title="Partecipanti che la usano", scale=alt.Scale(domain=[0, snapshot["participants"]])),
+        alt.Y("information:N", title=None, sort=None),
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+    counts = snapshot["mask_counts"]
+    popular = [mask for mask in counts.argsort()[::-1][:5] if counts[mask]]
+    st.write("**Sistemi più frequenti**")
+    st.dataframe(pd.DataFrame({"Sistema": [system_label(mask) for mask in popular], "Partecipanti": counts[popular]}), hide_index=True)
+    st.caption("Misure correttive: " + ", ".join(f"{intervention_labels[name]} ({count})" for name, count in snapshot["interventions"].items()))
+
+
+code = normalize_code(st.text_input("Codice dell’aula", key="facilitator_room", help="Scegliete un codice e comunicatelo ai partecipanti."))
+if code:
+    if st.button("Azzerare l’aula"):
+        reset_room(code)
+    room_view(code)
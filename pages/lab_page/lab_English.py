@@ -0,0 +1,269 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from engine.compas import compas_available, load_compas
+from engine.feedback import cached_feedback
+from engine.outcomes import cached_outcome_analysis, has_outcomes
+from engine.proxies import cached_proxy_report
+from engine.scoring import DEFAULT_WEIGHTS, FEATURES, Weights, toggle_mask
+from engine.sensitivity import cached_sensitivity, heatmap_data
+from engine.simulation import cached_simulation, sample_profiles
+from engine.thresholds import simulated_threshold_analysis
+from engine.upload import session_population
+from engine.weight_search import cached_weight_search
+
+st.title("Lab")
+
+"""
+This page lets you explore the scoring system with larger, simulated populations. The results are computed on the fly and shared between visitors.
+"""
+
+# Names of the toggles, as on the homepage
+feature_labels = {"gender": "Gender", "ethnicity": "Ethnicity", "encounters": "Police encounters", "convictions": "Convictions", "age": "Age", "zip_code": "ZIP code"}
+
+# Names of the groups compared in the charts
+group_labels = {"Swiss": "Swiss", "Other": "Non-Swiss"}
+# In the COMPAS data the two groups are White people and everybody else
+compas_group_labels = {"Swiss": "White (Caucasian)", "Other": "Other groups"}
+
+# ---------- Bias simulation ----------
+st.subheader("Biased data: police encounters")
+
+@st.fragment
+def bias_simulation():
+    st.write("In this simulation, Swiss and non-Swiss people reoffend at exactly the same rate. Only the police behave differently: non-Swiss people are checked more often, so they accumulate more encounters. Many populations of 1,000 people are generated and scored to see how this bias in the data turns into a gap in the risk ratings.")
+
+    col1, col2 = st.columns(2)
+    oversampling = col1.slider("How many times more often are non-Swiss people checked by the police?", 1.0, 4.0, 2.0, 0.25)
+    replications = col2.select_slider("Number of simulated populations", [100, 500, 1000, 2000, 5000], value=1000)
+    features = st.multiselect("Information used by the system", FEATURES, default=["encounters", "convictions"], format_func=feature_labels.get)
+
+    results = cached_simulation(oversampling=oversampling, replications=replications, mask=toggle_mask(**{feature: True for feature in features}))
+    gap = results["high_risk_gap"]
+    low, median, high = np.nanpercentile(gap, [5, 50, 95])
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("High-risk rate (non-Swiss)", f"{np.nanmedian(results['high_risk_other']) * 100:.1f}%")
+    col2.metric("High-risk rate (Swiss)", f"{np.nanmedian(results['high_risk_swiss']) * 100:.1f}%")
+    col3.metric("Gap (percentage points)", f"{median:+.1f}")
+    st.caption(f"Median over {replications} simulated populations, 90% of the populations fall between {low:.1f} and {high:.1f} percentage points. Among people who did not reoffend, non-Swiss people are rated high-risk {np.nanmedian(results['false_positive_gap']):+.1f} percentage points more often.")
+
+    chart = alt.Chart(pd.DataFrame({"gap": gap})).mark_bar().encode(
+        alt.X("gap:Q", bin=alt.Bin(maxbins=40), title="Gap in high-risk rate (percentage points)"),
+        alt.Y("count()", title="Simulated populations"),
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+bias_simulation()
+
+# ---------- Feedback loop ----------
+st.subheader("Feedback loop: predictive policing")
+
+@st.fragment
+def feedback_simulation():
+    st.write("Police patrols are often sent where a system predicts risk. In this simulation, people rated high-risk are checked more often during the next round, and people rated medium-risk a little more often. Each extra check can add an encounter or a conviction to their record and raise their next score. Records are kept for ten rounds. Both groups reoffend at the same rate, and without this feedback the gap stays where the police bias puts it.")
+
+    col1, col2, col3 = st.columns(3)
+    oversampling = col1.slider("How many times more often are non-Swiss people checked by the police?", 1.0, 4.0, 2.0, 0.25, key="feedback_oversampling")
+    attention = col2.slider("How many times more often are people rated high-risk checked?", 1.0, 4.0, 2.0, 0.25)
+    rounds = col3.slider("Rounds", 5, 50, 30)
+    features = st.multiselect("Information used by the system", FEATURES, default=["encounters", "convictions"], format_func=feature_labels.get, key="feedback_features")
+
+    results = pd.DataFrame(cached_feedback(oversampling=oversampling, attention=attention, rounds=rounds, mask=toggle_mask(**{feature: True for feature in features}))).rename_axis("round").reset_index()
+    first, last = results.iloc[0], results.iloc[-1]
+
+    # Rising rates and gaps are shown in red
+    col1, col2, col3 = st.columns(3)
+    col1.metric("High-risk rate (non-Swiss)", f"{last['high_risk_other'] * 100:.1f}%", f"{(last['high_risk_other'] - first['high_risk_other']) * 100:+.1f}", delta_color="inverse")
+    col2.metric("High-risk rate (Swiss)", f"{last['high_risk_swiss'] * 100:.1f}%", f"{(last['high_risk_swiss'] - first['high_risk_swiss']) * 100:+.1f}", delta_color="inverse")
+    col3.metric("Gap (percentage points)", f"{last['high_risk_gap']:+.1f}", f"{last['high_risk_gap'] - first['high_risk_gap']:+.1f}", delta_color="inverse")
+    st.caption(f"After {rounds} rounds, in a simulated population of 100,000 people. The small numbers show the change since the first round. Among people who did not reoffend, the gap went from {first['false_positive_gap']:+.1f} to {last['false_positive_gap']:+.1f} percentage points.")
+
+    rates = results.melt("round", ["high_risk_other", "high_risk_swiss"], var_name="group", value_name="rate")
+    rates["group"] = rates["group"].map({"high_risk_other": group_labels["Other"], "high_risk_swiss": group_labels["Swiss"]})
+    rates_chart = alt.Chart(rates).mark_line().encode(alt.X("round:Q", title="Round"), alt.Y("rate:Q", title="Share rated high-risk"), alt.Color("group:N", title="Group"))
+    gap_chart = alt.Chart(results).mark_line().encode(alt.X("round:Q", title="Round"), alt.Y("high_risk_gap:Q", title="Gap in high-risk rate (percentage points)"))
+    col1, col2 = st.columns(2)
+    col1.altair_chart(rates_chart, use_container_width=True)
+    col2.altair_chart(gap_chart, use_container_width=True)
+
+feedback_simulation()
+
+# ---------- Threshold sweep ----------
+st.subheader("Where to draw the line? Risk thresholds")
+
+@st.fragment
+def threshold_analysis():
+    st.write("The profiles are rated high-risk from 66% and medium-risk from 33%. These cut points are a design choice. Below, a simulated population of 20,000 people with known outcomes (with the same police bias as above) is scored, and every possible cut point is evaluated at once.")
+
+    col1, col2 = st.columns(2)
+    oversampling = col1.slider("How many times more often are non-Swiss people checked by the police?", 1.0, 4.0, 2.0, 0.25, key="threshold_oversampling")
+    threshold = col2.slider("High-risk threshold (%)", 0, 100, 66)
+    features = st.multiselect("Information used by the system", FEATURES, default=["encounters", "convictions", "age"], format_func=feature_labels.get, key="threshold_features")
+
+    sweep, calibration = simulated_threshold_analysis(oversampling, toggle_mask(**{feature: True for feature in features}))
+    sweep = sweep[np.isfinite(sweep["threshold"])].assign(group=lambda frame: frame["group"].map(group_labels))
+    calibration = calibration.assign(group=lambda frame: frame["group"].map(group_labels))
+
+    # Statistics at the chosen threshold: the lowest cut point that is still above it
+    chosen = sweep[sweep["threshold"] >= threshold].groupby("group").last().reset_index()
+    if chosen.empty:
+        # No cut point reaches the threshold, e.g. without any information every profile scores 0%
+        st.info(f"Nobody is rated high-risk from {threshold}%: the highest score is {sweep['threshold'].max():.0f}%." + (" Without any information, every profile gets the same score." if not features else ""))
+    else:
+        for col, (_, row) in zip(st.columns(len(chosen)), chosen.iterrows()):
+            col.metric("Rated high-risk, {group}".format(group=row["group"]), f"{row['high_risk_rate'] * 100:.1f}%")
+            col.metric("Wrongly rated high-risk, {group}".format(group=row["group"]), f"{row['false_positive_rate'] * 100:.1f}%")
+
+    color = alt.Color("group:N", title="Group")
+    rates = alt.Chart(sweep).mark_line().encode(alt.X("threshold:Q", title="Threshold (%)"), alt.Y("high_risk_rate:Q", title="Share rated high-risk"), color)
+    rule = alt.Chart(pd.DataFrame({"threshold": [threshold]})).mark_rule(strokeDash=[4, 4]).encode(x="threshold:Q")
+    roc = alt.Chart(sweep).mark_line().encode(alt.X("false_positive_rate:Q", title="Share of non-reoffenders rated high-risk"), alt.Y("true_positive_rate:Q", title="Share of reoffenders rated high-risk"), color)
+    roc_points = alt.Chart(chosen).mark_point(size=80, filled=True).encode(x="false_positive_rate:Q", y="true_positive_rate:Q", color=color)
+    calibration_chart = alt.Chart(calibration).mark_line(point=True).encode(alt.X("mean_percent:Q", title="Average score (%)"), alt.Y("reoffense_rate:Q", title="Share who reoffended"), color)
+
+    col1, col2, col3 = st.columns(3)
+    col1.altair_chart(rates + rule, use_container_width=True)
+    col2.altair_chart(roc + roc_points, use_container_width=True)
+    col3.altair_chart(calibration_chart, use_container_width=True)
+    st.caption("Left: share of each group rated high-risk for every threshold. Middle: ROC curves, each point is a threshold and the marked point is the threshold chosen above. Right: calibration, a fair score would put both groups on the same curve.")
+
+threshold_analysis()
+
+# ---------- Weight sensitivity ----------
+st.subheader("How much do the weights matter?")
+
+# Names of the weights of the rules
+weight_labels = {"ethnicity_factor": "Multiplier for non-Swiss people", "age_factor": "Multiplier for young people", "age_threshold": "Age under which people count as young", "encounters_high": "Police encounters giving 2 points", "convictions_high": "Convictions giving 2 points"}
+
+@st.fragment
+def sensitivity_analysis():
+    st.write("The rules use fixed numbers. The scores of non-Swiss people are multiplied by 1.2 and those of people under 25 by 2.5. From 10 police encounters or 5 convictions, 2 points are added instead of 1. Here, every combination of other values is evaluated at once on a simulated population of 20,000 people with the police bias above. Choose two of these numbers; the other ones keep their values.")
+
+    col1, col2 = st.columns(2)
+    x = col1.selectbox("Horizontal axis", Weights._fields, index=Weights._fields.index("encounters_high"), format_func=weight_labels.get)
+    y = col2.selectbox("Vertical axis", [name for name in Weights._fields if name != x], index=2, format_func=weight_labels.get)
+    features = st.multiselect("Information used by the system", FEATURES, default=["ethnicity", "encounters", "convictions", "age"], format_func=feature_labels.get, key="sensitivity_features")
+
+    # Every weight setting is computed at once and cached, choosing other axes only slices the results
+    results = cached_sensitivity(sample_profiles(), toggle_mask(**{feature: True for feature in features}))
+    data = heatmap_data(results, x, y)
+    heatmap = alt.Chart(data).mark_rect().encode(
+        alt.X(f"{x}:O", title=weight_labels[x]),
+        alt.Y(f"{y}:O", title=weight_labels[y], sort="descending"),
+        alt.Color("high_risk_gap:Q", title="Gap (percentage points)", scale=alt.Scale(scheme="reds")),
+        tooltip=[x, y, alt.Tooltip("high_risk_gap:Q", format="+.1f")],
+    )
+    current = alt.Chart(pd.DataFrame({x: [getattr(DEFAULT_WEIGHTS, x)], y: [getattr(DEFAULT_WEIGHTS, y)]})).mark_rect(fill=None, stroke="black", strokeWidth=2).encode(x=f"{x}:O", y=f"{y}:O")
+    st.altair_chart(heatmap + current, use_container_width=True)
+    st.caption(f"Gap in high-risk rate between non-Swiss and Swiss people, in percentage points. The framed cell is the system of the homepage. Over all {len(results):,} combinations, the gap goes from {results['high_risk_gap'].min():+.1f} to {results['high_risk_gap'].max():+.1f} percentage points. The multipliers change little, because a score is shown as a share of the highest score the same person could get, which is multiplied too.")
+
+sensitivity_analysis()
+
+# ---------- Weight search ----------
+st.subheader("Can the weights be made fairer?")
+
+@st.fragment
+def weight_search():
+    st.write("An optimizer tries thousands of other values for the same numbers. It looks for a system with a smaller gap between non-Swiss and Swiss people that still ranks people in almost the same order as the original one. Agreement is measured with Spearman’s rank correlation: 1 means exactly the same order. The candidates that no other candidate beats on both counts form the Pareto front.")
+
+    min_agreement = st.slider("Minimum agreement with the original ranking", 0.5, 1.0, 0.9, 0.05)
+    features = st.multiselect("Information used by the system", FEATURES, default=["ethnicity", "encounters", "convictions", "age"], format_func=feature_labels.get, key="search_features")
+
+    results, front, original = cached_weight_search(sample_profiles(), toggle_mask(**{feature: True for feature in features}), min_agreement)
+    # The front is ordered by increasing gap, the first candidate that is close enough to the original ranking is the fairest
+    close_enough = front[front["agreement"] >= min_agreement]
+    if close_enough.empty:
+        st.info("With this information everybody gets the same score, whatever the weights: there is no ranking to keep and nothing to search. Choose at least one piece of information.")
+        return
+    best = close_enough.iloc[0]
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Gap with the original weights", f"{original['high_risk_gap']:+.1f}")
+    col2.metric("Gap with the weights found", f"{best['high_risk_gap']:+.1f}", f"{best['high_risk_gap'] - original['high_risk_gap']:+.1f}", delta_color="inverse")
+    col3.metric("Agreement with the original ranking", f"{best['agreement']:.2f}")
+
+    kinds = {"candidate": "Other candidates", "front": "Pareto front", "original": "Original weights"}
+    points = pd.concat([results.assign(kind="candidate"), front.assign(kind="front"), original.to_frame().T.assign(kind="original")], ignore_index=True)
+    points["kind"] = points["kind"].map(kinds)
+    chart = alt.Chart(points).mark_circle().encode(
+        alt.X("agreement:Q", title="Agreement with the original ranking", scale=alt.Scale(zero=False)),
+        alt.Y("high_risk_gap:Q", title="Gap in high-risk rate (percentage points)"),
+        alt.Color("kind:N", title="Candidate", scale=alt.Scale(domain=list(kinds.values()), range=["#c0c0c0", "#d62728", "#000000"])),
+        alt.Size("kind:N", scale=alt.Scale(domain=list(kinds.values()), range=[15, 60, 120]), legend=None),
+        tooltip=list(Weights._fields) + [alt.Tooltip("high_risk_gap:Q", format="+.1f"), alt.Tooltip("agreement:Q", format=".3f")],
+    )
+    st.altair_chart(chart, use_container_width=True)
+    st.caption(f"{len(results):,} candidates evaluated on a simulated population of 20,000 people. Each point is a candidate. Points to the lower right are fairer and closer to the original system. A smaller gap does not make the system fair: it still relies on police encounters that are biased.")
+
+    table = front[list(Weights._fields) + ["high_risk_gap", "agreement"]].rename(columns=dict(weight_labels, high_risk_gap="Gap (percentage points)", agreement="Agreement with the original ranking"))
+    st.dataframe(table.round(2), hide_index=True)
+
+weight_search()
+
+# ---------- Errors per group ----------
+st.subheader("Who does the system get wrong? Errors per group")
+
+@st.fragment
+def outcome_analysis():
+    st.write("ProPublica’s analysis of the US COMPAS system compared its mistakes between groups: who is wrongly rated high-risk although they do not reoffend, and who reoffends without being rated high-risk. The same analysis is run here on a population whose outcomes are known.")
+
+    population = session_population(st.session_state)
+    sources = {"simulated": "Simulated population (biased police encounters)"}
+    if compas_available():
+        sources["compas"] = "COMPAS, Broward County (ProPublica)"
+    if has_outcomes(population):
+        sources["app"] = "Dataset of the homepage"
+
+    col1, col2 = st.columns(2)
+    source = col1.selectbox("Population", list(sources), format_func=sources.get)
+    features = col2.multiselect("Information used by the system", FEATURES, default=["encounters", "convictions", "age"], format_func=feature_labels.get, key="outcome_features")
+
+    if source == "app":
+        df = population
+    elif source == "compas":
+        df = load_compas()
+        st.caption("The COMPAS data has no police encounters, so this information has no effect on its scores.")
+    else:
+        df = sample_profiles()
+    report = cached_outcome_analysis(df).report(toggle_mask(**{feature: True for feature in features}))
+    columns = {"profiles": "Profiles", "reoffense_rate": "Reoffended", "high_risk_rate": "Rated high-risk", "false_positive_rate": "False positives", "false_negative_rate": "False negatives", "precision": "Precision", "reoffense_rate_low": "Reoffended (low risk)", "reoffense_rate_medium": "Reoffended (medium risk)", "reoffense_rate_high": "Reoffended (high risk)"}
+    column_config = {name: st.column_config.NumberColumn(label, format="percent") for name, label in columns.items()}
+    column_config["profiles"] = st.column_config.NumberColumn(columns["profiles"])
+    st.dataframe(report.rename(index=compas_group_labels if source == "compas" else group_labels), column_config=column_config)
+    st.caption("False positives: share of the people who did not reoffend but were rated high-risk. False negatives: share of the people who reoffended but were not rated high-risk. Precision: share of the high-risk ratings that were right. The last three columns show how often the people of each risk level actually reoffended (calibration).")
+
+outcome_analysis()
+
+# ---------- Proxies ----------
+st.subheader("Hidden proxies: what reveals ethnicity?")
+
+@st.fragment
+def proxy_analysis():
+    st.write("Removing ethnicity from a system does not remove it from the data, because other information can reveal it. For each piece of information, the table measures how much it tells about ethnicity and gender: mutual information (in bits) and Cramér’s V (from 0, unrelated, to 1, fully determined).")
+
+    population = session_population(st.session_state)
+    sources = {"simulated": "Simulated population (biased police encounters)", "app": "Dataset of the homepage"}
+    if compas_available():
+        sources["compas"] = "COMPAS, Broward County (ProPublica)"
+    source = st.selectbox("Population", list(sources), format_func=sources.get, key="proxy_source")
+    df = {"simulated": sample_profiles, "app": lambda: population, "compas": load_compas}[source]()
+
+    report = cached_proxy_report(df)
+    labels = {**feature_labels, **{"reoffended": "Reoffended", "race": "Race (COMPAS)"}}
+    table = pd.DataFrame(index=[labels.get(name, name) for name in report.index])
+    for attribute in report.columns.levels[0]:
+        table["{attribute}: mutual information (bits)".format(attribute=labels[attribute])] = report[(attribute, "mutual_information")].to_numpy()
+        table["{attribute}: Cramér’s V".format(attribute=labels[attribute])] = report[(attribute, "cramers_v")].to_numpy()
+    st.dataframe(table.style.format("{:.3f}"))
+
+    if "ethnicity" in report.columns.levels[0]:
+        chart_data = pd.DataFrame({"feature": table.index, "cramers_v": report[("ethnicity", "cramers_v")].to_numpy()})
+        st.altair_chart(alt.Chart(chart_data).mark_bar().encode(
+            alt.X("cramers_v:Q", title="Cramér’s V with ethnicity", scale=alt.Scale(domain=[0, 1])),
+            alt.Y("feature:N", title="Information", sort="-x"),
+        ), use_container_width=True)
+
+proxy_analysis()
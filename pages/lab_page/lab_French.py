@@ -0,0 +1,269 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from engine.compas import compas_available, load_compas
+from engine.feedback import cached_feedback
+from engine.outcomes import cached_outcome_analysis, has_outcomes
+from engine.proxies import cached_proxy_report
+from engine.scoring import DEFAULT_WEIGHTS, FEATURES, Weights, toggle_mask
+from engine.sensitivity import cached_sensitivity, heatmap_data
+from engine.simulation import cached_simulation, sample_profiles
+from engine.thresholds import simulated_threshold_analysis
+from engine.upload import session_population
+from engine.weight_search import cached_weight_search
+
+st.title("Laboratoire")
+
+"""
+Cette page permet d’explorer le système d’évaluation avec des populations simulées plus grandes. Les résultats sont calculés à la volée et partagés entre les visiteurs.
+"""
+
+# Names of the toggles, as on the homepage
+feature_labels = {"gender": "Genre", "ethnicity": "Origine / nationalité", "encounters": "Rencontres avec la police", "convictions": "Condamnations", "age": "Âge", "zip_code": "Code postal"}
+
+# Names of the groups compared in the charts
+group_labels = {"Swiss": "Suisses", "Other": "Non suisses"}
+# In the COMPAS data the two groups are White people and everybody else
+compas_group_labels = {"Swiss": "Blancs (Caucasian)", "Other": "Autres groupes"}
+
+# ---------- Bias simulation ----------
+st.subheader("Données biaisées : les rencontres avec la police")
+
+@st.fragment
+def bias_simulation():
+    st.write("Dans cette simulation, les personnes suisses et non suisses récidivent exactement au même taux. Seule la police se comporte différemment : les personnes non suisses sont contrôlées plus souvent et accumulent donc plus de rencontres. De nombreuses populations de 1000 personnes sont générées et évaluées pour voir comment ce biais dans les données se traduit par un écart dans les évaluations du risque.")
+
+    col1, col2 = st.columns(2)
+    oversampling = col1.slider("Combien de fois plus souvent les personnes non suisses sont-elles contrôlées par la police ?", 1.0, 4.0, 2.0, 0.25)
+    replications = col2.select_slider("Nombre de populations simulées", [100, 500, 1000, 2000, 5000], value=1000)
+    features = st.multiselect("Informations utilisées par le système", FEATURES, default=["encounters", "convictions"], format_func=feature_labels.get)
+
+    results = cached_simulation(oversampling=oversampling, replications=replications, mask=toggle_mask(**{feature: True for feature in features}))
+    gap = results["high_risk_gap"]
+    low, median, high = np.nanpercentile(gap, [5, 50, 95])
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Taux de risque élevé (non suisses)", f"{np.nanmedian(results['high_risk_other']) * 100:.1f}%")
+    col2.metric("Taux de risque élevé (suisses)", f"{np.nanmedian(results['high_risk_swiss']) * 100:.1f}%")
+    col3.metric("Écart (points de pourcentage)", f"{median:+.1f}")
+    st.caption(f"Médiane sur {replications} populations simulées, 90 % des populations se situent entre {low:.1f} et {high:.1f} points de pourcentage. Parmi les personnes qui n’ont pas récidivé, les personnes non suisses sont évaluées à risque élevé {np.nanmedian(results['false_positive_gap']):+.1f} points de pourcentage plus souvent.")
+
+    chart = alt.Chart(pd.DataFrame({"gap": gap})).mark_bar().encode(
+        alt.X("gap:Q", bin=alt.Bin(maxbins=40), title="Écart du taux de risque élevé (points de pourcentage)"),
+        alt.Y("count()", title="Populations simulées"),
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+bias_simulation()
+
+# ---------- Feedback loop ----------
+st.subheader("Boucle de rétroaction : la police prédictive")
+
+@st.fragment
+def feedback_simulation():
+    st.write("Les patrouilles de police sont souvent envoyées là où un système prédit un risque. Dans cette simulation, les personnes évaluées à risque élevé sont contrôlées plus souvent au tour suivant, et celles évaluées à risque moyen un peu plus souvent. Chaque contrôle supplémentaire peut ajouter une rencontre ou une condamnation à leur dossier et augmenter leur prochain score. Les dossiers sont conservés pendant dix tours. Les deux groupes récidivent au même taux, et sans cette rétroaction l’écart reste là où le biais de la police le place.")
+
+    col1, col2, col3 = st.columns(3)
+    oversampling = col1.slider("Combien de fois plus souvent les personnes non suisses sont-elles contrôlées par la police ?", 1.0, 4.0, 2.0, 0.25, key="feedback_oversampling")
+    attention = col2.slider("Combien de fois plus souvent les personnes évaluées à risque élevé sont-elles contrôlées ?", 1.0, 4.0, 2.0, 0.25)
+    rounds = col3.slider("Tours", 5, 50, 30)
+    features = st.multiselect("Informations utilisées par le système", FEATURES, default=["encounters", "convictions"], format_func=feature_labels.get, key="feedback_features")
+
+    results = pd.DataFrame(cached_feedback(oversampling=oversampling, attention=attention, rounds=rounds, mask=toggle_mask(**{feature: True for feature in features}))).rename_axis("round").reset_index()
+    first, last = results.iloc[0], results.iloc[-1]
+
+    # Rising rates and gaps are shown in red
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Taux de risque élevé (non suisses)", f"{last['high_risk_other'] * 100:.1f}%", f"{(last['high_risk_other'] - first['high_risk_other']) * 100:+.1f}", delta_color="inverse")
+    col2.metric("Taux de risque élevé (suisses)", f"{last['high_risk_swiss'] * 100:.1f}%", f"{(last['high_risk_swiss'] - first['high_risk_swiss']) * 100:+.1f}", delta_color="inverse")
+    col3.metric("Écart (points de pourcentage)", f"{last['high_risk_gap']:+.1f}", f"{last['high_risk_gap'] - first['high_risk_gap']:+.1f}", delta_color="inverse")
+    st.caption(f"Après {rounds} tours, dans une population simulée de 100 000 personnes. Les petits nombres montrent l’évolution depuis le premier tour. Parmi les personnes qui n’ont pas récidivé, l’écart est passé de {first['false_positive_gap']:+.1f} à {last['false_positive_gap']:+.1f} points de pourcentage.")
+
+    rates = results.melt("round", ["high_risk_other", "high_risk_swiss"], var_name="group", value_name="rate")
+    rates["group"] = rates["group"].map({"high_risk_other": group_labels["Other"], "high_risk_swiss": group_labels["Swiss"]})
+    rates_chart = alt.Chart(rates).mark_line().encode(alt.X("round:Q", title="Tour"), alt.Y("rate:Q", title="Part évaluée à risque élevé"), alt.Color("group:N", title="Groupe"))
+    gap_chart = alt.Chart(results).mark_line().encode(alt.X("round:Q", title="Tour"), alt.Y("high_risk_gap:Q", title="Écart du taux de risque élevé (points de pourcentage)"))
+    col1, col2 = st.columns(2)
+    col1.altair_chart(rates_chart, use_container_width=True)
+    col2.altair_chart(gap_chart, use_container_width=True)
+
+feedback_simulation()
+
+# ---------- Threshold sweep ----------
+st.subheader("Où placer la limite ? Les seuils de risque")
+
+@st.fragment
+def threshold_analysis():
+    st.write("Les profils sont évalués à risque élevé à partir de 66 % et à risque moyen à partir de 33 %. Ces seuils sont un choix de conception. Ci-dessous, une population simulée de 20 000 personnes dont on connaît la récidive (avec le même biais policier que ci-dessus) est évaluée, et tous les seuils possibles sont analysés d’un coup.")
+
+    col1, col2 = st.columns(2)
+    oversampling = col1.slider("Combien de fois plus souvent les personnes non suisses sont-elles contrôlées par la police ?", 1.0, 4.0, 2.0, 0.25, key="threshold_oversampling")
+    threshold = col2.slider("Seuil de risque élevé (%)", 0, 100, 66)
+    features = st.multiselect("Informations utilisées par le système", FEATURES, default=["encounters", "convictions", "age"], format_func=feature_labels.get, key="threshold_features")
+
+    sweep, calibration = simulated_threshold_analysis(oversampling, toggle_mask(**{feature: True for feature in features}))
+    sweep = sweep[np.isfinite(sweep["threshold"])].assign(group=lambda frame: frame["group"].map(group_labels))
+    calibration = calibration.assign(group=lambda frame: frame["group"].map(group_labels))
+
+    # Statistics at the chosen threshold: the lowest cut point that is still above it
+    chosen = sweep[sweep["threshold"] >= threshold].groupby("group").last().reset_index()
+    if chosen.empty:
+        # No cut point reaches the threshold, e.g. without any information every profile scores 0%
+        st.info(f"Personne n’est évalué à risque élevé à partir de {threshold}% : le score le plus élevé est {sweep['threshold'].max():.0f}%." + (" Sans aucune information, tous les profils obtiennent le même score." if not features else ""))
+    else:
+        for col, (_, row) in zip(st.columns(len(chosen)), chosen.iterrows()):
+            col.metric("Évalués à risque élevé, {group}".format(group=row["group"]), f"{row['high_risk_rate'] * 100:.1f}%")
+            col.metric("Évalués à tort à risque élevé, {group}".format(group=row["group"]), f"{row['false_positive_rate'] * 100:.1f}%")
+
+    color = alt.Color("group:N", title="Groupe")
+    rates = alt.Chart(sweep).mark_line().encode(alt.X("threshold:Q", title="Seuil (%)"), alt.Y("high_risk_rate:Q", title="Part évaluée à risque élevé"), color)
+    rule = alt.Chart(pd.DataFrame({"threshold": [threshold]})).mark_rule(strokeDash=[4, 4]).encode(x="threshold:Q")
+    roc = alt.Chart(sweep).mark_line().encode(alt.X("false_positive_rate:Q", title="Part des non-récidivistes évalués à risque élevé"), alt.Y("true_positive_rate:Q", title="Part des récidivistes évalués à risque élevé"), color)
+    roc_points = alt.Chart(chosen).mark_point(size=80, filled=True).encode(x="false_positive_rate:Q", y="true_positive_rate:Q", color=color)
+    calibration_chart = alt.Chart(calibration).mark_line(point=True).encode(alt.X("mean_percent:Q", title="Score moyen (%)"), alt.Y("reoffense_rate:Q", title="Part ayant récidivé"), color)
+
+    col1, col2, col3 = st.columns(3)
+    col1.altair_chart(rates + rule, use_container_width=True)
+    col2.altair_chart(roc + roc_points, use_container_width=True)
+    col3.altair_chart(calibration_chart, use_container_width=True)
+    st.caption("À gauche : part de chaque groupe évaluée à risque élevé pour chaque seuil. Au milieu : courbes ROC, chaque point est un seuil et le point marqué correspond au seuil choisi ci-dessus. À droite : calibration, un score équitable placerait les deux groupes sur la même courbe.")
+
+threshold_analysis()
+
+# ---------- Weight sensitivity ----------
+st.subheader("Quel est le poids des pondérations ?")
+
+# Names of the weights of the rules
+weight_labels = {"ethnicity_factor": "Multiplicateur pour les personnes non suisses", "age_factor": "Multiplicateur pour les jeunes", "age_threshold": "Âge en dessous duquel une personne est jeune", "encounters_high": "Rencontres avec la police donnant 2 points", "convictions_high": "Condamnations donnant 2 points"}
+
+@st.fragment
+def sensitivity_analysis():
+    st.write("Les règles utilisent des nombres fixes. Les scores des personnes non suisses sont multipliés par 1,2, et ceux des personnes de moins de 25 ans par 2,5. À partir de 10 rencontres avec la police ou de 5 condamnations, 2 points sont ajoutés au lieu de 1. Ici, toutes les combinaisons d’autres valeurs sont évaluées en une fois sur une population simulée de 20 000 personnes, avec le biais de la police ci-dessus. Choisissez deux de ces nombres ; les autres gardent leur valeur.")
+
+    col1, col2 = st.columns(2)
+    x = col1.selectbox("Axe horizontal", Weights._fields, index=Weights._fields.index("encounters_high"), format_func=weight_labels.get)
+    y = col2.selectbox("Axe vertical", [name for name in Weights._fields if name != x], index=2, format_func=weight_labels.get)
+    features = st.multiselect("Informations utilisées par le système", FEATURES, default=["ethnicity", "encounters", "convictions", "age"], format_func=feature_labels.get, key="sensitivity_features")
+
+    # Every weight setting is computed at once and cached, choosing other axes only slices the results
+    results = cached_sensitivity(sample_profiles(), toggle_mask(**{feature: True for feature in features}))
+    data = heatmap_data(results, x, y)
+    heatmap = alt.Chart(data).mark_rect().encode(
+        alt.X(f"{x}:O", title=weight_labels[x]),
+        alt.Y(f"{y}:O", title=weight_labels[y], sort="descending"),
+        alt.Color("high_risk_gap:Q", title="Écart (points de pourcentage)", scale=alt.Scale(scheme="reds")),
+        tooltip=[x, y, alt.Tooltip("high_risk_gap:Q", format="+.1f")],
+    )
+    current = alt.Chart(pd.DataFrame({x: [getattr(DEFAULT_WEIGHTS, x)], y: [getattr(DEFAULT_WEIGHTS, y)]})).mark_rect(fill=None, stroke="black", strokeWidth=2).encode(x=f"{x}:O", y=f"{y}:O")
+    st.altair_chart(heatmap + current, use_container_width=True)
+    st.caption(f"Écart du taux de risque élevé entre les personnes non suisses et suisses, en points de pourcentage. La case encadrée est le système de la page d’accueil. Sur l’ensemble des {format(len(results), ',').replace(',', ' ')} combinaisons, l’écart va de {results['high_risk_gap'].min():+.1f} à {results['high_risk_gap'].max():+.1f} points de pourcentage. Les multiplicateurs changent peu de chose, car un score est affiché comme une part du score le plus élevé que la même personne pourrait obtenir, qui est multiplié lui aussi.")
+
+sensitivity_analysis()
+
+# ---------- Weight search ----------
+st.subheader("Peut-on rendre les pondérations plus équitables ?")
+
+@st.fragment
+def weight_search():
+    st.write("Un optimiseur essaie des milliers d’autres valeurs pour ces mêmes nombres. Il cherche un système avec un écart plus faible entre personnes non suisses et suisses, qui classe toujours les personnes presque dans le même ordre que l’original. L’accord est mesuré avec la corrélation des rangs de Spearman : 1 signifie exactement le même ordre. Les candidats qu’aucun autre ne bat sur les deux plans forment le front de Pareto.")
+
+    min_agreement = st.slider("Accord minimal avec le classement original", 0.5, 1.0, 0.9, 0.05)
+    features = st.multiselect("Informations utilisées par le système", FEATURES, default=["ethnicity", "encounters", "convictions", "age"], format_func=feature_labels.get, key="search_features")
+
+    results, front, original = cached_weight_search(sample_profiles(), toggle_mask(**{feature: True for feature in features}), min_agreement)
+    # The front is ordered by increasing gap, the first candidate that is close enough to the original ranking is the fairest
+    close_enough = front[front["agreement"] >= min_agreement]
+    if close_enough.empty:
+        st.info("Avec ces informations, tout le monde obtient le même score, quels que soient les poids : il n’y a aucun classement à conserver ni rien à chercher. Choisissez au moins une information.")
+        return
+    best = close_enough.iloc[0]
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Écart avec les pondérations originales", f"{original['high_risk_gap']:+.1f}")
+    col2.metric("Écart avec les pondérations trouvées", f"{best['high_risk_gap']:+.1f}", f"{best['high_risk_gap'] - original['high_risk_gap']:+.1f}", delta_color="inverse")
+    col3.metric("Accord avec le classement original", f"{best['agreement']:.2f}")
+
+    kinds = {"candidate": "Autres candidats", "front": "Front de Pareto", "original": "Pondérations originales"}
+    points = pd.concat([results.assign(kind="candidate"), front.assign(kind="front"), original.to_frame().T.assign(kind="original")], ignore_index=True)
+    points["kind"] = points["kind"].map(kinds)
+    chart = alt.Chart(points).mark_circle().encode(
+        alt.X("agreement:Q", title="Accord avec le classement original", scale=alt.Scale(zero=False)),
+        alt.Y("high_risk_gap:Q", title="Écart du taux de risque élevé (points de pourcentage)"),
+        alt.Color("kind:N", title="Candidat", scale=alt.Scale(domain=list(kinds.values()), range=["#c0c0c0", "#d62728", "#000000"])),
+        alt.Size("kind:N", scale=alt.Scale(domain=list(kinds.values()), range=[15, 60, 120]), legend=None),
+        tooltip=list(Weights._fields) + [alt.Tooltip("high_risk_gap:Q", format="+.1f"), alt.Tooltip("agreement:Q", format=".3f")],
+    )
+    st.altair_chart(chart, use_container_width=True)
+    st.caption(f"{format(len(results), ',').replace(',', ' ')} candidats évalués sur une population simulée de 20 000 personnes. Chaque point est un candidat. Les points en bas à droite sont plus équitables et plus proches du système original. Un écart plus faible ne rend pas le système équitable : il repose toujours sur des rencontres avec la police qui sont biaisées.")
+
+    table = front[list(Weights._fields) + ["high_risk_gap", "agreement"]].rename(columns=dict(weight_labels, high_risk_gap="Écart (points de pourcentage)", agreement="Accord avec le classement original"))
+    st.dataframe(table.round(2), hide_index=True)
+
+weight_search()
+
+# ---------- Errors per group ----------
+st.subheader("Sur qui le système se trompe-t-il ? Erreurs par groupe")
+
+@st.fragment
+def outcome_analysis():
+    st.write("L’analyse de ProPublica sur le système américain COMPAS a comparé ses erreurs entre les groupes : qui est évalué à tort à risque élevé sans récidiver, et qui récidive sans avoir été évalué à risque élevé. La même analyse est faite ici sur une population dont on connaît la récidive.")
+
+    population = session_population(st.session_state)
+    sources = {"simulated": "Population simulée (rencontres avec la police biaisées)"}
+    if compas_available():
+        sources["compas"] = "COMPAS, comté de Broward (ProPublica)"
+    if has_outcomes(population):
+        sources["app"] = "Données de la page d’accueil"
+
+    col1, col2 = st.columns(2)
+    source = col1.selectbox("Population", list(sources), format_func=sources.get)
+    features = col2.multiselect("Informations utilisées par le système", FEATURES, default=["encounters", "convictions", "age"], format_func=feature_labels.get, key="outcome_features")
+
+    if source == "app":
+        df = population
+    elif source == "compas":
+        df = load_compas()
+        st.caption("Les données COMPAS ne contiennent pas de rencontres avec la police, cette information n’a donc pas d’effet sur leurs scores.")
+    else:
+        df = sample_profiles()
+    report = cached_outcome_analysis(df).report(toggle_mask(**{feature: True for feature in features}))
+    columns = {"profiles": "Profils", "reoffense_rate": "Ont récidivé", "high_risk_rate": "Risque élevé", "false_positive_rate": "Faux positifs", "false_negative_rate": "Faux négatifs", "precision": "Précision", "reoffense_rate_low": "Ont récidivé (risque faible)", "reoffense_rate_medium": "Ont récidivé (risque moyen)", "reoffense_rate_high": "Ont récidivé (risque élevé)"}
+    column_config = {name: st.column_config.NumberColumn(label, format="percent") for name, label in columns.items()}
+    column_config["profiles"] = st.column_config.NumberColumn(columns["profiles"])
+    st.dataframe(report.rename(index=compas_group_labels if source == "compas" else group_labels), column_config=column_config)
+    st.caption("Faux positifs : part des personnes qui n’ont pas récidivé mais ont été évaluées à risque élevé. Faux négatifs : part des personnes qui ont récidivé sans avoir été évaluées à risque élevé. Précision : part des évaluations à risque élevé qui étaient justes. Les trois dernières colonnes montrent à quelle fréquence les personnes de chaque niveau de risque ont réellement récidivé (calibration).")
+
+outcome_analysis()
+
+# ---------- Proxies ----------
+st.subheader("Indicateurs cachés : qu’est-ce qui révèle l’origine ?")
+
+@st.fragment
+def proxy_analysis():
+    st.write("Retirer l’origine d’un système ne la retire pas des données, car d’autres informations peuvent la révéler. Pour chaque information, le tableau mesure ce qu’elle indique sur l’origine et le genre : l’information mutuelle (en bits) et le V de Cramér (de 0, sans lien, à 1, entièrement déterminé).")
+
+    population = session_population(st.session_state)
+    sources = {"simulated": "Population simulée (rencontres avec la police biaisées)", "app": "Données de la page d’accueil"}
+    if compas_available():
+        sources["compas"] = "COMPAS, comté de Broward (ProPublica)"
+    source = st.selectbox("Population", list(sources), format_func=sources.get, key="proxy_source")
+    df = {"simulated": sample_profiles, "app": lambda: population, "compas": load_compas}[source]()
+
+    report = cached_proxy_report(df)
+    labels = {**feature_labels, **{"reoffended": "A récidivé", "race": "Race (COMPAS)"}}
+    table = pd.DataFrame(index=[labels.get(name, name) for name in report.index])
+    for attribute in report.columns.levels[0]:
+        table["{attribute} : information mutuelle (bits)".format(attribute=labels[attribute])] = report[(attribute, "mutual_information")].to_numpy()
+        table["{attribute} : V de Cramér".format(attribute=labels[attribute])] = report[(attribute, "cramers_v")].to_numpy()
+    st.dataframe(table.style.format("{:.3f}"))
+
+    if "ethnicity" in report.columns.levels[0]:
+        chart_data = pd.DataFrame({"feature": table.index, "cramers_v": report[("ethnicity", "cramers_v")].to_numpy()})
+        st.altair_chart(alt.Chart(chart_data).mark_bar().encode(
+            alt.X("cramers_v:Q", title="V de Cramér avec l’origine", scale=alt.Scale(domain=[0, 1])),
+            alt.Y("feature:N", title="Information", sort="-x"),
+        ), use_container_width=True)
+
+proxy_analysis()
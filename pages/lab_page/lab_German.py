@@ -0,0 +1,269 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from engine.compas import compas_available, load_compas
+from engine.feedback import cached_feedback
+from engine.outcomes import cached_outcome_analysis, has_outcomes
+from engine.proxies import cached_proxy_report
+from engine.scoring import DEFAULT_WEIGHTS, FEATURES, Weights, toggle_mask
+from engine.sensitivity import cached_sensitivity, heatmap_data
+from engine.simulation import cached_simulation, sample_profiles
+from engine.thresholds import simulated_threshold_analysis
+from engine.upload import session_population
+from engine.weight_search import cached_weight_search
+
+st.title("Labor")
+
+"""
+Auf dieser Seite können Sie das Bewertungssystem mit größeren, simulierten Bevölkerungen untersuchen. Die Ergebnisse werden laufend berechnet und zwischen den Besuchenden geteilt.
+"""
+
+# Names of the toggles, as on the homepage
+feature_labels = {"gender": "Geschlecht", "ethnicity": "Ethnizität", "encounters": "Polizeikontakte", "convictions": "Verurteilungen", "age": "Alter", "zip_code": "Postleitzahl"}
+
+# Names of the groups compared in the charts
+group_labels = {"Swiss": "Schweizer", "Other": "Nicht-Schweizer"}
+# In the COMPAS data the two groups are White people and everybody else
+compas_group_labels = {"Swiss": "Weiße (Caucasian)", "Other": "Andere Gruppen"}
+
+# ---------- Bias simulation ----------
+st.subheader("Verzerrte Daten: Polizeikontakte")
+
+@st.fragment
+def bias_simulation():
+    st.write("In dieser Simulation werden Schweizer und Nicht-Schweizer genau gleich häufig rückfällig. Nur die Polizei verhält sich unterschiedlich: Nicht-Schweizer werden häufiger kontrolliert und sammeln daher mehr Polizeikontakte. Viele Bevölkerungen mit je 1000 Personen werden erzeugt und bewertet, um zu zeigen, wie diese Verzerrung in den Daten zu einem Unterschied in den Risikobewertungen wird.")
+
+    col1, col2 = st.columns(2)
+    oversampling = col1.slider("Wie viel häufiger werden Nicht-Schweizer von der Polizei kontrolliert?", 1.0, 4.0, 2.0, 0.25)
+    replications = col2.select_slider("Anzahl simulierter Bevölkerungen", [100, 500, 1000, 2000, 5000], value=1000)
+    features = st.multiselect("Vom System verwendete Informationen", FEATURES, default=["encounters", "convictions"], format_func=feature_labels.get)
+
+    results = cached_simulation(oversampling=oversampling, replications=replications, mask=toggle_mask(**{feature: True for feature in features}))
+    gap = results["high_risk_gap"]
+    low, median, high = np.nanpercentile(gap, [5, 50, 95])
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Anteil hohes Risiko (Nicht-Schweizer)", f"{np.nanmedian(results['high_risk_other']) * 100:.1f}%")
+    col2.metric("Anteil hohes Risiko (Schweizer)", f"{np.nanmedian(results['high_risk_swiss']) * 100:.1f}%")
+    col3.metric("Unterschied (Prozentpunkte)", f"{median:+.1f}")
+    st.caption(f"Median über {replications} simulierte Bevölkerungen, 90 % der Bevölkerungen liegen zwischen {low:.1f} und {high:.1f} Prozentpunkten. Unter den Personen, die nicht rückfällig wurden, werden Nicht-Schweizer um {np.nanmedian(results['false_positive_gap']):+.1f} Prozentpunkte häufiger als hohes Risiko eingestuft.")
+
+    chart = alt.Chart(pd.DataFrame({"gap": gap})).mark_bar().encode(
+        alt.X("gap:Q", bin=alt.Bin(maxbins=40), title="Unterschied im Anteil hohes Risiko (Prozentpunkte)"),
+        alt.Y("count()", title="Simulierte Bevölkerungen"),
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+bias_simulation()
+
+# ---------- Feedback loop ----------
+st.subheader("Rückkopplung: vorausschauende Polizeiarbeit")
+
+@st.fragment
+def feedback_simulation():
+    st.write("Polizeistreifen werden oft dorthin geschickt, wo ein System ein Risiko vorhersagt. In dieser Simulation werden Personen mit hohem Risiko in der nächsten Runde häufiger kontrolliert, Personen mit mittlerem Risiko etwas häufiger. Jede zusätzliche Kontrolle kann einen Polizeikontakt oder eine Verurteilung zu ihrer Akte hinzufügen und ihren nächsten Score erhöhen. Die Akten werden zehn Runden lang aufbewahrt. Beide Gruppen werden gleich häufig rückfällig, und ohne diese Rückkopplung bleibt der Unterschied dort, wo ihn die Verzerrung der Polizei hinsetzt.")
+
+    col1, col2, col3 = st.columns(3)
+    oversampling = col1.slider("Wie viel häufiger werden Nicht-Schweizer von der Polizei kontrolliert?", 1.0, 4.0, 2.0, 0.25, key="feedback_oversampling")
+    attention = col2.slider("Wie viel häufiger werden Personen mit hohem Risiko kontrolliert?", 1.0, 4.0, 2.0, 0.25)
+    rounds = col3.slider("Runden", 5, 50, 30)
+    features = st.multiselect("Vom System verwendete Informationen", FEATURES, default=["encounters", "convictions"], format_func=feature_labels.get, key="feedback_features")
+
+    results = pd.DataFrame(cached_feedback(oversampling=oversampling, attention=attention, rounds=rounds, mask=toggle_mask(**{feature: True for feature in features}))).rename_axis("round").reset_index()
+    first, last = results.iloc[0], results.iloc[-1]
+
+    # Rising rates and gaps are shown in red
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Anteil hohes Risiko (Nicht-Schweizer)", f"{last['high_risk_other'] * 100:.1f}%", f"{(last['high_risk_other'] - first['high_risk_other']) * 100:+.1f}", delta_color="inverse")
+    col2.metric("Anteil hohes Risiko (Schweizer)", f"{last['high_risk_swiss'] * 100:.1f}%", f"{(last['high_risk_swiss'] - first['high_risk_swiss']) * 100:+.1f}", delta_color="inverse")
+    col3.metric("Unterschied (Prozentpunkte)", f"{last['high_risk_gap']:+.1f}", f"{last['high_risk_gap'] - first['high_risk_gap']:+.1f}", delta_color="inverse")
+    st.caption(f"Nach {rounds} Runden, in einer simulierten Bevölkerung von 100 000 Personen. Die kleinen Zahlen zeigen die Veränderung seit der ersten Runde. Unter den Personen, die nicht rückfällig wurden, ging der Unterschied von {first['false_positive_gap']:+.1f} auf {last['false_positive_gap']:+.1f} Prozentpunkte.")
+
+    rates = results.melt("round", ["high_risk_other", "high_risk_swiss"], var_name="group", value_name="rate")
+    rates["group"] = rates["group"].map({"high_risk_other": group_labels["Other"], "high_risk_swiss": group_labels["Swiss"]})
+    rates_chart = alt.Chart(rates).mark_line().encode(alt.X("round:Q", title="Runde"), alt.Y("rate:Q", title="Anteil mit hohem Risiko"), alt.Color("group:N", title="Gruppe"))
+    gap_chart = alt.Chart(results).mark_line().encode(alt.X("round:Q", title="Runde"), alt.Y("high_risk_gap:Q", title="Unterschied im Anteil hohes Risiko (Prozentpunkte)"))
+    col1, col2 = st.columns(2)
+    col1.altair_chart(rates_chart, use_container_width=True)
+    col2.altair_chart(gap_chart, use_container_width=True)
+
+feedback_simulation()
+
+# ---------- Threshold sweep ----------
+st.subheader("Wo zieht man die Grenze? Risikoschwellen")
+
+@st.fragment
+def threshold_analysis():
+    st.write("Die Profile gelten ab 66 % als hohes Risiko und ab 33 % als mittleres Risiko. Diese Schwellen sind eine Designentscheidung. Unten wird eine simulierte Bevölkerung von 20 000 Personen mit bekanntem Rückfallverhalten (mit derselben Polizeiverzerrung wie oben) bewertet, und alle möglichen Schwellen werden auf einmal ausgewertet.")
+
+    col1, col2 = st.columns(2)
+    oversampling = col1.slider("Wie viel häufiger werden Nicht-Schweizer von der Polizei kontrolliert?", 1.0, 4.0, 2.0, 0.25, key="threshold_oversampling")
+    threshold = col2.slider("Schwelle für hohes Risiko (%)", 0, 100, 66)
+    features = st.multiselect("Vom System verwendete Informationen", FEATURES, default=["encounters", "convictions", "age"], format_func=feature_labels.get, key="threshold_features")
+
+    sweep, calibration = simulated_threshold_analysis(oversampling, toggle_mask(**{feature: True for feature in features}))
+    sweep = sweep[np.isfinite(sweep["threshold"])].assign(group=lambda frame: frame["group"].map(group_labels))
+    calibration = calibration.assign(group=lambda frame: frame["group"].map(group_labels))
+
+    # Statistics at the chosen threshold: the lowest cut point that is still above it
+    chosen = sweep[sweep["threshold"] >= threshold].groupby("group").last().reset_index()
+    if chosen.empty:
+        # No cut point reaches the threshold, e.g. without any information every profile scores 0%
+        st.info(f"Ab {threshold}% wird niemand als hohes Risiko eingestuft: Der höchste Score beträgt {sweep['threshold'].max():.0f}%." + (" Ohne jede Information erhalten alle Profile denselben Score." if not features else ""))
+    else:
+        for col, (_, row) in zip(st.columns(len(chosen)), chosen.iterrows()):
+            col.metric("Als hohes Risiko eingestuft, {group}".format(group=row["group"]), f"{row['high_risk_rate'] * 100:.1f}%")
+            col.metric("Fälschlich als hohes Risiko eingestuft, {group}".format(group=row["group"]), f"{row['false_positive_rate'] * 100:.1f}%")
+
+    color = alt.Color("group:N", title="Gruppe")
+    rates = alt.Chart(sweep).mark_line().encode(alt.X("threshold:Q", title="Schwelle (%)"), alt.Y("high_risk_rate:Q", title="Anteil mit hohem Risiko"), color)
+    rule = alt.Chart(pd.DataFrame({"threshold": [threshold]})).mark_rule(strokeDash=[4, 4]).encode(x="threshold:Q")
+    roc = alt.Chart(sweep).mark_line().encode(alt.X("false_positive_rate:Q", title="Anteil der Nicht-Rückfälligen mit hohem Risiko"), alt.Y("true_positive_rate:Q", title="Anteil der Rückfälligen mit hohem Risiko"), color)
+    roc_points = alt.Chart(chosen).mark_point(size=80, filled=True).encode(x="false_positive_rate:Q", y="true_positive_rate:Q", color=color)
+    calibration_chart = alt.Chart(calibration).mark_line(point=True).encode(alt.X("mean_percent:Q", title="Durchschnittlicher Score (%)"), alt.Y("reoffense_rate:Q", title="Anteil rückfällig"), color)
+
+    col1, col2, col3 = st.columns(3)
+    col1.altair_chart(rates + rule, use_container_width=True)
+    col2.altair_chart(roc + roc_points, use_container_width=True)
+    col3.altair_chart(calibration_chart, use_container_width=True)
+    st.caption("Links: Anteil jeder Gruppe mit hohem Risiko für jede Schwelle. Mitte: ROC-Kurven, jeder Punkt ist eine Schwelle und der markierte Punkt ist die oben gewählte Schwelle. Rechts: Kalibrierung, ein fairer Score würde beide Gruppen auf dieselbe Kurve legen.")
+
+threshold_analysis()
+
+# ---------- Weight sensitivity ----------
+st.subheader("Wie viel bewirken die Gewichte?")
+
+# Names of the weights of the rules
+weight_labels = {"ethnicity_factor": "Multiplikator für Nicht-Schweizer", "age_factor": "Multiplikator für junge Personen", "age_threshold": "Alter, unter dem eine Person als jung gilt", "encounters_high": "Polizeikontakte für 2 Punkte", "convictions_high": "Verurteilungen für 2 Punkte"}
+
+@st.fragment
+def sensitivity_analysis():
+    st.write("Die Regeln verwenden feste Zahlen. Die Scores von Nicht-Schweizern werden mit 1,2 multipliziert, die von Personen unter 25 Jahren mit 2,5. Ab 10 Polizeikontakten oder 5 Verurteilungen werden 2 Punkte statt 1 addiert. Hier werden alle Kombinationen anderer Werte auf einmal bewertet, mit einer simulierten Bevölkerung von 20 000 Personen und der Verzerrung der Polizei von oben. Wählen Sie zwei dieser Zahlen; die anderen behalten ihren Wert.")
+
+    col1, col2 = st.columns(2)
+    x = col1.selectbox("Horizontale Achse", Weights._fields, index=Weights._fields.index("encounters_high"), format_func=weight_labels.get)
+    y = col2.selectbox("Vertikale Achse", [name for name in Weights._fields if name != x], index=2, format_func=weight_labels.get)
+    features = st.multiselect("Vom System verwendete Informationen", FEATURES, default=["ethnicity", "encounters", "convictions", "age"], format_func=feature_labels.get, key="sensitivity_features")
+
+    # Every weight setting is computed at once and cached, choosing other axes only slices the results
+    results = cached_sensitivity(sample_profiles(), toggle_mask(**{feature: True for feature in features}))
+    data = heatmap_data(results, x, y)
+    heatmap = alt.Chart(data).mark_rect().encode(
+        alt.X(f"{x}:O", title=weight_labels[x]),
+        alt.Y(f"{y}:O", title=weight_labels[y], sort="descending"),
+        alt.Color("high_risk_gap:Q", title="Unterschied (Prozentpunkte)", scale=alt.Scale(scheme="reds")),
+        tooltip=[x, y, alt.Tooltip("high_risk_gap:Q", format="+.1f")],
+    )
+    current = alt.Chart(pd.DataFrame({x: [getattr(DEFAULT_WEIGHTS, x)], y: [getattr(DEFAULT_WEIGHTS, y)]})).mark_rect(fill=None, stroke="black", strokeWidth=2).encode(x=f"{x}:O", y=f"{y}:O")
+    st.altair_chart(heatmap + current, use_container_width=True)
+    st.caption(f"Unterschied im Anteil hohes Risiko zwischen Nicht-Schweizern und Schweizern, in Prozentpunkten. Das umrahmte Feld ist das System der Homepage. Über alle {format(len(results), ',').replace(',', ' ')} Kombinationen reicht der Unterschied von {results['high_risk_gap'].min():+.1f} bis {results['high_risk_gap'].max():+.1f} Prozentpunkten. Die Multiplikatoren bewirken wenig, denn ein Score wird als Anteil des höchsten Scores angezeigt, den dieselbe Person erreichen könnte, und dieser wird ebenfalls multipliziert.")
+
+sensitivity_analysis()
+
+# ---------- Weight search ----------
+st.subheader("Lassen sich die Gewichte fairer wählen?")
+
+@st.fragment
+def weight_search():
+    st.write("Ein Optimierer probiert Tausende anderer Werte für dieselben Zahlen aus. Er sucht ein System mit einem kleineren Unterschied zwischen Nicht-Schweizern und Schweizern, das die Personen dennoch fast in derselben Reihenfolge einstuft wie das ursprüngliche. Die Übereinstimmung wird mit Spearmans Rangkorrelation gemessen: 1 bedeutet genau dieselbe Reihenfolge. Die Kandidaten, die kein anderer in beiden Punkten übertrifft, bilden die Pareto-Front.")
+
+    min_agreement = st.slider("Minimale Übereinstimmung mit der ursprünglichen Rangfolge", 0.5, 1.0, 0.9, 0.05)
+    features = st.multiselect("Vom System verwendete Informationen", FEATURES, default=["ethnicity", "encounters", "convictions", "age"], format_func=feature_labels.get, key="search_features")
+
+    results, front, original = cached_weight_search(sample_profiles(), toggle_mask(**{feature: True for feature in features}), min_agreement)
+    # The front is ordered by increasing gap, the first candidate that is close enough to the original ranking is the fairest
+    close_enough = front[front["agreement"] >= min_agreement]
+    if close_enough.empty:
+        st.info("Mit diesen Informationen erhalten alle denselben Score, egal welche Gewichte: Es gibt keine Rangfolge zu erhalten und nichts zu suchen. Wählen Sie mindestens eine Information.")
+        return
+    best = close_enough.iloc[0]
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Unterschied mit den ursprünglichen Gewichten", f"{original['high_risk_gap']:+.1f}")
+    col2.metric("Unterschied mit den gefundenen Gewichten", f"{best['high_risk_gap']:+.1f}", f"{best['high_risk_gap'] - original['high_risk_gap']:+.1f}", delta_color="inverse")
+    col3.metric("Übereinstimmung mit der ursprünglichen Rangfolge", f"{best['agreement']:.2f}")
+
+    kinds = {"candidate": "Andere Kandidaten", "front": "Pareto-Front", "original": "Ursprüngliche Gewichte"}
+    points = pd.concat([results.assign(kind="candidate"), front.assign(kind="front"), original.to_frame().T.assign(kind="original")], ignore_index=True)
+    points["kind"] = points["kind"].map(kinds)
+    chart = alt.Chart(points).mark_circle().encode(
+        alt.X("agreement:Q", title="Übereinstimmung mit der ursprünglichen Rangfolge", scale=alt.Scale(zero=False)),
+        alt.Y("high_risk_gap:Q", title="Unterschied im Anteil hohes Risiko (Prozentpunkte)"),
+        alt.Color("kind:N", title="Kandidat", scale=alt.Scale(domain=list(kinds.values()), range=["#c0c0c0", "#d62728", "#000000"])),
+        alt.Size("kind:N", scale=alt.Scale(domain=list(kinds.values()), range=[15, 60, 120]), legend=None),
+        tooltip=list(Weights._fields) + [alt.Tooltip("high_risk_gap:Q", format="+.1f"), alt.Tooltip("agreement:Q", format=".3f")],
+    )
+    st.altair_chart(chart, use_container_width=True)
+    st.caption(f"{format(len(results), ',').replace(',', ' ')} Kandidaten, bewertet mit einer simulierten Bevölkerung von 20 000 Personen. Jeder Punkt ist ein Kandidat. Punkte unten rechts sind fairer und näher am ursprünglichen System. Ein kleinerer Unterschied macht das System nicht fair: Es stützt sich weiterhin auf verzerrte Polizeikontakte.")
+
+    table = front[list(Weights._fields) + ["high_risk_gap", "agreement"]].rename(columns=dict(weight_labels, high_risk_gap="Unterschied (Prozentpunkte)", agreement="Übereinstimmung mit der ursprünglichen Rangfolge"))
+    st.dataframe(table.round(2), hide_index=True)
+
+weight_search()
+
+# ---------- Errors per group ----------
+st.subheader("Bei wem irrt sich das System? Fehler pro Gruppe")
+
+@st.fragment
+def outcome_analysis():
+    st.write("Die Analyse von ProPublica zum US-System COMPAS hat seine Fehler zwischen Gruppen verglichen: Wer wird fälschlich als hohes Risiko eingestuft, ohne rückfällig zu werden, und wer wird rückfällig, ohne als hohes Risiko eingestuft zu sein? Dieselbe Analyse wird hier mit einer Bevölkerung durchgeführt, deren Rückfallverhalten bekannt ist.")
+
+    population = session_population(st.session_state)
+    sources = {"simulated": "Simulierte Bevölkerung (verzerrte Polizeikontakte)"}
+    if compas_available():
+        sources["compas"] = "COMPAS, Broward County (ProPublica)"
+    if has_outcomes(population):
+        sources["app"] = "Daten der Homepage"
+
+    col1, col2 = st.columns(2)
+    source = col1.selectbox("Bevölkerung", list(sources), format_func=sources.get)
+    features = col2.multiselect("Vom System verwendete Informationen", FEATURES, default=["encounters", "convictions", "age"], format_func=feature_labels.get, key="outcome_features")
+
+    if source == "app":
+        df = population
+    elif source == "compas":
+        df = load_compas()
+        st.caption("Die COMPAS-Daten enthalten keine Polizeikontakte, diese Information hat also keinen Einfluss auf ihre Scores.")
+    else:
+        df = sample_profiles()
+    report = cached_outcome_analysis(df).report(toggle_mask(**{feature: True for feature in features}))
+    columns = {"profiles": "Profile", "reoffense_rate": "Rückfällig", "high_risk_rate": "Hohes Risiko", "false_positive_rate": "Falsch positiv", "false_negative_rate": "Falsch negativ", "precision": "Präzision", "reoffense_rate_low": "Rückfällig (geringes Risiko)", "reoffense_rate_medium": "Rückfällig (mittleres Risiko)", "reoffense_rate_high": "Rückfällig (hohes Risiko)"}
+    column_config = {name: st.column_config.NumberColumn(label, format="percent") for name, label in columns.items()}
+    column_config["profiles"] = st.column_config.NumberColumn(columns["profiles"])
+    st.dataframe(report.rename(index=compas_group_labels if source == "compas" else group_labels), column_config=column_config)
+    st.caption("Falsch positiv: Anteil der Personen, die nicht rückfällig wurden, aber als hohes Risiko eingestuft wurden. Falsch negativ: Anteil der Personen, die rückfällig wurden, ohne als hohes Risiko eingestuft zu sein. Präzision: Anteil der richtigen Einstufungen als hohes Risiko. Die letzten drei Spalten zeigen, wie oft die Personen jeder Risikostufe tatsächlich rückfällig wurden (Kalibrierung).")
+
+outcome_analysis()
+
+# ---------- Proxies ----------
+st.subheader("Versteckte Stellvertreter: Was verrät die Ethnizität?")
+
+@st.fragment
+def proxy_analysis():
+    st.write("Wer die Ethnizität aus einem System entfernt, entfernt sie nicht aus den Daten, denn andere Informationen können sie verraten. Für jede Information misst die Tabelle, wie viel sie über Ethnizität und Geschlecht aussagt: die Transinformation (in Bit) und Cramérs V (von 0, kein Zusammenhang, bis 1, vollständig bestimmt).")
+
+    population = session_population(st.session_state)
+    sources = {"simulated": "Simulierte Bevölkerung (verzerrte Polizeikontakte)", "app": "Daten der Homepage"}
+    if compas_available():
+        sources["compas"] = "COMPAS, Broward County (ProPublica)"
+    source = st.selectbox("Bevölkerung", list(sources), format_func=sources.get, key="proxy_source")
+    df = {"simulated": sample_profiles, "app": lambda: population, "compas": load_compas}[source]()
+
+    report = cached_proxy_report(df)
+    labels = {**feature_labels, **{"reoffended": "Rückfällig", "race": "Race (COMPAS)"}}
+    table = pd.DataFrame(index=[labels.get(name, name) for name in report.index])
+    for attribute in report.columns.levels[0]:
+        table["{attribute}: Transinformation (Bit)".format(attribute=labels[attribute])] = report[(attribute, "mutual_information")].to_numpy()
+        table["{attribute}: Cramérs V".format(attribute=labels[attribute])] = report[(attribute, "cramers_v")].to_numpy()
+    st.dataframe(table.style.format("{:.3f}"))
+
+    if "ethnicity" in report.columns.levels[0]:
+        chart_data = pd.DataFrame({"feature": table.index, "cramers_v": report[("ethnicity", "cramers_v")].to_numpy()})
+        st.altair_chart(alt.Chart(chart_data).mark_bar().encode(
+            alt.X("cramers_v:Q", title="Cramérs V mit der Ethnizität", scale=alt.Scale(domain=[0, 1])),
+            alt.Y("feature:N", title="Information", sort="-x"),
+        ), use_container_width=True)
+
+proxy_analysis()
@@ -0,0 +1,269 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from engine.compas import compas_available, load_compas
+from engine.feedback import cached_feedback
+from engine.outcomes import cached_outcome_analysis, has_outcomes
+from engine.proxies import cached_proxy_report
+from engine.scoring import DEFAULT_WEIGHTS, FEATURES, Weights, toggle_mask
+from engine.sensitivity import cached_sensitivity, heatmap_data
+from engine.simulation import cached_simulation, sample_profiles
+from engine.thresholds import simulated_threshold_analysis
+from engine.upload import session_population
+from engine.weight_search import cached_weight_search
+
+st.title("Laboratorio")
+
+"""
+Questa pagina permette di esplorare il sistema di valutazione con popolazioni simulate più grandi. I risultati sono calcolati al momento e condivisi tra i visitatori.
+"""
+
+# Names of the toggles, as on the homepage
+feature_labels = {"gender": "Genere", "ethnicity": "Origine / nazionalità", "encounters": "Incontri con la polizia", "convictions": "Condanne", "age": "Età", "zip_code": "Codice postale"}
+
+# Names of the groups compared in the charts
+group_labels = {"Swiss": "Svizzeri", "Other": "Non svizzeri"}
+# In the COMPAS data the two groups are White people and everybody else
+compas_group_labels = {"Swiss": "Bianchi (Caucasian)", "Other": "Altri gruppi"}
+
+# ---------- Bias simulation ----------
+st.subheader("Dati distorti: gli incontri con la polizia")
+
+@st.fragment
+def bias_simulation():
+    st.write("In questa simulazione, le persone svizzere e non svizzere recidivano esattamente con lo stesso tasso. Solo la polizia si comporta diversamente: le persone non svizzere vengono controllate più spesso e accumulano quindi più incontri. Molte popolazioni di 1000 persone vengono generate e valutate per vedere come questa distorsione nei dati si traduce in uno scarto nelle valutazioni del rischio.")
+
+    col1, col2 = st.columns(2)
+    oversampling = col1.slider("Quante volte più spesso le persone non svizzere vengono controllate dalla polizia?", 1.0, 4.0, 2.0, 0.25)
+    replications = col2.select_slider("Numero di popolazioni simulate", [100, 500, 1000, 2000, 5000], value=1000)
+    features = st.multiselect("Informazioni usate dal sistema", FEATURES, default=["encounters", "convictions"], format_func=feature_labels.get)
+
+    results = cached_simulation(oversampling=oversampling, replications=replications, mask=toggle_mask(**{feature: True for feature in features}))
+    gap = results["high_risk_gap"]
+    low, median, high = np.nanpercentile(gap, [5, 50, 95])
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Tasso di rischio elevato (non svizzeri)", f"{np.nanmedian(results['high_risk_other']) * 100:.1f}%")
+    col2.metric("Tasso di rischio elevato (svizzeri)", f"{np.nanmedian(results['high_risk_swiss']) * 100:.1f}%")
+    col3.metric("Scarto (punti percentuali)", f"{median:+.1f}")
+    st.caption(f"Mediana su {replications} popolazioni simulate, il 90% delle popolazioni si trova tra {low:.1f} e {high:.1f} punti percentuali. Tra le persone che non hanno recidivato, le persone non svizzere sono valutate ad alto rischio {np.nanmedian(results['false_positive_gap']):+.1f} punti percentuali più spesso.")
+
+    chart = alt.Chart(pd.DataFrame({"gap": gap})).mark_bar().encode(
+        alt.X("gap:Q", bin=alt.Bin(maxbins=40), title="Scarto nel tasso di rischio elevato (punti percentuali)"),
+        alt.Y("count()", title="Popolazioni simulate"),
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+bias_simulation()
+
+# ---------- Feedback loop ----------
+st.subheader("Circolo vizioso: la polizia predittiva")
+
+@st.fragment
+def feedback_simulation():
+    st.write("Le pattuglie di polizia vengono spesso mandate dove un sistema prevede un rischio. In questa simulazione, le persone valutate ad alto rischio vengono controllate più spesso al turno successivo, e quelle valutate a rischio medio un po’ più spesso. Ogni controllo in più può aggiungere un incontro o una condanna al loro fascicolo e aumentare il loro prossimo punteggio. I fascicoli vengono conservati per dieci turni. I due gruppi recidivano con lo stesso tasso, e senza questo circolo vizioso lo scarto resta dove lo mette la distorsione della polizia.")
+
+    col1, col2, col3 = st.columns(3)
+    oversampling = col1.slider("Quante volte più spesso le persone non svizzere vengono controllate dalla polizia?", 1.0, 4.0, 2.0, 0.25, key="feedback_oversampling")
+    attention = col2.slider("Quante volte più spesso vengono controllate le persone valutate ad alto rischio?", 1.0, 4.0, 2.0, 0.25)
+    rounds = col3.slider("Turni", 5, 50, 30)
+    features = st.multiselect("Informazioni usate dal sistema", FEATURES, default=["encounters", "convictions"], format_func=feature_labels.get, key="feedback_features")
+
+    results = pd.DataFrame(cached_feedback(oversampling=oversampling, attention=attention, rounds=rounds, mask=toggle_mask(**{feature: True for feature in features}))).rename_axis("round").reset_index()
+    first, last = results.iloc[0], results.iloc[-1]
+
+    # Rising rates and gaps are shown in red
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Tasso di rischio elevato (non svizzeri)", f"{last['high_risk_other'] * 100:.1f}%", f"{(last['high_risk_other'] - first['high_risk_other']) * 100:+.1f}", delta_color="inverse")
+    col2.metric("Tasso di rischio elevato (svizzeri)", f"{last['high_risk_swiss'] * 100:.1f}%", f"{(last['high_risk_swiss'] - first['high_risk_swiss']) * 100:+.1f}", delta_color="inverse")
+    col3.metric("Scarto (punti percentuali)", f"{last['high_risk_gap']:+.1f}", f"{last['high_risk_gap'] - first['high_risk_gap']:+.1f}", delta_color="inverse")
+    st.caption(f"Dopo {rounds} turni, in una popolazione simulata di 100 000 persone. I numeri piccoli mostrano la variazione dal primo turno. Tra le persone che non hanno recidivato, lo scarto è passato da {first['false_positive_gap']:+.1f} a {last['false_positive_gap']:+.1f} punti percentuali.")
+
+    rates = results.melt("round", ["high_risk_other", "high_risk_swiss"], var_name="group", value_name="rate")
+    rates["group"] = rates["group"].map({"high_risk_other": group_labels["Other"], "high_risk_swiss": group_labels["Swiss"]})
+    rates_chart = alt.Chart(rates).mark_line().encode(alt.X("round:Q", title="Turno"), alt.Y("rate:Q", title="Quota valutata ad alto rischio"), alt.Color("group:N", title="Gruppo"))
+    gap_chart = alt.Chart(results).mark_line().encode(alt.X("round:Q", title="Turno"), alt.Y("high_risk_gap:Q", title="Scarto nel tasso di rischio elevato (punti percentuali)"))
+    col1, col2 = st.columns(2)
+    col1.altair_chart(rates_chart, use_container_width=True)
+    col2.altair_chart(gap_chart, use_container_width=True)
+
+feedback_simulation()
+
+# ---------- Threshold sweep ----------
+st.subheader("Dove tracciare il limite? Le soglie di rischio")
+
+@st.fragment
+def threshold_analysis():
+    st.write("I profili sono valutati ad alto rischio a partire dal 66% e a rischio medio a partire dal 33%. Queste soglie sono una scelta di progettazione. Qui sotto, una popolazione simulata di 20 000 persone di cui si conosce la recidiva (con la stessa distorsione della polizia di sopra) viene valutata, e tutte le soglie possibili vengono analizzate in una volta.")
+
+    col1, col2 = st.columns(2)
+    oversampling = col1.slider("Quante volte più spesso le persone non svizzere vengono controllate dalla polizia?", 1.0, 4.0, 2.0, 0.25, key="threshold_oversampling")
+    threshold = col2.slider("Soglia di rischio elevato (%)", 0, 100, 66)
+    features = st.multiselect("Informazioni usate dal sistema", FEATURES, default=["encounters", "convictions", "age"], format_func=feature_labels.get, key="threshold_features")
+
+    sweep, calibration = simulated_threshold_analysis(oversampling, toggle_mask(**{feature: True for feature in features}))
+    sweep = sweep[np.isfinite(sweep["threshold"])].assign(group=lambda frame: frame["group"].map(group_labels))
+    calibration = calibration.assign(group=lambda frame: frame["group"].map(group_labels))
+
+    # Statistics at the chosen threshold: the lowest cut point that is still above it
+    chosen = sweep[sweep["threshold"] >= threshold].groupby("group").last().reset_index()
+    if chosen.empty:
+        # No cut point reaches the threshold, e.g. without any information every profile scores 0%
+        st.info(f"Nessuno è valutato ad alto rischio a partire da {threshold}%: il punteggio più alto è {sweep['threshold'].max():.0f}%." + (" Senza alcuna informazione, tutti i profili ottengono lo stesso punteggio." if not features else ""))
+    else:
+        for col, (_, row) in zip(st.columns(len(chosen)), chosen.iterrows()):
+            col.metric("Valutati ad alto rischio, {group}".format(group=row["group"]), f"{row['high_risk_rate'] * 100:.1f}%")
+            col.metric("Valutati a torto ad alto rischio, {group}".format(group=row["group"]), f"{row['false_positive_rate'] * 100:.1f}%")
+
+    color = alt.Color("group:N", title="Gruppo")
+    rates = alt.Chart(sweep).mark_line().encode(alt.X("threshold:Q", title="Soglia (%)"), alt.Y("high_risk_rate:Q", title="Quota valutata ad alto rischio"), color)
+    rule = alt.Chart(pd.DataFrame({"threshold": [threshold]})).mark_rule(strokeDash=[4, 4]).encode(x="threshold:Q")
+    roc = alt.Chart(sweep).mark_line().encode(alt.X("false_positive_rate:Q", title="Quota dei non recidivi valutati ad alto rischio"), alt.Y("true_positive_rate:Q", title="Quota dei recidivi valutati ad alto rischio"), color)
+    roc_points = alt.Chart(chosen).mark_point(size=80, filled=True).encode(x="false_positive_rate:Q", y="true_positive_rate:Q", color=color)
+    calibration_chart = alt.Chart(calibration).mark_line(point=True).encode(alt.X("mean_percent:Q", title="Punteggio medio (%)"), alt.Y("reoffense_rate:Q", title="Quota che ha recidivato"), color)
+
+    col1, col2, col3 = st.columns(3)
+    col1.altair_chart(rates + rule, use_container_width=True)
+    col2.altair_chart(roc + roc_points, use_container_width=True)
+    col3.altair_chart(calibration_chart, use_container_width=True)
+    st.caption("A sinistra: quota di ogni gruppo valutata ad alto rischio per ogni soglia. Al centro: curve ROC, ogni punto è una soglia e il punto evidenziato corrisponde alla soglia scelta sopra. A destra: calibrazione, un punteggio equo metterebbe entrambi i gruppi sulla stessa curva.")
+
+threshold_analysis()
+
+# ---------- Weight sensitivity ----------
+st.subheader("Quanto contano i pesi?")
+
+# Names of the weights of the rules
+weight_labels = {"ethnicity_factor": "Moltiplicatore per le persone non svizzere", "age_factor": "Moltiplicatore per i giovani", "age_threshold": "Età sotto la quale una persona è giovane", "encounters_high": "Incontri con la polizia che danno 2 punti", "convictions_high": "Condanne che danno 2 punti"}
+
+@st.fragment
+def sensitivity_analysis():
+    st.write("Le regole usano numeri fissi. I punteggi delle persone non svizzere sono moltiplicati per 1,2, e quelli delle persone sotto i 25 anni per 2,5. Da 10 incontri con la polizia o 5 condanne si aggiungono 2 punti invece di 1. Qui, tutte le combinazioni di altri valori vengono valutate in una volta su una popolazione simulata di 20 000 persone, con la distorsione della polizia vista sopra. Scegliete due di questi numeri; gli altri mantengono il loro valore.")
+
+    col1, col2 = st.columns(2)
+    x = col1.selectbox("Asse orizzontale", Weights._fields, index=Weights._fields.index("encounters_high"), format_func=weight_labels.get)
+    y = col2.selectbox("Asse verticale", [name for name in Weights._fields if name != x], index=2, format_func=weight_labels.get)
+    features = st.multiselect("Informazioni usate dal sistema", FEATURES, default=["ethnicity", "encounters", "convictions", "age"], format_func=feature_labels.get, key="sensitivity_features")
+
+    # Every weight setting is computed at once and cached, choosing other axes only slices the results
+    results = cached_sensitivity(sample_profiles(), toggle_mask(**{feature: True for feature in features}))
+    data = heatmap_data(results, x, y)
+    heatmap = alt.Chart(data).mark_rect().encode(
+        alt.X(f"{x}:O", title=weight_labels[x]),
+        alt.Y(f"{y}:O", title=weight_labels[y], sort="descending"),
+        alt.Color("high_risk_gap:Q", title="Scarto (punti percentuali)", scale=alt.Scale(scheme="reds")),
+        tooltip=[x, y, alt.Tooltip("high_risk_gap:Q", format="+.1f")],
+    )
+    current = alt.Chart(pd.DataFrame({x: [getattr(DEFAULT_WEIGHTS, x)], y: [getattr(DEFAULT_WEIGHTS, y)]})).mark_rect(fill=None, stroke="black", strokeWidth=2).encode(x=f"{x}:O", y=f"{y}:O")
+    st.altair_chart(heatmap + current, use_container_width=True)
+    st.caption(f"Scarto nel tasso di rischio elevato tra persone non svizzere e svizzere, in punti percentuali. La casella incorniciata è il sistema della pagina iniziale. Su tutte le {format(len(results), ',').replace(',', ' ')} combinazioni, lo scarto va da {results['high_risk_gap'].min():+.1f} a {results['high_risk_gap'].max():+.1f} punti percentuali. I moltiplicatori cambiano poco, perché un punteggio è mostrato come quota del punteggio più alto che la stessa persona potrebbe ottenere, anch’esso moltiplicato.")
+
+sensitivity_analysis()
+
+# ---------- Weight search ----------
+st.subheader("Si possono rendere i pesi più equi?")
+
+@st.fragment
+def weight_search():
+    st.write("Un ottimizzatore prova migliaia di altri valori per questi stessi numeri. Cerca un sistema con uno scarto minore tra persone non svizzere e svizzere, che classifichi comunque le persone quasi nello stesso ordine dell’originale. L’accordo è misurato con la correlazione per ranghi di Spearman: 1 significa esattamente lo stesso ordine. I candidati che nessun altro supera su entrambi i fronti formano il fronte di Pareto.")
+
+    min_agreement = st.slider("Accordo minimo con la classifica originale", 0.5, 1.0, 0.9, 0.05)
+    features = st.multiselect("Informazioni usate dal sistema", FEATURES, default=["ethnicity", "encounters", "convictions", "age"], format_func=feature_labels.get, key="search_features")
+
+    results, front, original = cached_weight_search(sample_profiles(), toggle_mask(**{feature: True for feature in features}), min_agreement)
+    # The front is ordered by increasing gap, the first candidate that is close enough to the original ranking is the fairest
+    close_enough = front[front["agreement"] >= min_agreement]
+    if close_enough.empty:
+        st.info("Con queste informazioni tutti ottengono lo stesso punteggio, qualunque siano i pesi: non c’è nessuna classifica da mantenere e niente da cercare. Scegliete almeno un’informazione.")
+        return
+    best = close_enough.iloc[0]
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Scarto con i pesi originali", f"{original['high_risk_gap']:+.1f}")
+    col2.metric("Scarto con i pesi trovati", f"{best['high_risk_gap']:+.1f}", f"{best['high_risk_gap'] - original['high_risk_gap']:+.1f}", delta_color="inverse")
+    col3.metric("Accordo con la classifica originale", f"{best['agreement']:.2f}")
+
+    kinds = {"candidate": "Altri candidati", "front": "Fronte di Pareto", "original": "Pesi originali"}
+    points = pd.concat([results.assign(kind="candidate"), front.assign(kind="front"), original.to_frame().T.assign(kind="original")], ignore_index=True)
+    points["kind"] = points["kind"].map(kinds)
+    chart = alt.Chart(points).mark_circle().encode(
+        alt.X("agreement:Q", title="Accordo con la classifica originale", scale=alt.Scale(zero=False)),
+        alt.Y("high_risk_gap:Q", title="Scarto nel tasso di rischio elevato (punti percentuali)"),
+        alt.Color("kind:N", title="Candidato", scale=alt.Scale(domain=list(kinds.values()), range=["#c0c0c0", "#d62728", "#000000"])),
+        alt.Size("kind:N", scale=alt.Scale(domain=list(kinds.values()), range=[15, 60, 120]), legend=None),
+        tooltip=list(Weights._fields) + [alt.Tooltip("high_risk_gap:Q", format="+.1f"), alt.Tooltip("agreement:Q", format=".3f")],
+    )
+    st.altair_chart(chart, use_container_width=True)
+    st.caption(f"{format(len(results), ',').replace(',', ' ')} candidati valutati su una popolazione simulata di 20 000 persone. Ogni punto è un candidato. I punti in basso a destra sono più equi e più vicini al sistema originale. Uno scarto minore non rende il sistema equo: si basa sempre su incontri con la polizia che sono distorti.")
+
+    table = front[list(Weights._fields) + ["high_risk_gap", "agreement"]].rename(columns=dict(weight_labels, high_risk_gap="Scarto (punti percentuali)", agreement="Accordo con la classifica originale"))
+    st.dataframe(table.round(2), hide_index=True)
+
+weight_search()
+
+# ---------- Errors per group ----------
+st.subheader("Su chi sbaglia il sistema? Errori per gruppo")
+
+@st.fragment
+def outcome_analysis():
+    st.write("L’analisi di ProPublica sul sistema americano COMPAS ha confrontato i suoi errori tra i gruppi: chi viene valutato a torto ad alto rischio senza recidivare, e chi recidiva senza essere stato valutato ad alto rischio. La stessa analisi viene fatta qui su una popolazione di cui si conosce la recidiva.")
+
+    population = session_population(st.session_state)
+    sources = {"simulated": "Popolazione simulata (incontri con la polizia distorti)"}
+    if compas_available():
+        sources["compas"] = "COMPAS, contea di Broward (ProPublica)"
+    if has_outcomes(population):
+        sources["app"] = "Dati della pagina iniziale"
+
+    col1, col2 = st.columns(2)
+    source = col1.selectbox("Popolazione", list(sources), format_func=sources.get)
+    features = col2.multiselect("Informazioni usate dal sistema", FEATURES, default=["encounters", "convictions", "age"], format_func=feature_labels.get, key="outcome_features")
+
+    if source == "app":
+        df = population
+    elif source == "compas":
+        df = load_compas()
+        st.caption("I dati COMPAS non contengono incontri con la polizia, quindi questa informazione non ha effetto sui loro punteggi.")
+    else:
+        df = sample_profiles()
+    report = cached_outcome_analysis(df).report(toggle_mask(**{feature: True for feature in features}))
+    columns = {"profiles": "Profili", "reoffense_rate": "Hanno recidivato", "high_risk_rate": "Rischio elevato", "false_positive_rate": "Falsi positivi", "false_negative_rate": "Falsi negativi", "precision": "Precisione", "reoffense_rate_low": "Hanno recidivato (rischio basso)", "reoffense_rate_medium": "Hanno recidivato (rischio medio)", "reoffense_rate_high": "Hanno recidivato (rischio elevato)"}
+    column_config = {name: st.column_config.NumberColumn(label, format="percent") for name, label in columns.items()}
+    column_config["profiles"] = st.column_config.NumberColumn(columns["profiles"])
+    st.dataframe(report.rename(index=compas_group_labels if source == "compas" else group_labels), column_config=column_config)
+    st.caption("Falsi positivi: quota delle persone che non hanno recidivato ma sono state valutate ad alto rischio. Falsi negativi: quota delle persone che hanno recidivato senza essere state valutate ad alto rischio. Precisione: quota delle valutazioni ad alto rischio che erano giuste. Le ultime tre colonne mostrano quanto spesso le persone di ogni livello di rischio hanno realmente recidivato (calibrazione).")
+
+outcome_analysis()
+
+# ---------- Proxies ----------
+st.subheader("Variabili nascoste: cosa rivela l’origine?")
+
+@st.fragment
+def proxy_analysis():
+    st.write("Togliere l’origine da un sistema non la toglie dai dati, perché altre informazioni possono rivelarla. Per ogni informazione, la tabella misura quanto dice sull’origine e sul genere: l’informazione mutua (in bit) e la V di Cramér (da 0, nessun legame, a 1, completamente determinata).")
+
+    population = session_population(st.session_state)
+    sources = {"simulated": "Popolazione simulata (incontri con la polizia distorti)", "app": "Dati della pagina iniziale"}
+    if compas_available():
+        sources["compas"] = "COMPAS, contea di Broward (ProPublica)"
+    source = st.selectbox("Popolazione", list(sources), format_func=sources.get, key="proxy_source")
+    df = {"simulated": sample_profiles, "app": lambda: population, "compas": load_compas}[source]()
+
+    report = cached_proxy_report(df)
+    labels = {**feature_labels, **{"reoffended": "Ha recidivato", "race": "Race (COMPAS)"}}
+    table = pd.DataFrame(index=[labels.get(name, name) for name in report.index])
+    for attribute in report.columns.levels[0]:
+        table["{attribute}: informazione mutua (bit)".format(attribute=labels[attribute])] = report[(attribute, "mutual_information")].to_numpy()
+        table["{attribute}: V di Cramér".format(attribute=labels[attribute])] = report[(attribute, "cramers_v")].to_numpy()
+    st.dataframe(table.style.format("{:.3f}"))
+
+    if "ethnicity" in report.columns.levels[0]:
+        chart_data = pd.DataFrame({"feature": table.index, "cramers_v": report[("ethnicity", "cramers_v")].to_numpy()})
+        st.altair_chart(alt.Chart(chart_data).mark_bar().encode(
+            alt.X("cramers_v:Q", title="V di Cramér con l’origine", scale=alt.Scale(domain=[0, 1])),
+            alt.Y("feature:N", title="Informazione", sort="-x"),
+        ), use_container_width=True)
+
+proxy_analysis()
@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+
+from engine.lookup import load_lookup_table
+from engine.service import make_app
+
+# Local HTTP service scoring batches of profiles with the rules of the app page:
+#   python scoring_service.py --port 8600
+#   curl -X POST localhost:8600/score -d '{"mask": "encounters+convictions", "profiles": [{"age": 21, "ethnicity": "Swiss",
+#        "convictions": 0, "encounters": 12, "gender": "M"}]}'
+# Connections are kept alive between requests (HTTP/1.1), clients should reuse them.
+
+
+async def serve(address, port, max_delay, max_rows, idle_timeout, table):
+    app = make_app(max_delay, max_rows, table)
+    app.listen(port, address, idle_connection_timeout=idle_timeout, max_body_size=512 * 1024 * 1024)
+    print(f"Scoring service listening on http://{address}:{port}/score", flush=True)
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the scoring rules over HTTP (POST /score, GET /stats).")
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--max-delay-ms", type=float, default=2.0,
+                        help="how long a small request waits for others to be scored in the same batch")
+    parser.add_argument("--max-batch-rows", type=int, default=50_000, help="batches are scored as soon as they reach this size")
+    parser.add_argument("--model", help="scoring table exported with 'python -m engine.lookup' (default: the rules of the app)")
+    parser.add_argument("--idle-timeout", type=float, default=60.0, help="seconds an idle keep-alive connection stays open")
+    args = parser.parse_args(argv)
+    table = load_lookup_table(args.model) if args.model else None
+    asyncio.run(serve(args.address, args.port, args.max_delay_ms / 1000, args.max_batch_rows, args.idle_timeout, table))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import itertools
+from math import factorial
+
+import numpy as np
+import pytest
+
+from engine.attribution import mean_shapley_values, shapley_values
+from engine.scoring import FEATURES, NBR_MASKS, score_population, toggle_mask, uses
+from engine.simulation import sample_profiles
+
+MASKS = (toggle_mask(encounters=True), toggle_mask(encounters=True, convictions=True),
+         toggle_mask(ethnicity=True, convictions=True, age=True), NBR_MASKS - 1)
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    return sample_profiles(2.0, 2000)
+
+
+# Shapley values from their definition: the marginal contribution of each feature averaged over every order in
+# which the enabled features can be added, with the scores of the rules themselves
+def brute_force_shapley(df, mask):
+    players = [feature for feature in FEATURES if uses(mask, feature)]
+    values = np.zeros((len(df), len(FEATURES)))
+    for order in itertools.permutations(players):
+        coalition = 0
+        previous = score_population(df, coalition).score
+        for feature in order:
+            coalition |= 1 << FEATURES.index(feature)
+            score = score_population(df, coalition).score
+            values[:, FEATURES.index(feature)] += score - previous
+            previous = score
+    return values / factorial(len(players))
+
+
+@pytest.mark.parametrize("mask", MASKS)
+def test_contributions_sum_to_the_score_minus_the_baseline(profiles, mask):
+    values = shapley_values(profiles, mask)
+    expected = score_population(profiles, mask).score - score_population(profiles, 0).score
+    np.testing.assert_allclose(values.sum(axis=1), expected, atol=1e-4)
+    # Disabled features contribute nothing
+    disabled = [i for i, feature in enumerate(FEATURES) if not uses(mask, feature)]
+    np.testing.assert_array_equal(values[:, disabled], 0)
+
+
+@pytest.mark.parametrize("mask", MASKS[:3])
+def test_contributions_match_the_enumeration_of_coalitions(profiles, mask):
+    np.testing.assert_allclose(shapley_values(profiles, mask), brute_force_shapley(profiles, mask), atol=1e-4)
+
+
+def test_shown_and_mean_contributions(profiles):
+    mask = NBR_MASKS - 1
+    values = shapley_values(profiles, mask)
+    np.testing.assert_array_equal(shapley_values(profiles, mask, 8), values[:8])
+    np.testing.assert_allclose(mean_shapley_values(profiles, mask), values.mean(axis=0), atol=1e-4)
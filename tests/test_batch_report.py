@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from batch_report import main
+from engine.simulation import sample_profiles
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    directory = tmp_path / "cantons"
+    directory.mkdir()
+    for seed, name in enumerate(("zh", "ge")):
+        sample_profiles(2.0, 500, seed=seed).to_parquet(directory / f"{name}.parquet")
+    return directory
+
+
+def test_one_report_per_file(profiles, tmp_path):
+    out = tmp_path / "reports"
+    main([str(profiles), "--out", str(out), "--masks", "encounters+convictions", "all", "--workers", "1"])
+    assert sorted(path.name for path in out.iterdir()) == ["ge.html", "ge.json", "index.html", "summary.json", "zh.html", "zh.json"]
+    summary = json.loads((out / "summary.json").read_text())
+    assert [report["dataset"] for report in summary] == ["ge.parquet", "zh.parquet"]
+
+
+@pytest.mark.parametrize("mask", ["encounters+height", "64"])
+def test_bad_masks_are_usage_errors(profiles, tmp_path, capsys, mask):
+    with pytest.raises(SystemExit) as exit_info:
+        main([str(profiles), "--out", str(tmp_path / "reports"), "--masks", mask])
+    assert exit_info.value.code == 2
+    assert "error:" in capsys.readouterr().err
+
+
+def test_files_with_the_same_name_are_refused(profiles, tmp_path, capsys):
+    sample_profiles(2.0, 100).to_csv(profiles / "zh.csv", index=False)
+    with pytest.raises(SystemExit):
+        main([str(profiles), "--out", str(tmp_path / "reports")])
+    assert "zh.csv, zh.parquet" in capsys.readouterr().err
+    assert not (tmp_path / "reports").exists()
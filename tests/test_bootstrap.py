@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from engine.bootstrap import bootstrap_disparity, cached_bootstrap, percentile_interval
+from engine.cache import cached_cells
+from engine.fairness import disparity
+from engine.interventions import INTERVENTIONS, cached_intervention
+from engine.lookup import IS_OTHER_CELL
+from engine.scoring import HIGH, LOW, MEDIUM, NBR_MASKS, label_flags, toggle_mask
+from engine.simulation import sample_profiles
+
+MASK = toggle_mask(ethnicity=True, encounters=True, convictions=True)
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    return sample_profiles(2.0, 3000)
+
+
+# Bootstrap resampling the profiles themselves: a matrix of resampled profile indices, one row per resample
+def resampled_intervals(buckets, is_other, resamples, seed):
+    indices = np.random.default_rng(seed).integers(len(buckets), size=(resamples, len(buckets)))
+    buckets, is_other = buckets[indices], is_other[indices]
+    high = buckets == HIGH
+    rates = [(high & group).sum(axis=1) / group.sum(axis=1) for group in (is_other, ~is_other)]
+    gap, ratio = disparity(*rates)
+    intervals = {name: percentile_interval((buckets == level).sum(axis=1).astype(float))
+                 for name, level in (("low", LOW), ("medium", MEDIUM), ("high", HIGH))}
+    return {**intervals, "high_risk_gap": percentile_interval(gap), "high_risk_ratio": percentile_interval(ratio)}
+
+
+def test_counts_drawn_at_once_match_resampled_profiles():
+    rng = np.random.default_rng(1)
+    is_other = rng.random(200) < 0.4
+    buckets = np.where(is_other, rng.choice(3, 200, p=[0.3, 0.3, 0.4]), rng.choice(3, 200, p=[0.5, 0.3, 0.2]))
+    drawn = bootstrap_disparity(buckets, is_other, resamples=4000, seed=2)
+    resampled = resampled_intervals(buckets, is_other, 4000, seed=3)
+    for name in ("low", "medium", "high"):
+        np.testing.assert_allclose(drawn[name], resampled[name], atol=3)
+    np.testing.assert_allclose(drawn["high_risk_gap"], resampled["high_risk_gap"], atol=2.5)
+    np.testing.assert_allclose(drawn["high_risk_ratio"], resampled["high_risk_ratio"], atol=0.15)
+
+
+def test_cells_know_the_group_of_their_profiles(profiles):
+    np.testing.assert_array_equal(IS_OTHER_CELL[cached_cells(profiles)], label_flags(profiles["ethnicity"], "Other"))
+
+
+@pytest.mark.parametrize("intervention", INTERVENTIONS)
+@pytest.mark.parametrize("mask", [MASK, NBR_MASKS - 1])
+def test_population_intervals_count_every_profile(profiles, mask, intervention):
+    buckets = cached_intervention(profiles, mask, intervention).scored.bucket
+    is_other = label_flags(profiles["ethnicity"], "Other")
+    intervals = cached_bootstrap(profiles, mask, intervention, nbr_profiles=8)
+    assert intervals["population"] == bootstrap_disparity(buckets, is_other)
+    assert intervals["shown"] == bootstrap_disparity(buckets[:8], is_other[:8])
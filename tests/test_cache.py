@@ -0,0 +1,74 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.cache import ScoreCache, _nbytes
+
+
+def array(nbytes):
+    return np.zeros(nbytes, dtype=np.uint8)
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = ScoreCache(300)
+    for key in "abc":
+        cache.get(key, lambda: array(100))
+    # "a" is used again, so "b" is now the least recently used
+    cache.get("a", lambda: pytest.fail("a is cached"))
+    cache.get("d", lambda: array(100))
+    assert "b" not in cache
+    assert all(key in cache for key in "acd")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_bytes_are_accounted_on_insertion_and_eviction():
+    cache = ScoreCache(1000)
+    cache.get("a", lambda: {"x": array(200), "y": (array(100), array(50))})
+    cache.get("b", lambda: array(400))
+    assert cache.stats()["nbytes"] == 750
+    # 750 + 600 does not fit, "a" (350 bytes) has to go
+    cache.get("c", lambda: array(600))
+    stats = cache.stats()
+    assert stats["nbytes"] == 1000 and stats["entries"] == 2 and stats["evictions"] == 1
+    cache.clear()
+    assert cache.stats()["nbytes"] == 0
+
+
+def test_pandas_values_are_counted():
+    frame = pd.DataFrame({"a": np.zeros(10), "b": np.zeros(10)})
+    assert _nbytes(frame) >= 160
+    assert _nbytes(frame["a"]) >= 80
+
+
+def test_hits_and_misses():
+    cache = ScoreCache(1000)
+    value = cache.get("a", lambda: array(10))
+    assert cache.get("a", lambda: array(10)) is value
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_cached_arrays_are_read_only():
+    value = ScoreCache(1000).get("a", lambda: array(10))
+    with pytest.raises(ValueError):
+        value[0] = 1
+
+
+def test_values_larger_than_the_cache_are_reported_once(caplog):
+    cache = ScoreCache(100)
+    with caplog.at_level(logging.WARNING, logger="engine.cache"):
+        for _ in range(3):
+            assert len(cache.get("big", lambda: array(200))) == 200
+    assert "big" not in cache
+    assert cache.stats()["too_large"] == 3
+    assert len(caplog.records) == 1 and "'big'" in caplog.records[0].getMessage()
+
+
+def test_values_too_large_are_reported_again_after_a_clear(caplog):
+    cache = ScoreCache(100)
+    with caplog.at_level(logging.WARNING, logger="engine.cache"):
+        cache.get("big", lambda: array(200))
+        cache.clear()
+        cache.get("big", lambda: array(200))
+    assert len(caplog.records) == 2
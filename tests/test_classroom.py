@@ -0,0 +1,75 @@
+import math
+
+import pytest
+
+from engine import classroom
+from engine.classroom import IDLE_TIMEOUT_SECONDS, Room, format_gap, format_rate, get_room
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rates_of_cohorts_without_a_group_are_left_out():
+    room = Room("TEST")
+    room.publish("a", 3, "none", (0.5, 0.25))
+    room.publish("b", 3, "none", (float("nan"), 0.1))
+    snapshot = room.snapshot()
+    assert snapshot["participants"] == 2
+    assert snapshot["high_risk_other"] == pytest.approx(0.5)
+
+    # Once the participant changes to a system with valid rates, both count again
+    room.publish("b", 3, "none", (0.3, 0.15))
+    snapshot = room.snapshot()
+    assert snapshot["high_risk_other"] == pytest.approx(0.4)
+    assert snapshot["high_risk_swiss"] == pytest.approx(0.2)
+
+
+def test_no_valid_rates_give_no_average():
+    room = Room("TEST")
+    room.publish("a", 3, "none", (float("nan"), 0.1))
+    assert math.isnan(room.snapshot()["high_risk_gap"])
+
+
+def test_idle_participants_leave_the_room():
+    clock = FakeClock()
+    room = Room("TEST", idle_timeout=60, clock=clock)
+    room.publish("a", 1, "none", (0.5, 0.5))
+    clock.now = 30
+    room.publish("b", 2, "none", (0.1, 0.1))
+    clock.now = 70
+    # The same choice again still counts as activity
+    room.publish("b", 2, "none", (0.1, 0.1))
+    snapshot = room.snapshot()
+    assert snapshot["participants"] == 1
+    assert snapshot["mask_counts"][1] == 0 and snapshot["mask_counts"][2] == 1
+    assert snapshot["high_risk_other"] == pytest.approx(0.1)
+
+    clock.now = 200
+    assert room.snapshot()["participants"] == 0
+
+
+def test_idle_rooms_are_dropped(monkeypatch):
+    monkeypatch.setattr(classroom, "_rooms", {})
+    clock = FakeClock()
+    past, watched, active = (get_room(code, clock) for code in ("past", "watched", "active"))
+    clock.now = IDLE_TIMEOUT_SECONDS - 1
+    watched.snapshot()
+    active.publish("a", 3, "none", (0.5, 0.25))
+    clock.now = IDLE_TIMEOUT_SECONDS
+    assert get_room("active", clock) is active
+    assert sorted(classroom._rooms) == ["ACTIVE", "WATCHED"]
+    # A room is created again, empty, when its code is used after it was dropped
+    assert get_room("past", clock) is not past
+    assert get_room("past", clock).snapshot()["participants"] == 0
+
+
+def test_missing_rates_are_shown_as_a_dash():
+    assert format_rate(0.256) == "25.6%"
+    assert format_gap(-3.04) == "-3.0"
+    snapshot = Room("TEST").snapshot()
+    assert format_rate(snapshot["high_risk_other"]) == format_gap(snapshot["high_risk_gap"]) == "–"
@@ -0,0 +1,48 @@
+import re
+
+import pandas as pd
+
+from engine.compact import profile_names, render_profiles
+from engine.data import demo_population, to_profile_schema
+from engine.scoring import NBR_MASKS, score_population
+
+FIELDS = [("Name", "name"), ("Ethnicity", "ethnicity"), ("Age", "age")]
+
+
+def cells(html, row):
+    rows = re.findall(r"<tr>(.*?)</tr>", html)
+    return re.findall(r"<td[^>]*>(.*?)</td>", rows[row])
+
+
+def test_one_row_per_profile_with_its_score_and_bucket():
+    df = demo_population()
+    scored = score_population(df, NBR_MASKS - 1)
+    html = render_profiles(df, scored, FIELDS, "Score", 5)
+    assert html.count('<td class="bucket') == 5
+    for i in range(5):
+        assert cells(html, i + 1) == [df["name"][i], df["ethnicity"][i], str(df["age"][i]), f"{scored.percent[i]}%"]
+        assert f'<td class="bucket{scored.bucket[i]}">{scored.percent[i]}%</td>' in html
+
+
+def test_labels_notes_and_escaping():
+    df = demo_population().assign(name=lambda df: df["name"].cat.rename_categories(lambda name: f"<b>{name}</b>"))
+    df.attrs["source_key"] = "test:compact:escaping"
+    scored = score_population(df, 0)
+    notes = [["first & only"], []]
+    labels = {"Swiss": "Schweizer", "Other": "Andere"}
+    html = render_profiles(df, scored, FIELDS, "Score", 2, notes, value_labels={"ethnicity": labels})
+    assert cells(html, 1)[:2] == ["&lt;b&gt;John&lt;/b&gt;", labels[df["ethnicity"][0]]]
+    assert '<td class="note" colspan="4">first &amp; only</td>' in html
+    assert html.count('class="note"') == 1
+
+
+def test_profiles_without_names_are_numbered():
+    df = to_profile_schema(pd.DataFrame({"age": [30, 40], "ethnicity": ["Swiss", "Other"], "convictions": 0, "encounters": 0,
+                                         "gender": "F"}))
+    df.attrs["source_key"] = "test:compact:names"
+    assert profile_names(df, 2) == ["#1", "#2"]
+    html = render_profiles(df, score_population(df, NBR_MASKS - 1), FIELDS, "Score", 2,
+                           value_labels={"ethnicity": {"Swiss": "Schweizer"}})
+    # Values without a translation are shown as they are
+    assert [cells(html, i)[:2] for i in (1, 2)] == [["#1", "Schweizer"], ["#2", "Other"]]
+    assert profile_names(demo_population(), 3) == ["John", "Janine", "Joe"]
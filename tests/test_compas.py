@@ -0,0 +1,59 @@
+import csv
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.compas import convert_compas, load_compas
+from engine.lookup import lookup_population
+from engine.scoring import NBR_MASKS, profile_arrays, score_population
+
+# A few dozen made-up rows with the header of ProPublica's compas-scores-two-years.csv (some of its columns)
+SAMPLE_CSV = Path(__file__).resolve().parent / "data" / "compas-sample.csv"
+
+
+@pytest.fixture(scope="module")
+def rows():
+    with open(SAMPLE_CSV, newline="") as file:
+        return list(csv.DictReader(file))
+
+
+def test_columns_map_to_the_profile_schema(rows):
+    df = convert_compas(SAMPLE_CSV)
+    assert len(df) == len(rows)
+    assert df["age"].tolist() == [int(row["age"]) for row in rows]
+    assert df["convictions"].tolist() == [int(row["priors_count"]) for row in rows]
+    assert df["race"].tolist() == [row["race"] for row in rows]
+    assert df["ethnicity"].tolist() == ["Swiss" if row["race"] == "Caucasian" else "Other" for row in rows]
+    assert df["gender"].tolist() == [{"Male": "M", "Female": "F"}[row["sex"]] for row in rows]
+    assert df["reoffended"].tolist() == [row["two_year_recid"] == "1" for row in rows]
+    assert (df["encounters"] == 0).all()
+    assert df.dtypes[["age", "convictions", "encounters"]].eq("int16").all()
+    assert df["reoffended"].dtype == "boolean"
+
+
+def test_converted_profiles_give_the_six_features(rows):
+    arrays = profile_arrays(convert_compas(SAMPLE_CSV))
+    assert np.array_equal(arrays["is_male"], [row["sex"] == "Male" for row in rows])
+    assert np.array_equal(arrays["is_other"], [row["race"] != "Caucasian" for row in rows])
+    assert np.array_equal(arrays["age"], [int(row["age"]) for row in rows])
+    assert np.array_equal(arrays["convictions"], [int(row["priors_count"]) for row in rows])
+    assert not arrays["encounters"].any()
+    # No postcodes in COMPAS
+    assert not arrays["high_foreign_share"].any()
+
+
+def test_converted_profiles_can_be_scored():
+    df = convert_compas(SAMPLE_CSV)
+    for mask in range(NBR_MASKS):
+        assert np.array_equal(lookup_population(df, mask).bucket, score_population(df, mask).bucket)
+
+
+def test_parquet_copy_matches_the_csv(tmp_path):
+    csv_path = tmp_path / "compas-scores-two-years.csv"
+    shutil.copy(SAMPLE_CSV, csv_path)
+    df = load_compas(csv_path)
+    assert csv_path.with_suffix(".parquet").exists()
+    pd.testing.assert_frame_equal(df, convert_compas(csv_path))
@@ -0,0 +1,49 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.counterfactual import COUNTERFACTUALS, cached_counterfactuals, counterfactual_deltas
+from engine.data import to_profile_schema
+from engine.scoring import NBR_MASKS, score_population, toggle_mask
+
+MASKS = (toggle_mask(gender=True, ethnicity=True), toggle_mask(encounters=True, age=True), NBR_MASKS - 1)
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    rows = list(itertools.product((0, 10), (0, 5), (18, 24, 25, 60), ("M", "F", "N/S"), ("Swiss", "Other")))
+    df = pd.DataFrame(rows, columns=["encounters", "convictions", "age", "gender", "ethnicity"])
+    df = to_profile_schema(df)
+    df.attrs["source_key"] = "test:counterfactual"
+    return df
+
+
+# The same profiles with one sensitive attribute changed in the data itself
+def flipped_profiles(df, attribute):
+    flipped = df.copy()
+    if attribute == "gender":
+        flipped["gender"] = df["gender"].astype(str).replace({"M": "F", "F": "M"})
+    elif attribute == "ethnicity":
+        flipped["ethnicity"] = df["ethnicity"].astype(str).replace({"Swiss": "Other", "Other": "Swiss"})
+    elif attribute == "age":
+        flipped["age"] = np.where(df["age"] < 25, 25, 24)
+    return to_profile_schema(flipped)
+
+
+@pytest.mark.parametrize("mask", MASKS)
+@pytest.mark.parametrize("attribute", COUNTERFACTUALS)
+def test_deltas_match_scoring_the_flipped_profiles(profiles, mask, attribute):
+    score, percent = counterfactual_deltas(profiles, mask)[attribute]
+    actual, flipped = score_population(profiles, mask), score_population(flipped_profiles(profiles, attribute), mask)
+    np.testing.assert_allclose(score, flipped.score - actual.score)
+    np.testing.assert_allclose(percent, np.round(flipped.percent - actual.percent, 1))
+
+
+def test_only_the_shown_profiles_are_flipped(profiles):
+    deltas = cached_counterfactuals(profiles, NBR_MASKS - 1, nbr_profiles=5)
+    expected = counterfactual_deltas(profiles, NBR_MASKS - 1)
+    for attribute in COUNTERFACTUALS:
+        assert len(deltas[attribute][0]) == 5
+        np.testing.assert_allclose(deltas[attribute][1], expected[attribute][1][:5])
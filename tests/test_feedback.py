@@ -0,0 +1,49 @@
+import numpy as np
+
+from engine.feedback import METRICS, _patrol, feedback_loop, sweep_feedback
+
+PARAMS = dict(rounds=15, nbr_profiles=20000, seed=1)
+
+
+def test_records_only_keep_the_last_rounds():
+    rng = np.random.default_rng(0)
+    memory, nbr_profiles = 4, 1000
+    history = {name: np.zeros((memory, nbr_profiles), dtype=np.int16) for name in ("encounters", "convictions")}
+    arrays = {name: np.zeros(nbr_profiles, dtype=np.int16) for name in history}
+    rounds = []
+    for step in range(11):
+        _patrol(rng, arrays, history, step % memory, np.full(nbr_profiles, 0.5), np.full(nbr_profiles, 0.4))
+        rounds.append({name: values[step % memory].copy() for name, values in history.items()})
+    for name in history:
+        np.testing.assert_array_equal(arrays[name], sum(records[name] for records in rounds[-memory:]))
+    # Convictions come from encounters
+    assert np.all(history["convictions"] <= history["encounters"])
+
+
+def test_without_feedback_the_gap_stays_flat():
+    metrics = feedback_loop(attention=1.0, **PARAMS)
+    assert all(len(metrics[name]) == PARAMS["rounds"] + 1 for name in METRICS)
+    assert np.ptp(metrics["high_risk_gap"]) < 3
+    assert metrics["encounters_other"][0] > metrics["encounters_swiss"][0]
+
+
+def test_feedback_widens_a_biased_gap():
+    flat = feedback_loop(attention=1.0, **PARAMS)
+    amplified = feedback_loop(attention=4.0, **PARAMS)
+    assert amplified["high_risk_gap"][0] == flat["high_risk_gap"][0]
+    assert amplified["high_risk_gap"][-1] > flat["high_risk_gap"][-1] + 5
+
+
+def test_feedback_without_bias_creates_no_gap():
+    metrics = feedback_loop(oversampling=1.0, attention=4.0, **PARAMS)
+    assert np.all(np.abs(metrics["high_risk_gap"]) < 2)
+
+
+def test_sweep_has_one_row_per_run_and_round():
+    grid = {"oversampling": [1.0, 2.0], "attention": [1.0, 3.0]}
+    results = sweep_feedback(grid, rounds=3, nbr_profiles=2000)
+    assert len(results) == 4 * 4
+    single = results[(results["oversampling"] == 2.0) & (results["attention"] == 3.0)]
+    np.testing.assert_allclose(single["high_risk_gap"], feedback_loop(2.0, 3.0, rounds=3, nbr_profiles=2000)["high_risk_gap"])
+    parallel = sweep_feedback(grid, workers=2, rounds=3, nbr_profiles=2000)
+    assert parallel.equals(results)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from engine.cache import cached_scores
+from engine.data import demo_population
+from engine.interventions import group_thresholds, reweighing
+from engine.scoring import HIGH, LOW, MEDIUM, NBR_MASKS, label_flags, risk_buckets, toggle_mask
+from engine.simulation import sample_profiles
+
+MASKS = (toggle_mask(encounters=True, convictions=True), toggle_mask(ethnicity=True, encounters=True, convictions=True, age=True),
+         NBR_MASKS - 1)
+
+
+@pytest.fixture(scope="module", params=["demo", "simulated"])
+def profiles(request):
+    return demo_population() if request.param == "demo" else sample_profiles(2.0, 5000)
+
+
+def bucket_shares(bucket, group):
+    return np.array([np.mean(bucket[group] == level) for level in (LOW, MEDIUM, HIGH)])
+
+
+@pytest.mark.parametrize("mask", MASKS)
+def test_group_thresholds_give_equal_high_risk_rates(profiles, mask):
+    scored = cached_scores(profiles, mask)
+    is_other = label_flags(profiles["ethnicity"], "Other")
+    after = group_thresholds(scored, is_other)
+    # The rates of the groups can only differ by the rounding of each group to a whole number of profiles
+    one_profile = 1 / np.count_nonzero(is_other) + 1 / np.count_nonzero(~is_other)
+    assert abs(np.mean(after.bucket[is_other] == HIGH) - np.mean(after.bucket[~is_other] == HIGH)) <= one_profile
+    assert np.count_nonzero(after.bucket == HIGH) == np.count_nonzero(scored.bucket == HIGH)
+    # Scores are unchanged and profiles only move between the medium and high buckets
+    np.testing.assert_array_equal(after.percent, scored.percent)
+    np.testing.assert_array_equal(after.bucket == LOW, scored.bucket == LOW)
+    # Profiles rated high-risk in a group have scores at least as high as the others of the group
+    for group in (is_other, ~is_other):
+        high = group & (after.bucket == HIGH)
+        if high.any() and (group & ~high).any():
+            assert after.percent[high].min() >= after.percent[group & ~high].max()
+
+
+@pytest.mark.parametrize("mask", MASKS)
+def test_reweighing_gives_every_group_the_shares_of_the_population(profiles, mask):
+    scored = cached_scores(profiles, mask)
+    is_other = label_flags(profiles["ethnicity"], "Other")
+    after = reweighing(scored, is_other)
+    everyone = bucket_shares(scored.bucket, np.ones(len(is_other), dtype=bool))
+    for group in (is_other, ~is_other):
+        assert np.all(np.abs(bucket_shares(after.bucket, group) - everyone) <= 1 / np.count_nonzero(group))
+        # The order of the profiles within a group is kept, profiles with the same score being ranked at random
+        order = np.lexsort((after.percent[group], scored.percent[group]))
+        assert np.all(np.diff(after.percent[group][order]) >= 0)
+    np.testing.assert_array_equal(after.bucket, risk_buckets(after.percent))
+    np.testing.assert_allclose(after.score, after.percent * scored.max_score / 100)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.lookup import compiled_table
+from engine.outcomes import ConfusionAccumulator, analyze_outcomes
+from engine.scoring import HIGH, NBR_MASKS, score_population, toggle_mask
+from engine.simulation import sample_profiles
+
+MASKS = (0, toggle_mask(encounters=True, convictions=True), NBR_MASKS - 1)
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    df = sample_profiles(2.0, 3000)
+    # Some outcomes are unknown
+    df.loc[df.index[::7], "reoffended"] = pd.NA
+    return df
+
+
+def test_merged_chunks_equal_a_single_pass(profiles):
+    single = ConfusionAccumulator(masks=MASKS).update(profiles)
+    chunks = [ConfusionAccumulator(masks=MASKS).update(profiles.iloc[start:start + 700]) for start in range(0, len(profiles), 700)]
+    merged = chunks[0]
+    for chunk in chunks[1:]:
+        merged = merged + chunk
+    np.testing.assert_array_equal(merged.counts, single.counts)
+    np.testing.assert_array_equal(analyze_outcomes(profiles, chunk_rows=500, masks=MASKS).counts, single.counts)
+    for mask in MASKS:
+        pd.testing.assert_frame_equal(merged.report(mask), single.report(mask))
+
+
+def test_only_accumulators_of_the_same_setup_merge(profiles):
+    accumulator = ConfusionAccumulator(masks=MASKS)
+    with pytest.raises(ValueError):
+        accumulator.merge(ConfusionAccumulator(masks=MASKS[:1]))
+    with pytest.raises(ValueError):
+        accumulator.merge(ConfusionAccumulator(masks=MASKS, table=compiled_table()))
+
+
+def test_report_counts_the_labeled_profiles(profiles):
+    mask = MASKS[1]
+    report = ConfusionAccumulator(masks=MASKS).update(profiles).report(mask)
+    labeled = profiles[profiles["reoffended"].notna()]
+    high = score_population(labeled, mask).bucket == HIGH
+    reoffended = labeled["reoffended"].to_numpy(dtype=bool)
+    for group in ("Swiss", "Other"):
+        in_group = (labeled["ethnicity"] == group).to_numpy()
+        assert report.loc[group, "profiles"] == in_group.sum()
+        assert report.loc[group, "high_risk_rate"] == pytest.approx(high[in_group].mean())
+        assert report.loc[group, "false_positive_rate"] == pytest.approx(high[in_group & ~reoffended].mean())
+        assert report.loc[group, "false_negative_rate"] == pytest.approx((~high)[in_group & reoffended].mean())
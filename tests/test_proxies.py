@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.proxies import NBR_QUANTILE_BINS, category_codes, contingency_table, cramers_v, mutual_information, proxy_report
+
+
+# Mutual information from its definition, one cell of the table at a time
+def reference_mutual_information(table):
+    joint = table / table.sum()
+    total = 0.0
+    for i, j in np.ndindex(joint.shape):
+        if joint[i, j] > 0:
+            total += joint[i, j] * np.log2(joint[i, j] / (joint[i].sum() * joint[:, j].sum()))
+    return total
+
+
+@pytest.mark.parametrize("table", [
+    np.array([[30, 10], [10, 30]]),
+    np.array([[5, 0, 7], [0, 9, 2], [4, 4, 0]]),
+    np.array([[10, 20], [20, 40]]),
+])
+def test_measures_of_a_table(table):
+    assert mutual_information(table) == pytest.approx(reference_mutual_information(table))
+    # Cramér's V from the chi-squared statistic of the table
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / table.sum()
+    chi2 = ((table - expected) ** 2 / expected).sum()
+    assert cramers_v(table) == pytest.approx(np.sqrt(chi2 / table.sum() / (min(table.shape) - 1)))
+
+
+def test_independent_and_identical_columns():
+    assert cramers_v(np.array([[10, 20], [20, 40]])) == pytest.approx(0)
+    assert cramers_v(np.diag([5, 7, 9])) == pytest.approx(1)
+    # Empty rows and columns are not categories
+    assert cramers_v(np.array([[5, 0], [0, 0]])) == 0
+
+
+def test_codes_and_contingency_table():
+    codes, size = category_codes(pd.Series(["a", "b", None, "a"]))
+    assert size == 2 and list(codes) == [0, 1, -1, 0]
+    # Missing values are left out of the counts
+    np.testing.assert_array_equal(contingency_table(codes, size, np.array([1, 0, 1, 1]), 2), [[0, 2], [1, 0]])
+    # Numeric columns with many values are grouped into quantile bins
+    codes, size = category_codes(pd.Series(np.arange(1000, dtype=float)))
+    assert size == NBR_QUANTILE_BINS
+    assert np.all(np.bincount(codes) == 1000 // NBR_QUANTILE_BINS)
+
+
+def test_report_finds_proxies():
+    rng = np.random.default_rng(0)
+    ethnicity = rng.choice(["Swiss", "Other"], 5000)
+    df = pd.DataFrame({
+        "name": np.arange(5000).astype(str),
+        "ethnicity": ethnicity,
+        "gender": rng.choice(["M", "F"], 5000),
+        "copy": np.where(ethnicity == "Other", "x", "y"),
+        "noise": rng.integers(0, 5, 5000),
+    })
+    report = proxy_report(df)
+    assert sorted(report.index) == ["copy", "noise"]
+    assert report.loc["copy", ("ethnicity", "cramers_v")] == pytest.approx(1)
+    assert report.loc["copy", ("ethnicity", "mutual_information")] == pytest.approx(1, abs=0.01)
+    assert report.loc["noise", ("ethnicity", "cramers_v")] < 0.05
+    assert report.loc["copy", ("gender", "cramers_v")] < 0.05
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.data import to_profile_schema
+from engine.regions import (HIGH_FOREIGN_SHARE, POSTCODE_AREAS_CSV, foreign_shares, in_high_share_area, is_high_share_postcode,
+                            postcodes_by_share)
+from engine.scoring import profile_arrays
+
+
+@pytest.fixture(scope="module")
+def areas():
+    return pd.read_csv(POSTCODE_AREAS_CSV)
+
+
+# Share of the area a postcode falls in, searched row by row in the bundled table
+def reference_share(areas, zip_code):
+    for area in areas.itertuples():
+        if area.postcode_from <= zip_code <= area.postcode_to:
+            return area.foreign_share
+    return np.nan
+
+
+def test_shares_match_the_areas_of_the_table(areas):
+    zip_codes = np.unique(np.r_[areas["postcode_from"], areas["postcode_to"], areas["postcode_to"] + 1, areas["postcode_from"] - 1])
+    np.testing.assert_array_equal(foreign_shares(zip_codes), [reference_share(areas, code) for code in zip_codes])
+
+
+def test_unknown_postcodes_are_not_high_share():
+    zip_codes = pd.array([None, -5, 0, 999, 10000, 32000], dtype="Int32")
+    assert np.isnan(foreign_shares(zip_codes)[[0, 1, 4, 5]]).all()
+    assert not in_high_share_area(zip_codes).any()
+
+
+def test_postcodes_by_share():
+    for high in (True, False):
+        codes = postcodes_by_share(high)
+        assert len(codes)
+        assert np.all((foreign_shares(codes) >= HIGH_FOREIGN_SHARE) == high)
+        assert is_high_share_postcode(int(codes[0])) == high
+
+
+def test_profiles_get_the_share_of_their_postcode():
+    zip_codes = [int(postcodes_by_share(True)[0]), int(postcodes_by_share(False)[0]), None]
+    df = to_profile_schema(pd.DataFrame({"age": 30, "ethnicity": "Swiss", "convictions": 0, "encounters": 0, "gender": "F",
+                                         "zip_code": pd.array(zip_codes, dtype="Int16")}))
+    np.testing.assert_array_equal(profile_arrays(df)["high_foreign_share"], [True, False, False])
@@ -0,0 +1,41 @@
+import pytest
+
+from engine.lookup import IS_OTHER_CELL, compiled_table
+from engine.report import dataset_report
+from engine.scoring import HIGH, toggle_mask
+from engine.simulation import sample_profiles
+
+MASK = toggle_mask(encounters=True, convictions=True, age=True)
+
+
+# Every non-Swiss profile is rated high-risk, whatever the mask
+def harsher_table():
+    table = compiled_table().copy()
+    table["percent"][:, IS_OTHER_CELL] = 100.0
+    table["bucket"][:, IS_OTHER_CELL] = HIGH
+    return table
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    path = tmp_path / "profiles.parquet"
+    sample_profiles(2.0, 5000).to_parquet(path)
+    return path
+
+
+def test_error_rates_come_from_the_scoring_table(profiles):
+    rules = dataset_report(profiles, [MASK])["masks"][0]
+    table = dataset_report(profiles, [MASK], table=harsher_table())["masks"][0]
+
+    assert rules["outcomes"]["Other"]["false_positive_rate"] < 1.0
+    assert table["outcomes"]["Other"]["false_positive_rate"] == 1.0
+    assert table["outcomes"]["Other"]["high_risk_rate"] == table["after"]["high_risk_other"] == 1.0
+    # Swiss cells are unchanged
+    assert table["outcomes"]["Swiss"] == pytest.approx(rules["outcomes"]["Swiss"], nan_ok=True)
+
+
+def test_rules_and_compiled_table_give_the_same_report(profiles):
+    rules = dataset_report(profiles, [MASK])["masks"][0]
+    table = dataset_report(profiles, [MASK], table=compiled_table())["masks"][0]
+    for group in ("Other", "Swiss"):
+        assert table["outcomes"][group] == pytest.approx(rules["outcomes"][group], nan_ok=True)
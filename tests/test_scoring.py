@@ -0,0 +1,62 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.data import to_profile_schema
+from engine.lookup import lookup_population
+from engine.regions import postcodes_by_share
+from engine.scoring import (FEATURES, NBR_MASKS, calculate_recidivism_score, max_possible_score_for_row, max_score_arrays,
+                            profile_arrays, score_arrays, score_population, uses)
+
+# Values on both sides of every threshold of the rules
+ENCOUNTERS = (0, 1, 9, 10, 15)
+CONVICTIONS = (0, 1, 2, 4, 5, 9)
+AGES = (18, 24, 25, 60)
+GENDERS = ("M", "F", "N/S")
+ETHNICITIES = ("Swiss", "Other")
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    zip_codes = (int(postcodes_by_share(True)[0]), int(postcodes_by_share(False)[0]), None)
+    rows = list(itertools.product(ENCOUNTERS, CONVICTIONS, AGES, GENDERS, ETHNICITIES, zip_codes))
+    df = pd.DataFrame(rows, columns=["encounters", "convictions", "age", "gender", "ethnicity", "zip_code"])
+    return to_profile_schema(df.assign(zip_code=pd.array(df["zip_code"], dtype="Int16")))
+
+
+def reference_scores(df, mask):
+    arguments = {
+        "encounters": "nbr_encounter_police",
+        "convictions": "nbr_prior_convictions",
+        "age": "age",
+        "gender": "gender",
+        "ethnicity": "ethnicity",
+        "zip_code": "zip_code",
+    }
+    scores = []
+    for row in df.astype(object).to_dict(orient="records"):
+        values = {arguments[feature]: None if pd.isna(row[feature]) else row[feature] for feature in FEATURES if uses(mask, feature)}
+        scores.append(calculate_recidivism_score(**values))
+    return np.array(scores)
+
+
+@pytest.mark.parametrize("mask", range(NBR_MASKS))
+def test_vectorized_scores_equal_the_rules(profiles, mask):
+    arrays = profile_arrays(profiles)
+    np.testing.assert_allclose(score_arrays(arrays, mask), reference_scores(profiles, mask))
+
+
+@pytest.mark.parametrize("mask", range(NBR_MASKS))
+def test_vectorized_maximum_scores_equal_the_rules(profiles, mask):
+    use = {f"use_{feature}": uses(mask, feature) for feature in FEATURES}
+    expected = [max_possible_score_for_row(row, **use) for _, row in profiles.iterrows()]
+    np.testing.assert_allclose(max_score_arrays(profile_arrays(profiles), mask), expected)
+
+
+@pytest.mark.parametrize("mask", range(NBR_MASKS))
+def test_lookup_table_equals_the_rules(profiles, mask):
+    rules, table = score_population(profiles, mask), lookup_population(profiles, mask)
+    for field in rules._fields:
+        np.testing.assert_array_equal(getattr(table, field), getattr(rules, field))
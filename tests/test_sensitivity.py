@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from engine.fairness import disparity
+from engine.scoring import HIGH, NBR_MASKS, Weights, max_score_arrays, profile_arrays, risk_buckets, score_arrays, score_percent, toggle_mask
+from engine.sensitivity import heatmap_data, weight_sensitivity
+from engine.simulation import sample_profiles
+
+# A small grid with values on both sides of the defaults, and an age threshold below every simulated age
+GRID = {
+    "ethnicity_factor": np.array([1.0, 1.5, 2.0]),
+    "age_factor": np.array([1.0, 2.5]),
+    "age_threshold": np.array([18, 25, 30]),
+    "encounters_high": np.array([2, 10]),
+    "convictions_high": np.array([3, 5]),
+}
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    return sample_profiles(2.0, 3000)
+
+
+@pytest.mark.parametrize("mask", [toggle_mask(encounters=True, convictions=True), NBR_MASKS - 1])
+def test_grid_matches_scoring_every_setting(profiles, mask):
+    results = weight_sensitivity(profiles, mask, GRID, memory_mb=1)
+    assert len(results) == np.prod([len(values) for values in GRID.values()])
+    arrays = profile_arrays(profiles)
+    is_other = arrays["is_other"]
+    innocent = ~profiles["reoffended"].fillna(False).to_numpy(dtype=bool)
+    for row in results.itertuples():
+        weights = Weights(*(getattr(row, name) for name in Weights._fields))
+        high = risk_buckets(score_percent(score_arrays(arrays, mask, weights), max_score_arrays(arrays, mask, weights))) == HIGH
+        gap, ratio = disparity(high[is_other].mean(), high[~is_other].mean())
+        np.testing.assert_allclose(row.high_risk_other, high[is_other].mean())
+        np.testing.assert_allclose(row.high_risk_swiss, high[~is_other].mean())
+        np.testing.assert_allclose([row.high_risk_gap, row.high_risk_ratio], [gap, ratio])
+        fp_gap, _ = disparity(high[is_other & innocent].mean(), high[~is_other & innocent].mean())
+        np.testing.assert_allclose(row.false_positive_gap, fp_gap)
+
+
+def test_heatmap_keeps_the_other_weights_at_their_defaults(profiles):
+    results = weight_sensitivity(profiles, NBR_MASKS - 1, GRID)
+    heatmap = heatmap_data(results, "ethnicity_factor", "age_factor")
+    assert len(heatmap) == len(GRID["ethnicity_factor"]) * len(GRID["age_factor"])
+    assert list(heatmap.columns) == ["ethnicity_factor", "age_factor", "high_risk_gap"]
@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from engine.service import make_app
+
+PROFILE = {"age": 21, "ethnicity": "Swiss", "convictions": 0, "encounters": 12, "gender": "M"}
+
+
+class ScoringServiceTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_app(max_delay=0.05)
+
+    def post(self, body):
+        return self.http_client.fetch(self.get_url("/score"), method="POST", raise_error=False,
+                                      body=body if isinstance(body, str) else json.dumps(body))
+
+    def assert_refused(self, response, message):
+        self.assertEqual(response.code, 400)
+        self.assertIn(message, json.loads(response.body)["error"])
+
+    @gen_test
+    async def test_profiles_are_scored(self):
+        response = await self.post({"mask": "encounters+age", "profiles": [PROFILE]})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body), {"score": [5.0], "max_score": [5.0], "percent": [100.0], "bucket": ["high"]})
+
+    @gen_test
+    async def test_columns_give_the_same_scores_as_records(self):
+        records = await self.post({"mask": "all", "profiles": [PROFILE, dict(PROFILE, ethnicity="Other", zip_code=3000)]})
+        columns = await self.post({"mask": "all", "profiles": {name: [PROFILE[name], PROFILE[name]] for name in PROFILE}
+                                   | {"ethnicity": ["Swiss", "Other"], "zip_code": [None, 3000]}})
+        self.assertEqual(json.loads(records.body), json.loads(columns.body))
+
+    @gen_test
+    async def test_malformed_requests_are_refused(self):
+        self.assert_refused(await self.post("{not json"), "Expecting property name")
+        self.assert_refused(await self.post({"profiles": "all of them"}), "'profiles' must be a list of profiles or a dict of columns")
+        self.assert_refused(await self.post({"profiles": [{"age": 20}]}), "Missing columns: ['ethnicity', 'convictions', 'encounters', 'gender']")
+        self.assert_refused(await self.post({"profiles": [PROFILE, {"age": 20}]}), "Missing columns: ['ethnicity', 'convictions', 'encounters', 'gender']")
+        self.assert_refused(await self.post({"profiles": [1, 2]}), "not iterable")
+        self.assert_refused(await self.post({"profiles": {name: [value] for name, value in PROFILE.items()} | {"age": [20, 30]}}),
+                            "All columns must have the same length")
+        self.assert_refused(await self.post({"mask": 64, "profiles": [PROFILE]}), "Toggle masks go from 0 to 63")
+        self.assert_refused(await self.post({"mask": "height", "profiles": [PROFILE]}), "Unknown features ['height']")
+
+    @gen_test
+    async def test_a_bad_request_does_not_fail_its_batch(self):
+        # Both requests arrive within max_delay with the same mask, so they are scored in one batch
+        good, bad = await asyncio.gather(
+            self.post({"mask": "all", "profiles": [PROFILE]}),
+            self.post({"mask": "all", "profiles": [dict(PROFILE, age="old")]}),
+        )
+        self.assertEqual(good.code, 200)
+        self.assert_refused(bad, "old")
+        stats = json.loads((await self.http_client.fetch(self.get_url("/stats"))).body)
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["batches"], 1)
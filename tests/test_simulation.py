@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from engine.scoring import HIGH, label_flags, max_score_arrays, profile_arrays, risk_buckets, score_arrays, score_percent
+from engine.simulation import CHUNK_SIZE, DEFAULT_MASK, biased_populations, sample_population, sample_profiles, simulate_bias
+
+PARAMS = dict(nbr_profiles=300, other_share=0.4, reoffense_rate=0.3)
+
+
+# The metrics of one replication from its own arrays, one population at a time (rates as fractions, gaps in
+# percentage points)
+def replication_metrics(arrays, mask):
+    high = risk_buckets(score_percent(score_arrays(arrays, mask), max_score_arrays(arrays, mask))) == HIGH
+    is_other, innocent = arrays["is_other"], ~arrays["reoffended"]
+    return {
+        "high_risk_other": high[is_other].mean(),
+        "high_risk_swiss": high[~is_other].mean(),
+        "false_positive_gap": (high[is_other & innocent].mean() - high[~is_other & innocent].mean()) * 100,
+    }
+
+
+def test_replications_match_scoring_each_population():
+    replications = CHUNK_SIZE + 10
+    results = simulate_bias(2.0, replications, mask=DEFAULT_MASK, seed=3, **PARAMS)
+    assert all(len(values) == replications for values in results.values())
+    seeds = np.random.SeedSequence(3).spawn(2)
+    populations = [biased_populations(np.random.default_rng(seed), size, PARAMS["nbr_profiles"], 2.0, PARAMS["other_share"],
+                                      PARAMS["reoffense_rate"]) for seed, size in zip(seeds, (CHUNK_SIZE, 10))]
+    for i in (0, CHUNK_SIZE - 1, CHUNK_SIZE, replications - 1):
+        chunk, row = divmod(i, CHUNK_SIZE)
+        expected = replication_metrics({name: values[row] for name, values in populations[chunk].items()}, DEFAULT_MASK)
+        for name, value in expected.items():
+            assert results[name][i] == pytest.approx(value)
+
+
+def test_results_do_not_depend_on_the_number_of_workers():
+    single = simulate_bias(2.0, 2 * CHUNK_SIZE, seed=1, **PARAMS)
+    parallel = simulate_bias(2.0, 2 * CHUNK_SIZE, seed=1, workers=2, **PARAMS)
+    for name, values in single.items():
+        np.testing.assert_array_equal(parallel[name], values)
+
+
+def test_gap_comes_from_oversampling_only():
+    fair = simulate_bias(1.0, CHUNK_SIZE, nbr_profiles=1000)
+    biased = simulate_bias(3.0, CHUNK_SIZE, nbr_profiles=1000)
+    assert abs(np.nanmean(fair["high_risk_gap"])) < 1
+    assert np.nanmean(biased["high_risk_gap"]) > 10
+
+
+def test_profiles_are_the_simulated_arrays():
+    arrays = sample_population(2.0, 500, seed=4)
+    df = sample_profiles(2.0, 500, seed=4)
+    converted = profile_arrays(df)
+    for name in ("encounters", "convictions", "age", "is_male", "is_other"):
+        np.testing.assert_array_equal(converted[name], arrays[name])
+    np.testing.assert_array_equal(label_flags(df["ethnicity"], "Other"), arrays["is_other"])
+    np.testing.assert_array_equal(df["reoffended"].to_numpy(dtype=bool), arrays["reoffended"])
@@ -0,0 +1,58 @@
+import pytest
+
+from engine import telemetry
+from engine.telemetry import CONSENT_KEY, TELEMETRY_ENV, EventLog, aggregate, popular_configurations, read_events, record_change
+
+
+@pytest.fixture
+def event_log(tmp_path, monkeypatch):
+    log = EventLog(tmp_path, flush_seconds=3600)
+    monkeypatch.setenv(TELEMETRY_ENV, str(tmp_path))
+    monkeypatch.setattr(telemetry, "_event_log", log)
+    yield log
+    log.close()
+
+
+def test_only_changes_of_consenting_sessions_are_recorded(event_log):
+    consenting, other = {CONSENT_KEY: True}, {}
+    for mask in (3, 3, 7, 7, 3):
+        record_change(consenting, "English", "mask", mask)
+        record_change(other, "English", "mask", mask)
+    assert event_log.flush() == 3
+    events = read_events(event_log.directory).to_pylist()
+    assert [event["value"] for event in events] == ["3", "7", "3"]
+    assert len({event["session"] for event in events}) == 1
+    assert not any(key.startswith("_telemetry") for key in other)
+
+
+def test_nothing_is_recorded_without_a_directory(monkeypatch):
+    monkeypatch.delenv(TELEMETRY_ENV, raising=False)
+    monkeypatch.setattr(telemetry, "_event_log", None)
+    session_state = {CONSENT_KEY: True}
+    record_change(session_state, "English", "mask", 3)
+    assert telemetry._event_log is None
+    assert "_telemetry_mask" not in session_state
+
+
+def test_full_buffer_drops_the_oldest_events(tmp_path):
+    log = EventLog(tmp_path, capacity=2, flush_seconds=3600)
+    for value in range(5):
+        log.append("session", "English", "mask", value)
+    log.close()
+    assert [event["value"] for event in read_events(tmp_path).to_pylist()] == ["3", "4"]
+
+
+def test_aggregates_count_sessions(event_log):
+    for session, (language, masks) in enumerate([("English", (3, 7)), ("English", (3,)), ("French", (3, 63))]):
+        session_state = {CONSENT_KEY: True}
+        record_change(session_state, language, "language", language)
+        for mask in masks:
+            record_change(session_state, language, "mask", mask)
+        # Each batch is its own file, the log is read as one dataset
+        event_log.flush()
+    summary = aggregate(event_log.directory)
+    assert summary["events"] == 8 and summary["sessions"] == 3
+    masks = summary["masks"]
+    assert masks.iloc[0].to_dict() == {"language": "English", "value": "3", "sessions": 2}
+    assert len(masks) == 4
+    assert popular_configurations(event_log.directory, top=1) == [("English", 3)]
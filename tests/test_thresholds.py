@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from engine.scoring import NBR_MASKS, max_score_arrays, score_arrays, score_percent, toggle_mask
+from engine.simulation import sample_population
+from engine.thresholds import calibration_curve, threshold_sweep
+
+
+@pytest.fixture(scope="module", params=[toggle_mask(encounters=True, convictions=True), NBR_MASKS - 1])
+def population(request):
+    arrays = sample_population(2.0, 3000)
+    percent = score_percent(score_arrays(arrays, request.param), max_score_arrays(arrays, request.param))
+    groups = {"Other": arrays["is_other"], "Swiss": ~arrays["is_other"]}
+    return percent, groups, arrays["reoffended"]
+
+
+def rate(numerator, denominator):
+    return numerator / denominator if denominator else np.nan
+
+
+def test_sweep_matches_flagging_once_per_threshold(population):
+    percent, groups, labels = population
+    sweep = threshold_sweep(percent, groups, labels)
+    # Every distinct score is a cut point, plus one flagging nobody
+    assert sorted(sweep["threshold"].unique()) == sorted(np.unique(percent)) + [np.inf]
+    for row in sweep.itertuples():
+        members = groups[row.group]
+        flagged = members & (percent >= row.threshold)
+        expected = {
+            "high_risk_rate": rate(flagged.sum(), members.sum()),
+            "true_positive_rate": rate((flagged & labels).sum(), (members & labels).sum()),
+            "false_positive_rate": rate((flagged & ~labels).sum(), (members & ~labels).sum()),
+            "precision": rate((flagged & labels).sum(), flagged.sum()),
+        }
+        for name, value in expected.items():
+            np.testing.assert_allclose(getattr(row, name), value, err_msg=f"{name} at {row.threshold} for {row.group}")
+
+
+def test_calibration_matches_the_profiles_of_every_bin(population):
+    percent, groups, labels = population
+    curve = calibration_curve(percent, groups, labels, bin_width=10)
+    for row in curve.itertuples():
+        # The mean score of a bin lies inside it
+        in_bin = groups[row.group] & (np.minimum(percent // 10, 9) == min(row.mean_percent // 10, 9))
+        assert row.profiles == in_bin.sum()
+        np.testing.assert_allclose(row.mean_percent, percent[in_bin].mean())
+        np.testing.assert_allclose(row.reoffense_rate, labels[in_bin].mean())
@@ -0,0 +1,91 @@
+import io
+import zipfile
+
+import pytest
+
+from engine import upload
+from engine.upload import parse_upload
+
+HEADER = "name,age,ethnicity,convictions,encounters,gender,zip_code,reoffended\n"
+
+
+def csv_file(rows, name="profiles.csv"):
+    file = io.BytesIO((HEADER + "".join(row + "\n" for row in rows)).encode())
+    file.name = name
+    return file
+
+
+def test_valid_rows_are_converted():
+    result = parse_upload(csv_file(["Ana, 24, swiss, 1, 3, f, 3000, yes", "Ben,40,Non-Swiss,0,12,Male,,"]))
+    df = result.population
+    assert result.rejected == 0 and result.errors == []
+    assert df["name"].tolist() == ["Ana", "Ben"]
+    assert df["ethnicity"].tolist() == ["Swiss", "Other"]
+    assert df["gender"].tolist() == ["F", "M"]
+    assert df["encounters"].tolist() == [3, 12]
+    assert df["zip_code"].isna().tolist() == [False, True]
+    assert df["reoffended"].isna().tolist() == [False, True]
+
+
+def test_rejected_rows_are_described_with_their_line():
+    rows = [
+        "Ana,24,Swiss,1,3,F,3000,no",
+        "Ben,forty,Swiss,0,1,M,3000,no",
+        "Cleo,30,Martian,0,1,F,3000,no",
+        "Dan,30,Other,0,1.5,M,3000,no",
+        "Eva,30,Other,0,1,F,123,maybe",
+    ]
+    result = parse_upload(csv_file(rows))
+    assert len(result.population) == 1
+    assert result.rejected == 4
+    # The header is line 1, errors are sorted by line
+    assert result.errors == [
+        "line 3: age 'forty' is not a whole number from 0 to 120",
+        "line 4: ethnicity 'Martian' is not one of ['Other', 'Swiss']",
+        "line 5: encounters '1.5' is not a whole number from 0 to 9999",
+        "line 6: reoffended 'maybe' is not one of [False, True]",
+        "line 6: zip_code '123' is not a whole number from 1000 to 9999",
+    ]
+
+
+def test_line_numbers_continue_across_chunks(monkeypatch):
+    monkeypatch.setattr(upload, "CHUNK_ROWS", 2)
+    rows = ["A,20,Swiss,0,0,F,,"] * 5 + ["B,200,Swiss,0,0,F,,"]
+    result = parse_upload(csv_file(rows))
+    assert result.errors == ["line 7: age '200' is not a whole number from 0 to 120"]
+    assert len(result.population) == 5
+
+
+def test_only_the_first_errors_are_described(monkeypatch):
+    monkeypatch.setattr(upload, "MAX_ERRORS", 3)
+    result = parse_upload(csv_file(["A,-1,Swiss,0,0,F,,"] * 10 + ["B,20,Swiss,0,0,F,,"]))
+    assert result.rejected == 10
+    assert [error.split(":")[0] for error in result.errors] == ["line 2", "line 3", "line 4"]
+
+
+@pytest.mark.parametrize("content, name, message", [
+    (HEADER.replace("gender,", ""), "profiles.csv", "Missing columns: ['gender']"),
+    (HEADER + "A,-1,Swiss,0,0,F,,\n", "profiles.csv", "The file has no valid profiles"),
+    (HEADER, "profiles.txt", "Unsupported file type '.txt'"),
+])
+def test_unusable_files_are_refused(content, name, message):
+    file = io.BytesIO(content.encode())
+    file.name = name
+    with pytest.raises(ValueError, match=message.replace("[", r"\[").replace("(", r"\(")):
+        parse_upload(file)
+
+
+def zip_file(name="x.xlsx"):
+    file = io.BytesIO()
+    with zipfile.ZipFile(file, "w") as archive:
+        archive.writestr("profiles.csv", HEADER)
+    file.name = name
+    return file
+
+
+@pytest.mark.parametrize("file", [csv_file(["A,20,Swiss,0,0,F,,"], name="x.xlsx"), zip_file()], ids=["csv", "zip"])
+def test_files_that_are_not_workbooks_are_reported(file):
+    session_state = {}
+    upload.store_upload(session_state, file)
+    assert upload.UPLOAD_KEY not in session_state
+    assert session_state[upload.UPLOAD_ERROR_KEY].startswith("The file is not an Excel workbook")
@@ -0,0 +1,65 @@
+import logging
+
+import pytest
+
+from engine import cache as cache_module
+from engine.cache import ScoreCache, cached_cells, population_key
+from engine.scoring import NBR_MASKS
+from engine.simulation import sample_profiles
+from engine.telemetry import TELEMETRY_ENV, EventLog
+from engine.warmup import PREWARM_ENV, prewarm, prewarm_limit, prewarm_masks
+
+
+@pytest.fixture
+def profiles():
+    return sample_profiles(2.0, 20000)
+
+
+def use_cache(monkeypatch, max_bytes):
+    cache = ScoreCache(max_bytes)
+    monkeypatch.setattr(cache_module, "_shared_cache", cache)
+    return cache
+
+
+def test_masks_are_filled_once(monkeypatch, profiles, caplog):
+    cache = use_cache(monkeypatch, 64 * 2**20)
+    with caplog.at_level(logging.INFO, logger="engine.warmup"):
+        assert prewarm(profiles, masks=[3, 63, 0]) == [3, 63, 0]
+    assert all(("intervention", population_key(profiles), mask, "none") in cache for mask in (3, 63, 0))
+    assert "3 of 3 toggle masks" in caplog.text
+    assert prewarm(profiles, masks=[3, 63, 7]) == [7]
+
+
+def test_warm_up_stops_before_evicting(monkeypatch, profiles):
+    # Room for the cells and a few masks only
+    cache = use_cache(monkeypatch, 64 * 2**20)
+    cached_cells(profiles)
+    cells = cache.stats()["nbytes"]
+    prewarm(profiles, masks=[NBR_MASKS - 1])
+    cache = use_cache(monkeypatch, int(cells + 3.5 * (cache.stats()["nbytes"] - cells)))
+    filled = prewarm(profiles, masks=list(range(NBR_MASKS)))
+    assert 0 < len(filled) < NBR_MASKS
+    assert cache.stats()["evictions"] == 0
+
+
+def test_popular_masks_come_first(monkeypatch, tmp_path):
+    monkeypatch.delenv(TELEMETRY_ENV, raising=False)
+    assert prewarm_masks() == list(range(NBR_MASKS))
+    log = EventLog(tmp_path, flush_seconds=3600)
+    for session, masks in enumerate(((5, 63), (63,), (63, 2))):
+        for mask in masks:
+            log.append(str(session), "English", "mask", mask)
+    log.close()
+    monkeypatch.setenv(TELEMETRY_ENV, str(tmp_path))
+    masks = prewarm_masks()
+    assert masks[0] == 63 and sorted(masks) == list(range(NBR_MASKS))
+    assert prewarm_masks(limit=2) == masks[:2]
+
+
+@pytest.mark.parametrize("value, limit", [(None, None), ("all", None), ("0", 0), ("5", 5)])
+def test_limit_from_the_environment(monkeypatch, value, limit):
+    if value is None:
+        monkeypatch.delenv(PREWARM_ENV, raising=False)
+    else:
+        monkeypatch.setenv(PREWARM_ENV, value)
+    assert prewarm_limit() == limit
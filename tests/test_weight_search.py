@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.fairness import disparity
+from engine.scoring import DEFAULT_WEIGHTS, HIGH, Weights, max_score_arrays, profile_arrays, risk_buckets, score_arrays, score_percent, toggle_mask
+from engine.simulation import sample_profiles
+from engine.weight_search import search_weights
+
+MASK = toggle_mask(ethnicity=True, encounters=True, convictions=True, age=True)
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    return sample_profiles(2.0, 2000)
+
+
+@pytest.fixture(scope="module")
+def search(profiles):
+    return search_weights(profiles, MASK, batch_size=16, generations=3)
+
+
+def percent_with(arrays, weights):
+    return score_percent(score_arrays(arrays, MASK, weights), max_score_arrays(arrays, MASK, weights))
+
+
+def test_reported_metrics_match_a_direct_recomputation(profiles, search):
+    results, _, original = search
+    arrays = profile_arrays(profiles)
+    is_other = arrays["is_other"]
+    reference = pd.Series(percent_with(arrays, DEFAULT_WEIGHTS)).rank()
+    for row in pd.concat([results.head(10), results.tail(10)]).itertuples():
+        percent = percent_with(arrays, Weights(*(getattr(row, name) for name in Weights._fields)))
+        high = risk_buckets(percent) == HIGH
+        np.testing.assert_allclose(row.high_risk_gap, disparity(high[is_other].mean(), high[~is_other].mean())[0])
+        # Spearman's correlation: the Pearson correlation of the ranks, ties sharing their mean rank
+        ranks = pd.Series(percent).rank()
+        expected = np.corrcoef(ranks, reference)[0, 1] if ranks.nunique() > 1 else 0.0
+        np.testing.assert_allclose(row.agreement, expected, atol=1e-9)
+    assert original["agreement"] == pytest.approx(1.0)
+
+
+def test_front_is_not_dominated(search):
+    results, front, _ = search
+    assert front["high_risk_gap"].abs().is_monotonic_increasing
+    assert front["agreement"].is_monotonic_increasing
+    for row in front.itertuples():
+        better = (results["high_risk_gap"].abs() < abs(row.high_risk_gap)) & (results["agreement"] > row.agreement)
+        assert not better.any()
+
+
+def test_nothing_to_search_without_information(profiles):
+    results, front, original = search_weights(profiles, 0)
+    assert len(results) == len(front) == 1
+    assert original["high_risk_gap"] == 0